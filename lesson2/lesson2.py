@@ -5,8 +5,8 @@ import json
 
 def generate_account(nums: int):
     accounts = []
+    Account.enable_unaudited_hdwallet_features()
     for i in range(nums):
-        Account.enable_unaudited_hdwallet_features()
         account, mnemonic = Account.create_with_mnemonic()
         accounts.append([account.address, mnemonic, "0x" + account.key.hex()])
     return accounts
@@ -85,8 +85,7 @@ def send_erc20_tokens(contract_address: str, to_address: str, amount: float) ->
 
 METHOD = "0x4e71d92d"
 
-def claim_rivalz():
-    nonce = get_nonce(pub_key)
+def claim_rivalz(nonce: int):
     tx = {
         "to": contract_addres_rivalz,
         "value": 0,
@@ -100,7 +99,8 @@ def claim_rivalz():
     tx_hash = web3.eth.send_raw_transaction(singed_transaction.raw_transaction)
     return "0x"+tx_hash.hex()
 
-print(claim_rivalz())
-print(claim_rivalz())
-print(claim_rivalz())
-print(claim_rivalz())
+# nonce берем один раз из pending-счетчика и дальше увеличиваем локально,
+# иначе клеймы подряд получают одинаковый nonce
+claim_nonce = web3.eth.get_transaction_count(pub_key, 'pending')
+for i in range(4):
+    print(claim_rivalz(claim_nonce + i))
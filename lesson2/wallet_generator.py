@@ -0,0 +1,99 @@
+import base64
+import getpass
+import json
+import os
+import time
+from multiprocessing import Pool
+from typing import Iterator
+
+from Crypto.Cipher import AES
+from Crypto.Protocol.KDF import scrypt
+from eth_account import Account
+
+MAGIC = "web3_lessons-wallets-v1"
+
+
+def _init_worker() -> None:
+    Account.enable_unaudited_hdwallet_features()
+
+
+def _generate_chunk(count: int) -> list[list[str]]:
+    accounts = []
+    for _ in range(count):
+        account, mnemonic = Account.create_with_mnemonic()
+        accounts.append([account.address, mnemonic, "0x" + account.key.hex()])
+    return accounts
+
+
+def _derive_key(password: str, salt: bytes) -> bytes:
+    return scrypt(password.encode(), salt, key_len=32, N=2 ** 15, r=8, p=1)
+
+
+def _encrypt_line(key: bytes, data: bytes) -> bytes:
+    cipher = AES.new(key, AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return base64.b64encode(cipher.nonce + tag + ciphertext) + b"\n"
+
+
+def _decrypt_line(key: bytes, line: bytes) -> bytes:
+    raw = base64.b64decode(line)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=raw[:16])
+    return cipher.decrypt_and_verify(raw[32:], raw[16:32])
+
+
+def generate_accounts_to_file(nums: int, path: str, password: str, processes: int | None = None,
+                              chunk_size: int = 200, report_every: float = 5) -> int:
+    """
+    Генерирует кошельки с мнемониками в пуле процессов и по мере готовности пишет их
+    в зашифрованный JSONL-файл. Каждая строка шифруется отдельно AES-GCM ключом из пароля (scrypt),
+    поэтому в памяти держится только текущая пачка, сколько бы кошельков ни запросили.
+
+    :param nums: Количество кошельков
+    :param path: Путь к файлу
+    :param password: Пароль для шифрования файла
+    :param processes: Количество процессов, по умолчанию по числу ядер
+    :param chunk_size: Сколько кошельков генерирует процесс за одну задачу
+    :param report_every: Как часто (в секундах) печатать скорость генерации
+    :return: Количество записанных кошельков
+    """
+    salt = os.urandom(16)
+    key = _derive_key(password, salt)
+    chunks = [chunk_size] * (nums // chunk_size) + ([nums % chunk_size] if nums % chunk_size else [])
+    written = 0
+    started = last_report = time.monotonic()
+    with open(path, "wb") as file, Pool(processes, initializer=_init_worker) as pool:
+        header = {'format': MAGIC, 'salt': salt.hex(), 'fields': ['address', 'mnemonic', 'private_key']}
+        file.write(json.dumps(header).encode() + b"\n")
+        for accounts in pool.imap_unordered(_generate_chunk, chunks):
+            for account in accounts:
+                file.write(_encrypt_line(key, json.dumps(account).encode()))
+            written += len(accounts)
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"Generated {written}/{nums} wallets, {written / (now - started):.0f} wallets/s")
+    elapsed = time.monotonic() - started
+    print(f"Generated {written} wallets in {elapsed:.1f}s, {written / max(elapsed, 1e-9):.0f} wallets/s")
+    return written
+
+
+def read_accounts_file(path: str, password: str) -> Iterator[list[str]]:
+    """
+    Читает зашифрованный файл кошельков построчно.
+
+    :param path: Путь к файлу
+    :param password: Пароль, с которым файл был записан
+    :return: Генератор списков [address, mnemonic, private_key]
+    :raises ValueError: Если файл в другом формате или пароль неверный
+    """
+    with open(path, "rb") as file:
+        header = json.loads(file.readline())
+        if header.get('format') != MAGIC:
+            raise ValueError(f"{path} is not a wallets file")
+        key = _derive_key(password, bytes.fromhex(header['salt']))
+        for line in file:
+            yield json.loads(_decrypt_line(key, line.strip()))
+
+
+if __name__ == "__main__":
+    generate_accounts_to_file(1000, "wallets.jsonl.enc", getpass.getpass("Password: "))
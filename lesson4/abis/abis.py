@@ -1,12 +1,17 @@
+import json
 import os
 
 current_dir = os.path.dirname(__file__)
 file_path_erc20_abi = os.path.join(current_dir, "ERC20ABI.json")
 file_path_crosscurve_abi = os.path.join(current_dir, "CROSSCURVEABI.json")
+file_path_multicall3_abi = os.path.join(current_dir, "MULTICALL3ABI.json")
 
-# Открываем файл
+# Открываем файл и сразу разбираем JSON, чтобы web3 не парсил строку ABI при каждом создании контракта
 with open(file_path_erc20_abi, "r") as file:
-    ERC20_ABI = file.read()
+    ERC20_ABI = json.load(file)
 
 with open(file_path_crosscurve_abi, "r") as file:
-    CROSSCURVE_ABI = file.read()
+    CROSSCURVE_ABI = json.load(file)
+
+with open(file_path_multicall3_abi, "r") as file:
+    MULTICALL3_ABI = json.load(file)
@@ -0,0 +1,94 @@
+import threading
+import weakref
+
+from eth_utils import abi_to_signature, event_abi_to_log_topic, function_abi_to_4byte_selector
+from web3 import AsyncWeb3, Web3
+
+from lesson4.abis.abis import CROSSCURVE_ABI, ERC20_ABI, MULTICALL3_ABI
+
+
+class AbiRegistry:
+    def __init__(self):
+        """
+        Реестр ABI: каждый ABI разбирается один раз, селекторы функций и топики событий считаются
+        заранее, а контракты кешируются по (подключение, ABI, адрес). Создание контракта в web3
+        собирает новый класс и объекты всех функций, поэтому в циклах по кошелькам его стоит переиспользовать.
+        """
+        self._abis = {}
+        self._selectors = {}  # имя ABI -> {имя функции или сигнатура: селектор}
+        self._topics = {}  # имя ABI -> {имя события или сигнатура: топик}
+        self._contracts = weakref.WeakKeyDictionary()  # подключение -> {(имя ABI, адрес): контракт}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, abi: list[dict]) -> None:
+        """
+        Добавляет ABI в реестр.
+
+        :param name: Имя ABI, например "erc20"
+        :param abi: Разобранный ABI
+        """
+        selectors = {}
+        topics = {}
+        for item in abi:
+            if item.get('type') == 'function':
+                selector = "0x" + function_abi_to_4byte_selector(item).hex()
+                selectors[abi_to_signature(item)] = selector
+                # Для перегруженных функций по имени доступен первый вариант, остальные - по сигнатуре
+                selectors.setdefault(item['name'], selector)
+            elif item.get('type') == 'event':
+                topic = "0x" + event_abi_to_log_topic(item).hex()
+                topics[abi_to_signature(item)] = topic
+                topics.setdefault(item['name'], topic)
+        with self._lock:
+            self._abis[name] = abi
+            self._selectors[name] = selectors
+            self._topics[name] = topics
+
+    def abi(self, name: str) -> list[dict]:
+        return self._abis[name]
+
+    def selector(self, name: str, function: str) -> str:
+        """
+        :param name: Имя ABI
+        :param function: Имя функции или сигнатура, например "balanceOf" или "balanceOf(address)"
+        :return: Селектор функции в hex, например "0x70a08231"
+        """
+        return self._selectors[name][function]
+
+    def topic(self, name: str, event: str) -> str:
+        """
+        :param name: Имя ABI
+        :param event: Имя события или сигнатура, например "Transfer"
+        :return: topic0 события в hex
+        """
+        return self._topics[name][event]
+
+    def contract(self, connection: Web3 | AsyncWeb3, name: str, address: str | None = None):
+        """
+        Возвращает закешированный контракт для подключения. Контракты удаляются из кеша вместе с подключением.
+
+        :param connection: Подключение к RPC-серверу
+        :param name: Имя ABI
+        :param address: Адрес контракта. Без адреса возвращается контракт только для кодирования вызовов
+        :return: Контракт web3
+        """
+        address = Web3.to_checksum_address(address) if address is not None else None
+        key = (name, address)
+        with self._lock:
+            contracts = self._contracts.get(connection)
+            if contracts is None:
+                contracts = self._contracts[connection] = {}
+            contract = contracts.get(key)
+            if contract is None:
+                if address is None:
+                    contract = connection.eth.contract(abi=self._abis[name])
+                else:
+                    contract = connection.eth.contract(address=address, abi=self._abis[name])
+                contracts[key] = contract
+            return contract
+
+
+abi_registry = AbiRegistry()
+abi_registry.register("erc20", ERC20_ABI)
+abi_registry.register("crosscurve", CROSSCURVE_ABI)
+abi_registry.register("multicall3", MULTICALL3_ABI)
@@ -0,0 +1,79 @@
+import argparse
+import time
+from typing import Callable
+
+from web3 import Web3
+from web3.providers import JSONBaseProvider
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.erc20_calls import call_uint, encode_balance_of
+
+USDT_ARBITRUM = "0xFd086bC7CD5C481DCC9C85ebE478A1C0b69FCbb9"
+
+
+class StaticProvider(JSONBaseProvider):
+    def __init__(self, result: str = "0x" + hex(5 * 10 ** 6)[2:].rjust(64, "0")):
+        """
+        Провайдер без сети: на любой запрос отвечает одним и тем же результатом.
+        Позволяет измерить накладные расходы клиента без задержек RPC.
+        """
+        super().__init__()
+        self.result = result
+
+    def make_request(self, method, params) -> dict:
+        return {'jsonrpc': '2.0', 'id': 1, 'result': self.result}
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+def measure(name: str, function: Callable[[int], int], seconds: float) -> float:
+    """
+    Вызывает function в цикле seconds секунд.
+
+    :return: Вызовов в секунду
+    """
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        function(calls)
+        calls += 1
+    rate = calls / (time.perf_counter() - started)
+    print(f"{name:<40} {rate:>12,.0f} calls/s")
+    return rate
+
+
+def run(connection: Web3, token: str, seconds: float) -> dict:
+    wallets = [Web3.to_checksum_address(f"0x{i + 1:040x}") for i in range(1000)]
+    contract = abi_registry.contract(connection, "erc20", token)
+
+    def contract_call(i: int) -> int:
+        return contract.functions.balanceOf(wallets[i % len(wallets)]).call()
+
+    def contract_call_uncached(i: int) -> int:
+        return connection.eth.contract(address=token, abi=abi_registry.abi("erc20")).functions.balanceOf(
+            wallets[i % len(wallets)]).call()
+
+    def raw_call(i: int) -> int:
+        return call_uint(connection, token, encode_balance_of(wallets[i % len(wallets)]))
+
+    assert contract_call(0) == raw_call(0)
+    results = {
+        'contract_uncached': measure("contract per call (old route)", contract_call_uncached, seconds),
+        'contract_cached': measure("cached contract .functions.balanceOf", contract_call, seconds),
+        'raw_eth_call': measure("raw eth_call (erc20_calls.call_uint)", raw_call, seconds),
+    }
+    print(f"raw eth_call speedup: {results['raw_eth_call'] / results['contract_uncached']:.1f}x vs old route, "
+          f"{results['raw_eth_call'] / results['contract_cached']:.1f}x vs cached contract")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="balanceOf: web3 contract vs raw eth_call")
+    parser.add_argument("--rpc", help="URL RPC-сервера. Без него используется провайдер без сети")
+    parser.add_argument("--token", default=USDT_ARBITRUM, help="Адрес ERC20-токена")
+    parser.add_argument("--seconds", type=float, default=3, help="Длительность каждого замера")
+    args = parser.parse_args()
+    provider = Web3.HTTPProvider(args.rpc) if args.rpc else StaticProvider()
+    run(Web3(provider), Web3.to_checksum_address(args.token), args.seconds)
@@ -0,0 +1,426 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import decode, encode
+from web3 import Web3
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import ServerConnection, serve
+
+from lesson4.abis.registry import abi_registry
+
+SELECTOR_DECIMALS = abi_registry.selector("erc20", "decimals")
+SELECTOR_SYMBOL = abi_registry.selector("erc20", "symbol")
+SELECTOR_NAME = abi_registry.selector("erc20", "name")
+SELECTOR_BALANCE_OF = abi_registry.selector("erc20", "balanceOf")
+SELECTOR_ALLOWANCE = abi_registry.selector("erc20", "allowance")
+SELECTOR_TRY_AGGREGATE = abi_registry.selector("multicall3", "tryAggregate")
+SELECTOR_GET_ETH_BALANCE = abi_registry.selector("multicall3", "getEthBalance")
+TRANSFER_TOPIC = abi_registry.topic("erc20", "Transfer")
+APPROVAL_TOPIC = abi_registry.topic("erc20", "Approval")
+
+GAS_PRICE = 10 ** 9
+BASE_FEE = 10 ** 9
+PRIORITY_FEE = 10 ** 8
+
+
+def _uint(value: int) -> str:
+    return "0x" + hex(value)[2:].rjust(64, "0")
+
+
+def _balance(address: str) -> int:
+    """
+    Детерминированный баланс адреса, чтобы результаты можно было проверить.
+    """
+    return int(address[-8:], 16) * 10 ** 12
+
+
+class _MockServer:
+    def __init__(self, handler: type, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.counters = {'requests': 0, 'batches': 0, 'calls': 0, 'injected_errors': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def delay(self) -> None:
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            self.count('injected_errors')
+            return True
+        return False
+
+    def start(self) -> "_MockServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих RPC
+    disable_nagle_algorithm = True  # иначе ответ на keep-alive соединении ждет delayed ACK ~40 мс
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        mock = self.server.mock
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        mock.count('requests')
+        mock.delay()
+        if mock.should_fail():
+            self._reply(429, {'error': "Too Many Requests"})
+            return
+        status, body = self.handle_payload(payload)
+        self._reply(status, body)
+
+    def handle_payload(self, payload) -> tuple[int, object]:
+        raise NotImplementedError
+
+
+class _RpcHandler(_JsonHandler):
+    def handle_payload(self, payload) -> tuple[int, object]:
+        node = self.server.mock
+        if isinstance(payload, list):
+            node.count('batches')
+            if not node.batch:
+                return 200, {'jsonrpc': '2.0', 'id': None,
+                             'error': {'code': -32600, 'message': "Batch requests are not supported"}}
+            node.count('calls', len(payload))
+            return 200, [node.dispatch(request) for request in payload]
+        node.count('calls')
+        return 200, node.dispatch(payload)
+
+
+class MockNode(_MockServer):
+    def __init__(self, chain_id: int = 31337, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 batch: bool = True, head: int = 1_000_000, transactions_per_block: int = 10,
+                 logs_per_block: int = 10, max_logs: int = 10_000):
+        """
+        Локальный JSON-RPC сервер вместо ноды для бенчмарков. Отвечает на методы, которые используют
+        Client, Chain, Multicall, FeeOracle и BlockScanner, детерминированными данными. Каждый HTTP-запрос
+        (в том числе batch целиком) задерживается на latency + случайный jitter, а с вероятностью
+        error_rate отклоняется ответом 429.
+
+        :param chain_id: ID сети
+        :param latency: Задержка ответа в секундах
+        :param jitter: Максимальная случайная добавка к задержке в секундах
+        :param error_rate: Доля запросов, на которые сервер отвечает 429
+        :param batch: Поддерживает ли сервер JSON-RPC batch
+        :param head: Номер последнего блока
+        :param transactions_per_block: Сколько транзакций в каждом блоке
+        :param logs_per_block: Сколько ERC20 логов (Transfer и Approval поровну) в каждом блоке
+        :param max_logs: Сколько логов eth_getLogs отдает за запрос, при превышении отвечает ошибкой
+        """
+        super().__init__(_RpcHandler, latency, jitter, error_rate)
+        self.chain_id = chain_id
+        self.batch = batch
+        self.head = head
+        self.transactions_per_block = transactions_per_block
+        self.logs_per_block = logs_per_block
+        self.max_logs = max_logs
+        self.sent_transactions = 0
+        self._methods = {
+            'eth_chainId': lambda params: hex(self.chain_id),
+            'net_version': lambda params: str(self.chain_id),
+            'web3_clientVersion': lambda params: "MockNode/1.0",
+            'eth_blockNumber': lambda params: hex(self.head),
+            'eth_getBalance': lambda params: hex(_balance(params[0])),
+            'eth_getTransactionCount': lambda params: "0x0",
+            'eth_getCode': lambda params: "0x6080",
+            'eth_gasPrice': lambda params: hex(GAS_PRICE),
+            'eth_maxPriorityFeePerGas': lambda params: hex(PRIORITY_FEE),
+            'eth_estimateGas': lambda params: hex(21_000),
+            'eth_feeHistory': self._fee_history,
+            'eth_call': lambda params: self._call(params[0].get('to'), params[0].get('data') or params[0]['input']),
+            'eth_getBlockByNumber': lambda params: self._block(params[0], params[1]),
+            'eth_getLogs': lambda params: self._logs(params[0]),
+            'eth_sendRawTransaction': self._send_raw_transaction,
+            'eth_getTransactionByHash': lambda params: None,
+            'eth_getTransactionReceipt': lambda params: None,
+        }
+
+    def dispatch(self, request: dict) -> dict:
+        response = {'jsonrpc': '2.0', 'id': request.get('id')}
+        method = self._methods.get(request.get('method'))
+        if method is None:
+            response['error'] = {'code': -32601, 'message': f"Method {request.get('method')} not found"}
+            return response
+        try:
+            response['result'] = method(request.get('params') or [])
+        except Exception as e:
+            response['error'] = {'code': -32000, 'message': str(e)}
+        return response
+
+    def _fee_history(self, params: list) -> dict:
+        count = int(params[0], 16) if isinstance(params[0], str) else params[0]
+        return {
+            'oldestBlock': hex(self.head - count + 1),
+            'baseFeePerGas': [hex(BASE_FEE)] * (count + 1),
+            'gasUsedRatio': [0.5] * count,
+            'reward': [[hex(PRIORITY_FEE)]] * count,
+        }
+
+    def _call_result(self, to: str, data: bytes) -> bytes:
+        selector = "0x" + data[:4].hex()
+        if selector == SELECTOR_DECIMALS:
+            return encode(['uint256'], [18])
+        if selector == SELECTOR_SYMBOL:
+            return encode(['string'], ["MOCK"])
+        if selector == SELECTOR_NAME:
+            return encode(['string'], ["Mock Token"])
+        if selector == SELECTOR_BALANCE_OF:
+            return encode(['uint256'], [_balance(decode(['address'], data[4:])[0])])
+        if selector == SELECTOR_ALLOWANCE:
+            return encode(['uint256'], [0])
+        if selector == SELECTOR_GET_ETH_BALANCE:
+            return encode(['uint256'], [_balance(decode(['address'], data[4:])[0])])
+        if selector == SELECTOR_TRY_AGGREGATE:
+            _, calls = decode(['bool', '(address,bytes)[]'], data[4:])
+            return encode(['(bool,bytes)[]'], [[(True, self._call_result(target, call_data))
+                                                for target, call_data in calls]])
+        raise ValueError("execution reverted")
+
+    def _call(self, to: str, data: str) -> str:
+        return "0x" + self._call_result(to, Web3.to_bytes(hexstr=data)).hex()
+
+    def _send_raw_transaction(self, params: list) -> str:
+        with self._lock:
+            self.sent_transactions += 1
+        return Web3.to_hex(Web3.keccak(hexstr=params[0]))
+
+    def _logs(self, log_filter: dict) -> list[dict]:
+        from_block = int(log_filter.get('fromBlock', hex(self.head)), 16)
+        to_block = min(int(log_filter.get('toBlock', hex(self.head)), 16), self.head)
+        if (to_block - from_block + 1) * self.logs_per_block > self.max_logs:
+            raise ValueError(f"query returned more than {self.max_logs} results")
+        address = log_filter.get('address')
+        token = (address[0] if isinstance(address, list) else address) or "0x" + "a" * 40
+        return [{
+            'address': token.lower(),
+            'topics': [TRANSFER_TOPIC if index % 2 == 0 else APPROVAL_TOPIC, _uint(index + 1), _uint(index + 2)],
+            'data': _uint(10 ** 18),
+            'blockNumber': hex(number),
+            'transactionHash': _uint(number * 1000 + index),
+            'logIndex': hex(index),
+        } for number in range(from_block, to_block + 1) for index in range(self.logs_per_block)]
+
+    def _block(self, block_identifier: str, full_transactions: bool) -> dict | None:
+        number = self.head if block_identifier in ('latest', 'pending', 'safe', 'finalized') \
+            else int(block_identifier, 16)
+        if number > self.head:
+            return None
+        transactions = [{
+            'blockNumber': hex(number),
+            'transactionIndex': hex(index),
+            'hash': _uint(number * 1000 + index),
+            'from': "0x" + f"{index + 1:040x}",
+            'to': "0x" + f"{index + 2:040x}",
+            'value': hex(10 ** 15),
+            'gas': hex(21_000),
+            'maxFeePerGas': hex(2 * BASE_FEE + PRIORITY_FEE),
+            'maxPriorityFeePerGas': hex(PRIORITY_FEE),
+            'nonce': hex(number),
+            'type': "0x2",
+            'input': "0x",
+        } for index in range(self.transactions_per_block)]
+        return {
+            'number': hex(number),
+            'hash': _uint(number),
+            'parentHash': _uint(number - 1),
+            'timestamp': hex(1_700_000_000 + number * 12),
+            'miner': "0x" + "0" * 40,
+            'gasUsed': hex(21_000 * self.transactions_per_block),
+            'gasLimit': hex(30_000_000),
+            'baseFeePerGas': hex(BASE_FEE),
+            'transactions': transactions if full_transactions else [tx['hash'] for tx in transactions],
+        }
+
+
+class MockWsNode:
+    def __init__(self, node: MockNode):
+        """
+        WebSocket-заглушка поверх MockNode для проверки HeadSubscriber: поддерживает eth_subscribe
+        newHeads и logs, остальные методы отвечает как node. Блоки появляются только при вызове mine,
+        а drop_connections обрывает все соединения, чтобы проверить переподключение и догрузку.
+
+        :param node: HTTP-заглушка, с которой общие номер последнего блока и данные блоков
+        """
+        self.node = node
+        self.counters = {'connections': 0, 'subscriptions': 0, 'notifications': 0}
+        self._connections = {}  # соединение -> {id подписки: параметры eth_subscribe}
+        self._lock = threading.Lock()
+        self._server = serve(self._handle, "127.0.0.1", 0, compression=None)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MockWsNode", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    def _handle(self, connection: ServerConnection) -> None:
+        with self._lock:
+            self._connections[connection] = {}
+            self.counters['connections'] += 1
+        try:
+            for message in connection:
+                request = json.loads(message)
+                if request.get('method') == 'eth_subscribe':
+                    subscription_id = hex(random.getrandbits(128))
+                    with self._lock:
+                        self._connections[connection][subscription_id] = request['params']
+                        self.counters['subscriptions'] += 1
+                    response = {'jsonrpc': '2.0', 'id': request.get('id'), 'result': subscription_id}
+                elif request.get('method') == 'eth_unsubscribe':
+                    with self._lock:
+                        removed = self._connections[connection].pop(request['params'][0], None)
+                    response = {'jsonrpc': '2.0', 'id': request.get('id'), 'result': removed is not None}
+                else:
+                    response = self.node.dispatch(request)
+                connection.send(json.dumps(response))
+        except ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                self._connections.pop(connection, None)
+
+    def _notify(self, connection: ServerConnection, subscription_id: str, result: dict) -> None:
+        try:
+            connection.send(json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription',
+                                        'params': {'subscription': subscription_id, 'result': result}}))
+        except ConnectionClosed:
+            return
+        with self._lock:
+            self.counters['notifications'] += 1
+
+    def mine(self, blocks: int = 1) -> int:
+        """
+        Добавляет блоки в node и рассылает их заголовки и логи подписчикам.
+
+        :param blocks: Сколько блоков добавить
+        :return: Номер последнего блока
+        """
+        for _ in range(blocks):
+            self.node.head += 1
+            header = self.node._block(hex(self.node.head), False)
+            header.pop('transactions')
+            with self._lock:
+                connections = [(connection, dict(subscriptions))
+                               for connection, subscriptions in self._connections.items()]
+            for connection, subscriptions in connections:
+                for subscription_id, params in subscriptions.items():
+                    if params[0] == 'newHeads':
+                        self._notify(connection, subscription_id, header)
+                    elif params[0] == 'logs':
+                        log_filter = {**(params[1] if len(params) > 1 else {}),
+                                      'fromBlock': header['number'], 'toBlock': header['number']}
+                        for log in self.node._logs(log_filter):
+                            self._notify(connection, subscription_id, log)
+        return self.node.head
+
+    def drop_connections(self) -> None:
+        """
+        Закрывает все открытые соединения, как при обрыве связи с нодой.
+        """
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+
+    def start(self) -> "MockWsNode":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.drop_connections()
+        self._server.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class _ApiHandler(_JsonHandler):
+    def handle_payload(self, payload) -> tuple[int, object]:
+        routes = {
+            '/routing/scan': self.server.mock.route,
+            '/estimate': self.server.mock.estimate,
+            '/tx/create': self.server.mock.create,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            return 404, {'error': f"Unknown path {self.path}"}
+        self.server.mock.count('calls')
+        return 200, handler(payload)
+
+
+class MockCrossCurveApi(_MockServer):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        """
+        Заглушка api.crosscurve.fi: routing/scan, estimate и tx/create с фиксированными ответами
+        нужной формы. Задержка и доля ошибок настраиваются так же, как у MockNode.
+        """
+        super().__init__(_ApiHandler, latency, jitter, error_rate)
+
+    @staticmethod
+    def route(payload: dict) -> list[dict]:
+        params = payload['params']
+        return [{
+            'query': params,
+            'route': [{'chainId': params['chainIdIn'], 'tokenIn': params['tokenIn'],
+                       'tokenOut': params['tokenOut'], 'amountIn': params['amountIn']}],
+            'amountOut': params['amountIn'],
+            'slippage': payload['slippage'],
+        }]
+
+    @staticmethod
+    def estimate(route: dict) -> dict:
+        return {'executionPrice': str(10 ** 14), 'deadline': str(int(time.time()) + 600), 'route': route['route']}
+
+    @staticmethod
+    def create(payload: dict) -> dict:
+        return {
+            'to': "0xa2a786ff9148f7c88ee93372db8cbe9e94585c74",
+            'value': "0",
+            'args': [[], [], {'executionPrice': payload['estimate']['executionPrice'],
+                              'deadline': payload['estimate']['deadline'], 'v': 27,
+                              'r': _uint(1), 's': _uint(2)}],
+        }
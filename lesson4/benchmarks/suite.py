@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lesson4.benchmarks.mock_node import MockCrossCurveApi, MockNode
+from lesson4.classes.block_cache import block_cache
+from lesson4.classes.block_scanner import BlockScanner
+from lesson4.classes.chain import Chain
+from lesson4.classes.client import Client
+from lesson4.classes.token_cache import DB_PATH_ENV
+from lesson4.modules.crosscurve import logic
+
+TOKEN = "0xFd086bC7CD5C481DCC9C85ebE478A1C0b69FCbb9"
+SCENARIOS = ("balance_sweep", "nonce_pipelined_sends", "crosscurve_flow", "block_range_scan")
+
+
+class Recorder:
+    def __init__(self, name: str):
+        """
+        Собирает задержки операций сценария и считает ops/sec и перцентили.
+
+        :param name: Название сценария
+        """
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.operations = 0
+        self._lock = threading.Lock()
+        self._started = None
+        self._elapsed = None
+
+    def __enter__(self) -> "Recorder":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._elapsed = time.perf_counter() - self._started
+
+    def measure(self, function: Callable, *args, operations: int = 1):
+        """
+        Выполняет function и записывает ее задержку. Ошибка считается, но не прерывает сценарий.
+
+        :param operations: Сколько операций выполняет один вызов, например кошельков в пачке
+        :return: Результат function или None при ошибке
+        """
+        started = time.perf_counter()
+        try:
+            result = function(*args)
+            failed = False
+        except Exception:
+            result = None
+            failed = True
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(latency)
+            self.operations += operations
+            self.errors += failed
+        return result
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[int(q * (len(latencies) - 1))] * 1000, 3)
+
+        return {
+            'operations': self.operations,
+            'calls': len(latencies),
+            'errors': self.errors,
+            'seconds': round(self._elapsed, 3),
+            'ops_per_sec': round(self.operations / self._elapsed, 1) if self._elapsed else None,
+            'latency_ms': {'p50': percentile(0.50), 'p95': percentile(0.95), 'p99': percentile(0.99)},
+        }
+
+
+def balance_sweep(chain: Chain, wallets: int, batch_size: int = 100) -> dict:
+    """
+    Балансы нативной монеты и ERC20-токена для wallets кошельков через Multicall3, пачками по batch_size.
+    Операция - один кошелек, задержка - одна пачка.
+    """
+    addresses = [f"0x{i + 1:040x}" for i in range(wallets)]
+    with Recorder("balance_sweep") as recorder:
+        for start in range(0, wallets, batch_size):
+            chunk = addresses[start:start + batch_size]
+            recorder.measure(chain.multicall.get_balances, chunk, [None, TOKEN], operations=len(chunk))
+    return recorder.summary()
+
+
+def nonce_pipelined_sends(chain: Chain, wallets: int, sends_per_wallet: int, concurrency: int) -> dict:
+    """
+    Переводы нативной монеты: каждый кошелек отправляет sends_per_wallet транзакций подряд, не дожидаясь
+    включения предыдущих (nonce выдает nonce_manager). Операция - одна отправленная транзакция.
+    """
+    clients = [Client("0x" + f"{i + 1:064x}", chain) for i in range(wallets)]
+    recipient = "0x" + "f" * 40
+
+    def send(client: Client) -> str:
+        tx_hash = client.send_native(recipient, 0.0001)
+        if tx_hash is None:
+            raise RuntimeError("Transaction was not sent")
+        return tx_hash
+
+    with Recorder("nonce_pipelined_sends") as recorder:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in executor.map(lambda client: recorder.measure(send, client),
+                                  [client for client in clients for _ in range(sends_per_wallet)]):
+                pass
+    return recorder.summary()
+
+
+def crosscurve_flow(chain_in: Chain, chain_out: Chain, api_url: str, swaps: int, concurrency: int) -> dict:
+    """
+    routing/scan -> estimate -> tx/create для swaps свапов через общую keep-alive сессию.
+    Операция - полный путь одного свапа.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def flow(i: int) -> dict:
+        route = logic.get_route(chain_in, TOKEN, chain_out, TOKEN, 5 + i % 10, 0.1, session=session)
+        estimate = logic.get_estimate(route, session=session) if route is not None else None
+        transaction = logic.create_swap_transaction(
+            "0x" + f"{i + 1:040x}", route, estimate, session=session) if estimate is not None else None
+        if transaction is None:
+            raise RuntimeError("Swap flow failed")
+        return transaction
+
+    # logic берет адрес API из модульной константы, бенчмарк подменяет его на заглушку и всегда возвращает
+    original_api_url = logic.API_URL
+    try:
+        logic.API_URL = api_url
+        with Recorder("crosscurve_flow") as recorder:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for _ in executor.map(lambda i: recorder.measure(flow, i), range(swaps)):
+                    pass
+    finally:
+        logic.API_URL = original_api_url
+        session.close()
+    return recorder.summary()
+
+
+def block_range_scan(chain: Chain, blocks: int, batch_size: int, concurrency: int, head: int) -> dict:
+    """
+    Скачивание blocks блоков с полными транзакциями через BlockScanner.
+    Операция - один блок, задержка - одна пачка eth_getBlockByNumber.
+    """
+    recorder = Recorder("block_range_scan")
+
+    class TimedBlockScanner(BlockScanner):
+        def _fetch_batch(self, from_block: int, to_block: int) -> list[dict]:
+            return recorder.measure(super()._fetch_batch, from_block, to_block,
+                                    operations=to_block - from_block + 1) or []
+
+    scanner = TimedBlockScanner(chain.connection, batch_size=batch_size, concurrency=concurrency,
+                                full_transactions=True)
+    with recorder:
+        for _ in scanner.iter_blocks(head - blocks + 1, head):
+            pass
+    return recorder.summary()
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args: argparse.Namespace) -> dict:
+    # Кеш метаданных токенов пишется во временный файл, а не в ~/.cache пользователя
+    with tempfile.TemporaryDirectory(prefix="web3_lessons_benchmark_") as directory:
+        original_db_path = os.environ.get(DB_PATH_ENV)
+        os.environ[DB_PATH_ENV] = os.path.join(directory, "token_metadata.sqlite")
+        try:
+            return _run(args)
+        finally:
+            if original_db_path is None:
+                os.environ.pop(DB_PATH_ENV, None)
+            else:
+                os.environ[DB_PATH_ENV] = original_db_path
+
+
+def _run(args: argparse.Namespace) -> dict:
+    node_options = {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate}
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+        'config': {**vars(args)},
+        'scenarios': {},
+    }
+    with MockNode(batch=not args.no_batch, **node_options) as node, MockCrossCurveApi(**node_options) as api:
+        chain = Chain("benchmark", node.chain_id, node.url, "ETH", [], pool_size=args.concurrency,
+                      block_time=1, send_rate=args.send_rate)
+        chain_out = Chain("benchmark-out", node.chain_id + 1, node.url, "ETH", [], pool_size=args.concurrency,
+                          block_time=1)
+        scenarios = {
+            'balance_sweep': lambda: balance_sweep(chain, args.wallets),
+            'nonce_pipelined_sends': lambda: nonce_pipelined_sends(
+                chain, args.send_wallets, args.sends_per_wallet, args.concurrency),
+            'crosscurve_flow': lambda: crosscurve_flow(chain, chain_out, api.url, args.swaps, args.concurrency),
+            'block_range_scan': lambda: block_range_scan(chain, args.blocks, 50, 8, node.head),
+        }
+        for name in args.scenarios:
+            result = scenarios[name]()
+            report['scenarios'][name] = result
+            latency = result['latency_ms']
+            print(f"{name:<24} {result['ops_per_sec']:>10,.1f} ops/s  p50={latency['p50']}ms "
+                  f"p95={latency['p95']}ms p99={latency['p99']}ms errors={result['errors']}")
+        report['node'] = dict(node.counters)
+        report['api'] = dict(api.counters)
+        report['block_cache'] = block_cache.stats()
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнивает ops/sec с прошлым отчетом.
+
+    :param tolerance: Допустимое падение ops/sec, например 0.1 - 10%
+    :return: Сценарии, которые стали медленнее больше чем на tolerance
+    """
+    regressions = []
+    for name, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous.get('ops_per_sec') or result['ops_per_sec'] is None:
+            continue
+        change = result['ops_per_sec'] / previous['ops_per_sec'] - 1
+        print(f"{name:<24} {change:+.1%} vs {baseline.get('commit')}")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки Client, Chain и CrossCurve на локальной заглушке ноды")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.005, help="Задержка ответа заглушки в секундах")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Случайная добавка к задержке в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов, отклоняемых с 429")
+    parser.add_argument("--no-batch", action="store_true", help="Заглушка не поддерживает JSON-RPC batch")
+    parser.add_argument("--concurrency", type=int, default=16, help="Потоков в сценариях отправки и свапов")
+    parser.add_argument("--wallets", type=int, default=1000, help="Кошельков в balance_sweep")
+    parser.add_argument("--send-wallets", type=int, default=20, help="Кошельков в nonce_pipelined_sends")
+    parser.add_argument("--sends-per-wallet", type=int, default=10, help="Транзакций на кошелек")
+    parser.add_argument("--send-rate", type=float, default=1000, help="Лимит отправок в секунду на RPC")
+    parser.add_argument("--swaps", type=int, default=200, help="Свапов в crosscurve_flow")
+    parser.add_argument("--blocks", type=int, default=2000, help="Блоков в block_range_scan")
+    parser.add_argument("--output", help="Файл для JSON-отчета. Без него отчет печатается в stdout")
+    parser.add_argument("--baseline", help="JSON-отчет прошлой версии для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое падение ops/sec")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Regressions: {', '.join(regressions)}")
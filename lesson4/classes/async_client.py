@@ -0,0 +1,323 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable
+
+from eth_account import Account
+from web3 import AsyncWeb3, Web3
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.chain import Chain, get_chain_by_rpc
+from lesson4.classes.erc20_calls import call_uint_async, encode_allowance, encode_balance_of
+from lesson4.classes.nonce_manager import nonce_manager
+from lesson4.classes.signing_pool import SignedTransaction
+from lesson4.classes.token_cache import token_cache
+
+
+class AsyncClient:
+    def __init__(self, private_key: str, rpc: str | Chain, address: str | None = None):
+        """"
+        Асинхронная версия Client. Все клиенты одной сети используют общее асинхронное подключение,
+        поэтому тысячи кошельков можно обслуживать в одном event loop.
+
+        :param private_key: Приватный ключ в 16 ричном формате
+        :param rpc: Сеть из реестра или URL RPC-сервера
+        :param address: Адрес кошелька, если уже известен. Тогда аккаунт создается только при подписи
+        :raises ValueError: Если URL не является основным RPC сети из реестра
+        """
+        self.private_key = private_key
+        self.chain = rpc if isinstance(rpc, Chain) else get_chain_by_rpc(rpc)
+        if self.chain is None:
+            raise ValueError(f"RPC {rpc} is not registered in chains")
+        self._account = None
+        self.public_key = Web3.to_checksum_address(address) if address is not None else self.account.address
+        self.chain_id = self.chain.id
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление клиента.
+        """
+        return (
+            f"AsyncClient(\n"
+            f" public_key={self.public_key},\n"
+            f" private_key={self.private_key}\n"
+            f" rpc = {self.rpc}\n"
+            f" chain_id = {self.chain_id}\n"
+            f")"
+        )
+
+    @property
+    def rpc(self) -> str:
+        """
+        URL текущего RPC-сервера.
+        """
+        return self.chain.rpc
+
+    @property
+    def account(self):
+        """
+        Аккаунт eth_account для подписи. Создается при первом обращении.
+        """
+        if self._account is None:
+            self._account = Account.from_key(self.private_key)
+        return self._account
+
+    @property
+    def connection(self) -> AsyncWeb3:
+        """
+        Асинхронное подключение к RPC, общее для всех клиентов сети.
+        """
+        return self.chain.async_connection
+
+    async def _get_decimals(self, token_address: str) -> int:
+        """
+        Получает decimals токена из кеша, при промахе читает их из сети и сохраняет в кеш.
+
+        :param token_address: Адрес ERC20-токена
+        :return: decimals токена
+        """
+        return await token_cache.get_decimals_async(self.chain_id, token_address, self.connection)
+
+    async def get_nonce(self, address: str = None) -> int | None:
+        """
+        Получает nonce аккаунта
+
+        :param address: адрес для проверки nonce. Если не указан, берется аккаунт текущего клиента
+        :return: nonce аккаунта
+        """
+        if address is None:
+            address = self.public_key
+        try:
+            return await self.connection.eth.get_transaction_count(Web3.to_checksum_address(address))
+        except Exception as e:
+            print(f"Error occurred while getting nonce for address {address}: {e}")
+            return None
+
+    async def get_native_balance(self, address: str = None) -> float | None:
+        """
+        Получает баланс аккаунта в нативной монете
+
+        :param address: адрес для проверки баланса. Если не указан, берется аккаунт текущего клиента
+        :return: Баланс аккаунта в единице измерения ether
+        """
+        if address is None:
+            address = self.public_key
+        try:
+            balance_wei = await self.connection.eth.get_balance(Web3.to_checksum_address(address))
+            return Web3.from_wei(balance_wei, 'ether')
+        except Exception as e:
+            print(f"Error occurred while getting native balance for address {address}: {e}")
+            return None
+
+    async def send_transaction(self, transaction: dict) -> str | None:
+        """
+        Подписывает и отправляет транзакцию в сеть, возвращая её хеш.
+        Если nonce не указан, он выдается локальным nonce_manager без запроса к RPC.
+        Отправка идет через общий Broadcaster сети, как у Client: с лимитом частоты и повторами.
+
+        :param transaction: Словарь с данными транзакции.
+        :return: Хеш отправленной транзакции или ничего
+        """
+        nonce = None
+        try:
+            if 'nonce' not in transaction:
+                nonce = await nonce_manager.allocate_async(self.chain_id, self.public_key, self.connection)
+                transaction = {**transaction, 'nonce': nonce}
+            signed_transaction = self.account.sign_transaction(transaction)
+            signed = SignedTransaction(self.public_key, nonce, "0x" + signed_transaction.raw_transaction.hex(),
+                                       "0x" + signed_transaction.hash.hex(), None)
+            # Broadcaster сам возвращает nonce в nonce_manager при ошибке
+            nonce = None
+            result = await self.chain.broadcaster.submit_async(signed)
+            if result['error'] is not None:
+                raise RuntimeError(result['error'])
+            return result['tx_hash']
+        except Exception as e:
+            if nonce is not None:
+                nonce_manager.handle_error(self.chain_id, self.public_key, nonce, e)
+            print(f"Error occurred while sending transaction: {e}")
+            return None
+
+    async def wait_for_transaction(self, tx_hash: str, timeout: float = 300) -> dict | None:
+        """
+        Ждет подтверждения транзакции через общий для сети трекер квитанций, не блокируя event loop
+
+        :param tx_hash: Хеш транзакции
+        :param timeout: Сколько секунд ждать
+        :return: Словарь {'tx_hash', 'status', 'block_number', 'gas_used', 'effective_gas_price'} или None
+        """
+        try:
+            return await asyncio.wrap_future(self.chain.receipt_tracker.track(tx_hash, timeout=timeout))
+        except Exception as e:
+            print(f"Error occurred while waiting for transaction {tx_hash}: {e}")
+            return None
+
+    async def send_native(self, to_address: str, amount: float) -> str | None:
+        """
+        Отправляет нативные средства на кошелек "to_address" в количестве "amount"
+
+        :param to_address: Адрес получателя
+        :param amount: Количество отправляемых нативных средств
+        :return: Хеш транзакции или ничего
+        """
+        try:
+            tx = {
+                'to': Web3.to_checksum_address(to_address),
+                'value': Web3.to_wei(amount, 'ether'),
+                'chainId': self.chain_id,
+                **await self.chain.fee_oracle.get_fees_async(self.connection),
+            }
+            tx['gas'] = await self.connection.eth.estimate_gas(tx)
+            return await self.send_transaction(tx)
+        except Exception as e:
+            print(f"Error occurred while preparing transaction: {e}")
+            return None
+
+    async def get_erc20_balance(self, erc20_address: str, account_address: str = None) -> float | None:
+        """
+        Получает баланс ERC20-токена для указанного аккаунта
+
+        :param erc20_address: Адрес ERC20-токена
+        :param account_address: Адрес для проверки баланса. Если не указан, берется аккаунт текущего клиента
+        :return: Баланс ERC20-токена для указанного аккаунта
+        """
+        if account_address is None:
+            account_address = self.public_key
+        try:
+            balance_wei, decimals = await asyncio.gather(
+                call_uint_async(self.connection, erc20_address, encode_balance_of(account_address)),
+                self._get_decimals(erc20_address))
+            return balance_wei / (10 ** decimals)
+        except Exception as e:
+            print(f"Error occurred while getting ERC20 balance for address {account_address}: {e}")
+            return None
+
+    async def _build_erc20_transaction(self, token_address: str, function_name: str, target_address: str,
+                                       amount: float | None) -> dict:
+        """
+        Собирает транзакцию transfer/approve для ERC20-токена.
+
+        :param token_address: Адрес ERC20-токена
+        :param function_name: transfer или approve
+        :param target_address: Получатель или spender
+        :param amount: Количество токенов, None означает максимальное значение uint256
+        :return: Неподписанная транзакция
+        """
+        contract = abi_registry.contract(self.connection, "erc20", token_address)
+        if amount is None:
+            scaled_amount = 2 ** 256 - 1
+        else:
+            scaled_amount = int(amount * (10 ** await self._get_decimals(token_address)))
+        function = getattr(contract.functions, function_name)(Web3.to_checksum_address(target_address), scaled_amount)
+        fees, estimate_gas = await asyncio.gather(
+            self.chain.fee_oracle.get_fees_async(self.connection), function.estimate_gas({'from': self.public_key}))
+        return await function.build_transaction({
+            'from': self.public_key,
+            'gas': estimate_gas,
+            **fees,
+            'chainId': self.chain_id,
+        })
+
+    async def send_erc20_tokens(self, erc20_address: str, to_address: str, amount: float) -> str | None:
+        """
+        Отправляет ERC20-токены на указанный адрес
+
+        :param erc20_address: Адрес ERC20-токена
+        :param to_address: Адрес получателя
+        :param amount: Количество отправляемых ERC20-токенов
+        :return: Хеш транзакции или ничего
+        """
+        try:
+            transaction = await self._build_erc20_transaction(erc20_address, "transfer", to_address, amount)
+            return await self.send_transaction(transaction)
+        except Exception as e:
+            print(f"Error occurred while sending ERC20 tokens: {e}")
+            return None
+
+    async def approve(self, token_address: str, spender_address: str, amount: float) -> str | None:
+        """
+        Применить approve для ERC20-токена
+
+        :param token_address: Адрес ERC20-токена
+        :param spender_address: Адрес смарт контракта которому можно тратить токены
+        :param amount: Количество ERC20-токенов которые можно списать
+        :return: Хеш транзакции или ничего
+        """
+        try:
+            transaction = await self._build_erc20_transaction(token_address, "approve", spender_address, amount)
+            return await self.send_transaction(transaction)
+        except Exception as e:
+            print(f"Error occurred while approving ERC20 tokens: {e}")
+            return None
+
+    async def permit_approve(self, token_address: str, spender_address: str) -> str | None:
+        """
+        Применить permit approve для ERC20-токена
+
+        :param token_address: Адрес ERC20-токена
+        :param spender_address: Адрес смарт контракта которому можно тратить токены
+        :return: Хеш транзакции или ничего
+        """
+        try:
+            transaction = await self._build_erc20_transaction(token_address, "approve", spender_address, None)
+            return await self.send_transaction(transaction)
+        except Exception as e:
+            print(f"Error occurred while approving ERC20 tokens: {e}")
+            return None
+
+    async def get_allowance(self, token_address: str, spender_address: str) -> float | None:
+        """
+        Получить лимит approve ERC20-токена для определенного контракта
+
+        :param token_address: Адрес ERC20-токена
+        :param spender_address: Адрес смарт контракта которому можно тратить токены
+        :return: Остаток approve или None
+        """
+        try:
+            allowance, decimals = await asyncio.gather(
+                call_uint_async(self.connection, token_address, encode_allowance(self.public_key, spender_address)),
+                self._get_decimals(token_address))
+            return allowance / (10 ** decimals)
+        except Exception as e:
+            print(f"Error occurred while getting allowance: {e}")
+            return None
+
+
+async def run_bounded(worker: Callable[[Any], Awaitable[Any]], items: Iterable[Any],
+                      concurrency: int = 200) -> list[Any]:
+    """
+    Выполняет worker для каждого элемента, держа в работе не больше concurrency корутин одновременно.
+    Элементы забираются из итератора по мере освобождения воркеров, поэтому генератор не разворачивается
+    заранее и одновременно создано не больше concurrency корутин. Результаты копятся в памяти до конца.
+
+    :param worker: Асинхронная функция, принимающая один элемент
+    :param items: Элементы (например клиенты), можно передать генератор
+    :param concurrency: Максимальное количество одновременных вызовов
+    :return: Результаты в порядке элементов. Исключение воркера попадает в результат вместо значения
+    """
+    results = {}
+    iterator = enumerate(items)
+
+    async def consume() -> None:
+        for index, item in iterator:
+            try:
+                results[index] = await worker(item)
+            except Exception as e:
+                results[index] = e
+
+    await asyncio.gather(*(consume() for _ in range(concurrency)))
+    return [results[index] for index in range(len(results))]
+
+
+def run_for_clients(clients: Iterable[AsyncClient], method_name: str, *args, concurrency: int = 200,
+                    **kwargs) -> list[Any]:
+    """
+    Синхронная обертка: вызывает метод AsyncClient у всех клиентов в одном event loop.
+
+    :param clients: Клиенты
+    :param method_name: Имя метода, например "get_native_balance"
+    :param concurrency: Максимальное количество одновременных вызовов
+    :return: Результаты в порядке клиентов
+    """
+    async def worker(client: AsyncClient) -> Any:
+        return await getattr(client, method_name)(*args, **kwargs)
+
+    return asyncio.run(run_bounded(worker, clients, concurrency))
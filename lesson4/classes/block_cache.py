@@ -0,0 +1,401 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+
+# Методы, ответ которых определяется только параметрами и блоком, и позиция тега блока в параметрах
+CACHEABLE_METHODS = {
+    'eth_call': 1,
+    'eth_getBalance': 1,
+    'eth_getTransactionCount': 1,
+    'eth_getCode': 1,
+    'eth_getStorageAt': 2,
+}
+ENTRY_OVERHEAD = 200  # Примерный размер служебных объектов одной записи в байтах
+# Сколько секунд номер блока без обновлений считается текущим в сетях с очень коротким блоком:
+# иначе на arbitrum кеш запрашивал бы eth_blockNumber каждые 250 мс
+MIN_HEAD_AGE = 1.0
+
+
+class BlockCache:
+    def __init__(self, max_items: int = 50_000, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Кеш чтений состояния в пределах блока: eth_call, eth_getBalance, eth_getTransactionCount,
+        eth_getCode и eth_getStorageAt с одинаковыми параметрами в одном блоке всегда возвращают одно
+        и то же. Ключ - (ID сети, номер блока, метод, параметры), тег 'latest' заменяется номером
+        текущего блока. Когда сеть переходит на новый блок, записи старых блоков удаляются.
+        Запросы с тегами 'pending', 'safe', 'finalized' и ответы с ошибкой не кешируются.
+
+        Номер текущего блока кеш узнает из подписки Chain.heads, из проходящих через него ответов
+        eth_blockNumber и квитанций, а если ни того, ни другого не было дольше времени блока
+        (но не меньше MIN_HEAD_AGE) - запрашивает eth_blockNumber сам, одним запросом на блок.
+
+        :param max_items: Максимальное количество записей
+        :param max_bytes: Примерный предел занимаемой памяти
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # ключ -> (результат, размер)
+        self._blocks = {}  # (ID сети, номер блока) -> ключи записей этого блока
+        self._heads = {}  # ID сети -> [номер блока, хеш блока, когда узнали]
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'head_lookups': 0, 'evictions': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def wrap(self, provider: JSONBaseProvider, chain_id: int, block_time: float) -> "CachingProvider":
+        """
+        Оборачивает провайдер, чтобы чтения состояния шли через кеш.
+
+        :param provider: Провайдер web3
+        :param chain_id: ID сети провайдера
+        :param block_time: Среднее время блока, столько (но не меньше MIN_HEAD_AGE) номер блока
+            без обновлений считается текущим
+        :return: Провайдер для Web3(...)
+        """
+        if isinstance(provider, CachingProvider):
+            return provider
+        return CachingProvider(provider, self, chain_id, block_time)
+
+    def wrap_async(self, provider: AsyncJSONBaseProvider, chain_id: int,
+                   block_time: float) -> "AsyncCachingProvider":
+        """
+        Асинхронная версия wrap для AsyncWeb3.
+        """
+        if isinstance(provider, AsyncCachingProvider):
+            return provider
+        return AsyncCachingProvider(provider, self, chain_id, block_time)
+
+    def on_new_head(self, chain_id: int, block_number: int, block_hash: str | None = None) -> None:
+        """
+        Сообщает кешу номер текущего блока сети. При переходе на новый блок удаляются записи
+        предыдущих блоков, при реорганизации - записи отмененных блоков.
+
+        :param chain_id: ID сети
+        :param block_number: Номер нового блока
+        :param block_hash: Хеш нового блока, если известен
+        """
+        with self._lock:
+            head = self._heads.get(chain_id)
+            if head is not None and block_number == head[0] and block_hash in (None, head[1]):
+                head[2] = time.monotonic()
+                return
+            if head is not None and block_number < head[0] and block_hash is None:
+                return  # Ответ отстающего RPC-сервера, а не реорганизация
+            if head is not None and block_number > head[0]:
+                self._invalidate(chain_id, lambda number: number < block_number)
+            elif head is not None and (head[1] is not None or block_number < head[0]):
+                # Реорганизация: блок с этим номером или более новые больше не в цепочке
+                self._invalidate(chain_id, lambda number: number >= block_number)
+            self._heads[chain_id] = [block_number, block_hash, time.monotonic()]
+
+    def current_block(self, chain_id: int, max_age: float) -> int | None:
+        """
+        :return: Номер текущего блока сети или None, если он неизвестен или узнан дольше max_age секунд назад
+        """
+        with self._lock:
+            head = self._heads.get(chain_id)
+        if head is None or time.monotonic() - head[2] > max_age:
+            return None
+        return head[0]
+
+    def key(self, chain_id: int, method: str, params: Any, head: int | None) -> tuple | None:
+        """
+        Строит ключ записи для запроса.
+
+        :param head: Номер текущего блока, нужен для тега 'latest'
+        :return: Ключ или None, если запрос нельзя кешировать
+        """
+        position = CACHEABLE_METHODS.get(method)
+        if position is None:
+            return None
+        if not isinstance(params, (list, tuple)) or len(params) > position + 1:
+            self.count('bypassed')
+            return None
+        block = params[position] if len(params) > position else 'latest'
+        if block == 'latest':
+            block = head
+        elif isinstance(block, str) and block.startswith("0x"):
+            block = int(block, 16)
+        elif not isinstance(block, int) or isinstance(block, bool):
+            block = None
+        if block is None:
+            self.count('bypassed')
+            return None
+        return chain_id, block, method, json.dumps(params[:position], sort_keys=True, default=str).lower()
+
+    @staticmethod
+    def needs_head(method: str, params: Any) -> bool:
+        position = CACHEABLE_METHODS.get(method)
+        if position is None or not isinstance(params, (list, tuple)) or len(params) > position + 1:
+            return False
+        return len(params) <= position or params[position] == 'latest'
+
+    def lookup(self, key: tuple | None) -> tuple[bool, Any]:
+        """
+        :return: (найдено ли, результат)
+        """
+        if key is None:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[0]
+
+    def store(self, key: tuple | None, result: Any) -> None:
+        if key is None:
+            return
+        size = ENTRY_OVERHEAD + len(key[3]) + (len(result) if isinstance(result, str) else len(json.dumps(result)))
+        with self._lock:
+            head = self._heads.get(key[0])
+            if head is not None and key[1] < head[0]:
+                return  # Пока шел запрос, сеть ушла на новый блок
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            self._blocks.setdefault(key[:2], set()).add(key)
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+                block_keys = self._blocks[evicted_key[:2]]
+                block_keys.discard(evicted_key)
+                if not block_keys:
+                    del self._blocks[evicted_key[:2]]
+
+    def observe(self, chain_id: int, method: str, result: Any) -> None:
+        """
+        Узнает номер блока из ответов, которые и так проходят через провайдер: eth_blockNumber и квитанций.
+        Поэтому после ожидания квитанции транзакции чтения идут уже в блоке с этой транзакцией.
+        """
+        if method == 'eth_blockNumber' and isinstance(result, str):
+            self.on_new_head(chain_id, int(result, 16))
+        elif method == 'eth_getTransactionReceipt' and isinstance(result, dict) and result.get('blockNumber'):
+            block_number = int(result['blockNumber'], 16)
+            head = self.current_block(chain_id, float("inf"))
+            if head is None or block_number > head:
+                self.on_new_head(chain_id, block_number)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _invalidate(self, chain_id: int, condition) -> None:
+        """
+        Удаляет записи блоков сети, номер которых удовлетворяет condition. Вызывается под self._lock.
+        """
+        for block in [block for block in self._blocks if block[0] == chain_id and condition(block[1])]:
+            for key in self._blocks.pop(block):
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+                    self._stats['invalidations'] += 1
+
+    def stats(self) -> dict:
+        """
+        :return: {'hits', 'misses', 'bypassed', 'head_lookups', 'evictions', 'invalidations', 'hit_rate',
+            'saved_requests', 'items', 'bytes'}. saved_requests - сколько запросов к RPC сэкономлено
+            с учетом запросов eth_blockNumber, которые сделал сам кеш
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['items'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['saved_requests'] = stats['hits'] - stats['head_lookups']
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = OrderedDict()
+            self._blocks = {}
+            self._heads = {}
+            self._bytes = 0
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+def _response(result: Any) -> dict:
+    return {'jsonrpc': '2.0', 'id': 0, 'result': result}
+
+
+def _lookup_batch(cache: BlockCache, chain_id: int, batch_requests, head: int | None) -> tuple[list, list, list]:
+    """
+    Ищет ответы пакета в кеше.
+
+    :return: (ответы с None на месте промахов, ключи запросов, индексы промахов)
+    """
+    responses = [None] * len(batch_requests)
+    keys = [None] * len(batch_requests)
+    missing = []
+    for index, (method, params) in enumerate(batch_requests):
+        keys[index] = cache.key(chain_id, method, params, head)
+        found, result = cache.lookup(keys[index])
+        if found:
+            responses[index] = _response(result)
+        else:
+            missing.append(index)
+    return responses, keys, missing
+
+
+def _merge_batch(cache: BlockCache, chain_id: int, batch_requests, responses: list, keys: list, missing: list,
+                 fetched: list[dict] | dict) -> list[dict] | dict:
+    """
+    Подставляет ответы RPC на место промахов и сохраняет их в кеш.
+    """
+    if not isinstance(fetched, list) or len(fetched) != len(missing):
+        return fetched
+    for index, response in zip(missing, fetched):
+        responses[index] = response
+        if isinstance(response, dict) and 'error' not in response:
+            cache.store(keys[index], response.get('result'))
+            cache.observe(chain_id, batch_requests[index][0], response.get('result'))
+    return responses
+
+
+class CachingProvider(JSONBaseProvider):
+    def __init__(self, provider: JSONBaseProvider, cache: BlockCache, chain_id: int, block_time: float,
+                 **kwargs: Any):
+        """
+        Провайдер-обертка: отвечает на чтения состояния из BlockCache, остальное передает во вложенный провайдер.
+
+        :param provider: Вложенный провайдер
+        :param cache: Кеш чтений
+        :param chain_id: ID сети провайдера
+        :param block_time: Среднее время блока сети
+        """
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.cache = cache
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self._head_lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"Cached {self.provider}"
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def _head(self) -> int | None:
+        """
+        Номер текущего блока. Если он устарел, eth_blockNumber запрашивает только один поток,
+        остальные ждут его ответа, а не отправляют свои запросы.
+        """
+        max_age = max(self.block_time, MIN_HEAD_AGE)
+        head = self.cache.current_block(self.chain_id, max_age)
+        if head is not None:
+            return head
+        with self._head_lock:
+            head = self.cache.current_block(self.chain_id, max_age)
+            if head is None:
+                self.cache.count('head_lookups')
+                response = self.provider.make_request('eth_blockNumber', [])
+                if 'result' in response:
+                    head = int(response['result'], 16)
+                    self.cache.on_new_head(self.chain_id, head)
+        return head
+
+    def make_request(self, method, params) -> dict:
+        head = self._head() if self.cache.needs_head(method, params) else None
+        key = self.cache.key(self.chain_id, method, params, head)
+        found, result = self.cache.lookup(key)
+        if found:
+            return _response(result)
+        response = self.provider.make_request(method, params)
+        if isinstance(response, dict) and 'error' not in response:
+            self.cache.store(key, response.get('result'))
+            self.cache.observe(self.chain_id, method, response.get('result'))
+        return response
+
+    def make_batch_request(self, batch_requests) -> list[dict] | dict:
+        head = self._head() if any(self.cache.needs_head(*request) for request in batch_requests) else None
+        responses, keys, missing = _lookup_batch(self.cache, self.chain_id, batch_requests, head)
+        if not missing:
+            return responses
+        fetched = self.provider.make_batch_request([batch_requests[index] for index in missing])
+        return _merge_batch(self.cache, self.chain_id, batch_requests, responses, keys, missing, fetched)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return self.provider.is_connected(show_traceback)
+
+
+class AsyncCachingProvider(AsyncJSONBaseProvider):
+    def __init__(self, provider: AsyncJSONBaseProvider, cache: BlockCache, chain_id: int, block_time: float,
+                 **kwargs: Any):
+        """
+        Асинхронная версия CachingProvider.
+        """
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.cache = cache
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self._head_task = None  # Идущий запрос eth_blockNumber, его ждут все корутины
+
+    def __str__(self) -> str:
+        return f"Cached {self.provider}"
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    async def _head(self) -> int | None:
+        """
+        Номер текущего блока. Если он устарел, все корутины ждут один общий запрос eth_blockNumber.
+        """
+        head = self.cache.current_block(self.chain_id, max(self.block_time, MIN_HEAD_AGE))
+        if head is not None:
+            return head
+        task = self._head_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._head_task = asyncio.ensure_future(self._lookup_head())
+        return await asyncio.shield(task)
+
+    async def _lookup_head(self) -> int | None:
+        self.cache.count('head_lookups')
+        response = await self.provider.make_request('eth_blockNumber', [])
+        if 'result' not in response:
+            return None
+        head = int(response['result'], 16)
+        self.cache.on_new_head(self.chain_id, head)
+        return head
+
+    async def make_request(self, method, params) -> dict:
+        head = await self._head() if self.cache.needs_head(method, params) else None
+        key = self.cache.key(self.chain_id, method, params, head)
+        found, result = self.cache.lookup(key)
+        if found:
+            return _response(result)
+        response = await self.provider.make_request(method, params)
+        if isinstance(response, dict) and 'error' not in response:
+            self.cache.store(key, response.get('result'))
+            self.cache.observe(self.chain_id, method, response.get('result'))
+        return response
+
+    async def make_batch_request(self, batch_requests) -> list[dict] | dict:
+        head = await self._head() if any(self.cache.needs_head(*request) for request in batch_requests) else None
+        responses, keys, missing = _lookup_batch(self.cache, self.chain_id, batch_requests, head)
+        if not missing:
+            return responses
+        fetched = await self.provider.make_batch_request([batch_requests[index] for index in missing])
+        return _merge_batch(self.cache, self.chain_id, batch_requests, responses, keys, missing, fetched)
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return await self.provider.is_connected(show_traceback)
+
+
+block_cache = BlockCache()
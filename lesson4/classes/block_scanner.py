@@ -0,0 +1,215 @@
+import csv
+import gzip
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from web3 import Web3
+
+from lesson4.classes.rpc_batch import RpcBatch
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+BLOCK_COLUMNS = ['number', 'hash', 'parent_hash', 'timestamp', 'miner', 'gas_used', 'gas_limit',
+                 'base_fee_per_gas', 'transaction_count']
+TRANSACTION_COLUMNS = ['block_number', 'block_timestamp', 'transaction_index', 'hash', 'from', 'to', 'value',
+                       'gas', 'gas_price', 'max_fee_per_gas', 'max_priority_fee_per_gas', 'nonce', 'type',
+                       'input_size']
+
+
+class BlockScanner:
+    def __init__(self, connection: Web3, batch_size: int = 50, concurrency: int = 8,
+                 full_transactions: bool = False):
+        """
+        Скачивает диапазоны блоков пачками eth_getBlockByNumber в JSON-RPC batch, несколько пачек
+        параллельно. Блоки отдаются по порядку, а в памяти одновременно находится не больше
+        batch_size * concurrency блоков, каким бы большим ни был диапазон.
+
+        :param connection: Подключение к RPC-серверу
+        :param batch_size: Сколько блоков запрашивается одним batch
+        :param concurrency: Сколько batch выполняется одновременно
+        :param full_transactions: Запрашивать ли блоки с полными транзакциями, а не только хешами
+        """
+        self.connection = connection
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.full_transactions = full_transactions
+
+    def _fetch_batch(self, from_block: int, to_block: int) -> list[dict]:
+        batch = RpcBatch(self.connection, max_batch_size=self.batch_size)
+        items = [batch.add("eth_getBlockByNumber", [hex(number), self.full_transactions])
+                 for number in range(from_block, to_block + 1)]
+        batch.execute()
+        blocks = []
+        for number, item in zip(range(from_block, to_block + 1), items):
+            if item.error is not None:
+                raise RuntimeError(f"Failed to get block {number}: {item.error}")
+            if item.result is None:
+                raise RuntimeError(f"Block {number} not found")
+            blocks.append(item.result)
+        return blocks
+
+    def iter_blocks(self, from_block: int, to_block: int) -> Iterator[dict]:
+        """
+        Отдает сырые блоки JSON-RPC по порядку номеров.
+
+        :param from_block: Первый блок диапазона
+        :param to_block: Последний блок диапазона (включительно)
+        :return: Генератор блоков
+        """
+        ranges = ((start, min(start + self.batch_size - 1, to_block))
+                  for start in range(from_block, to_block + 1, self.batch_size))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="block-scanner") as executor:
+            in_flight = deque()
+            for start, end in ranges:
+                in_flight.append(executor.submit(self._fetch_batch, start, end))
+                if len(in_flight) >= self.concurrency:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    def iter_rows(self, from_block: int, to_block: int) -> Iterator[tuple[int, list[dict]]]:
+        """
+        Превращает блоки в строки таблицы: по строке на блок или, при full_transactions,
+        по строке на транзакцию.
+
+        :return: Генератор пар (номер блока, строки этого блока)
+        """
+        for block in self.iter_blocks(from_block, to_block):
+            number = int(block['number'], 16)
+            if self.full_transactions:
+                yield number, [_transaction_row(block, tx) for tx in block['transactions']]
+            else:
+                yield number, [_block_row(block)]
+
+    @property
+    def columns(self) -> list[str]:
+        return TRANSACTION_COLUMNS if self.full_transactions else BLOCK_COLUMNS
+
+    def export(self, from_block: int, to_block: int, directory: str, file_format: str = 'parquet',
+               rows_per_file: int = 100_000, cursor_path: str | None = None) -> int:
+        """
+        Выгружает диапазон блоков в файлы-куски в directory. После записи каждого куска сохраняет
+        курсор, поэтому прерванную выгрузку можно продолжить тем же вызовом.
+
+        :param from_block: Первый блок диапазона
+        :param to_block: Последний блок диапазона (включительно)
+        :param directory: Папка для файлов
+        :param file_format: 'parquet' (нужен pyarrow) или 'csv' (csv.gz)
+        :param rows_per_file: Примерное количество строк в одном файле. Блок не делится между файлами
+        :param cursor_path: Файл курсора, по умолчанию directory/cursor.json
+        :return: Количество записанных строк
+        """
+        if file_format == 'parquet' and pyarrow is None:
+            raise RuntimeError("pyarrow is not installed, use file_format='csv'")
+        if file_format not in ('parquet', 'csv'):
+            raise ValueError(f"Unknown file format {file_format}")
+        os.makedirs(directory, exist_ok=True)
+        cursor_path = cursor_path or os.path.join(directory, "cursor.json")
+        cursor = _read_cursor(cursor_path)
+        start = max(from_block, cursor) if cursor is not None else from_block
+        if start > to_block:
+            print(f"Blocks {from_block}-{to_block} are already exported")
+            return 0
+
+        written = 0
+        rows = []
+        chunk_start = start
+        for number, block_rows in self.iter_rows(start, to_block):
+            rows.extend(block_rows)
+            if len(rows) >= rows_per_file or number == to_block:
+                path = os.path.join(directory, f"{chunk_start}_{number}.{_extension(file_format)}")
+                _write_chunk(path, rows, self.columns, file_format)
+                _write_cursor(cursor_path, number + 1)
+                written += len(rows)
+                print(f"Exported blocks {chunk_start}-{number}: {len(rows)} rows")
+                rows = []
+                chunk_start = number + 1
+        return written
+
+
+def _to_int(value: str | None) -> int | None:
+    return int(value, 16) if value is not None else None
+
+
+def _block_row(block: dict) -> dict:
+    return {
+        'number': int(block['number'], 16),
+        'hash': block['hash'],
+        'parent_hash': block['parentHash'],
+        'timestamp': int(block['timestamp'], 16),
+        'miner': block.get('miner'),
+        'gas_used': int(block['gasUsed'], 16),
+        'gas_limit': int(block['gasLimit'], 16),
+        'base_fee_per_gas': _to_int(block.get('baseFeePerGas')),
+        'transaction_count': len(block['transactions']),
+    }
+
+
+def _transaction_row(block: dict, tx: dict) -> dict:
+    # value в wei не помещается в int64, поэтому хранится строкой
+    return {
+        'block_number': int(block['number'], 16),
+        'block_timestamp': int(block['timestamp'], 16),
+        'transaction_index': int(tx['transactionIndex'], 16),
+        'hash': tx['hash'],
+        'from': tx['from'],
+        'to': tx.get('to'),
+        'value': str(int(tx['value'], 16)),
+        'gas': int(tx['gas'], 16),
+        'gas_price': _to_int(tx.get('gasPrice')),
+        'max_fee_per_gas': _to_int(tx.get('maxFeePerGas')),
+        'max_priority_fee_per_gas': _to_int(tx.get('maxPriorityFeePerGas')),
+        'nonce': int(tx['nonce'], 16),
+        'type': _to_int(tx.get('type')),
+        'input_size': (len(tx.get('input', '0x')) - 2) // 2,
+    }
+
+
+def _extension(file_format: str) -> str:
+    return 'parquet' if file_format == 'parquet' else 'csv.gz'
+
+
+def _write_chunk(path: str, rows: list[dict], columns: list[str], file_format: str) -> None:
+    """
+    Пишет кусок во временный файл и переименовывает его, чтобы после сбоя не оставалось битых файлов.
+    """
+    tmp_path = path + ".tmp"
+    if file_format == 'parquet':
+        table = pyarrow.table({column: [row[column] for row in rows] for column in columns})
+        pyarrow.parquet.write_table(table, tmp_path, compression='zstd')
+    else:
+        with gzip.open(tmp_path, "wt", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def _read_cursor(path: str) -> int | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)['next_block']
+
+
+def _write_cursor(path: str, next_block: int) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({'next_block': next_block}, file)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    from lesson4.classes.chain import chains
+
+    chain = chains["ethereum"]
+    latest = chain.connection.eth.block_number
+    scanner = BlockScanner(chain.connection, full_transactions=True)
+    scanner.export(latest - 1000, latest, "blocks", file_format='parquet' if pyarrow else 'csv')
@@ -0,0 +1,281 @@
+import asyncio
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Iterable
+
+import requests
+from web3 import Web3
+
+from lesson4.classes.nonce_manager import nonce_manager
+from lesson4.classes.rate_limiter import RateLimiter
+from lesson4.classes.rpc_metrics import rpc_metrics
+from lesson4.classes.rpc_batch import RpcError
+from lesson4.classes.rpc_router import is_endpoint_error
+from lesson4.classes.signing_pool import SignedTransaction
+
+if TYPE_CHECKING:
+    from lesson4.classes.chain import Chain
+
+# HTTP-коды, после которых отправку можно повторить на этом же или другом RPC
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Ответы, которые означают, что эта транзакция уже есть у ноды
+KNOWN_TRANSACTION_ERRORS = ("already known", "known transaction", "already imported")
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, rate_limited: bool = False, retry_after: float | None = None):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+
+
+class Broadcaster:
+    def __init__(self, chain: "Chain", concurrency: int = 8, queue_size: int = 1000, rate: float = 10,
+                 burst: int | None = None, max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30):
+        """
+        Этап отправки подписанных транзакций: несколько потоков берут raw-транзакции из очереди
+        и отправляют их eth_sendRawTransaction на rpc и alternative_rpc сети. У каждого RPC свой
+        token bucket, поэтому публичные серверы не получают больше rate запросов в секунду.
+        На 429 и временные ошибки отправка повторяется с экспоненциальной задержкой и jitter,
+        а RPC, ответивший 429, приостанавливается на время этой задержки. Повторная отправка
+        безопасна: транзакция та же, и ответ "already known" считается успехом. Очередь ограничена,
+        поэтому быстрый этап подписи притормаживает, а не копит в памяти все транзакции.
+
+        :param chain: Сеть, в которую отправляются транзакции
+        :param concurrency: Сколько транзакций отправляется одновременно
+        :param queue_size: Сколько подписанных транзакций может ждать отправки
+        :param rate: Максимум отправок в секунду на один RPC
+        :param burst: Сколько отправок на один RPC можно сделать подряд без ожидания
+        :param max_retries: Сколько раз повторять отправку после временной ошибки
+        :param backoff: Начальная задержка перед повтором в секундах
+        :param max_backoff: Максимальная задержка перед повтором в секундах
+        """
+        self.chain = chain
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.endpoints = list(dict.fromkeys([chain.rpc, *chain.alternative_rpc]))
+        self._providers = {
+            url: rpc_metrics.instrument(Web3.HTTPProvider(
+                url, session=chain.session, request_kwargs={'timeout': chain.request_timeout},
+                exception_retry_configuration=None))
+            for url in self.endpoints
+        }
+        self._limiters = {url: RateLimiter(rate, burst) for url in self.endpoints}
+        self._next_endpoint = 0
+        self._in_flight = {}  # tx_hash -> Future, чтобы одна транзакция не отправлялась параллельно дважды
+        self._counters = {'queued': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._run, name=f"broadcaster-{i}", daemon=True)
+                         for i in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, signed: SignedTransaction, timeout: float | None = None) -> Future:
+        """
+        Ставит транзакцию в очередь отправки. Блокируется, если очередь заполнена.
+        Если транзакция с тем же хешем уже в очереди или отправляется, возвращается ее Future.
+
+        :param signed: Подписанная транзакция
+        :param timeout: Сколько секунд ждать места в очереди, по умолчанию без ограничения
+        :return: Future со словарем {'sender', 'nonce', 'tx_hash', 'error'}
+        :raises queue.Full: Если за timeout место в очереди не освободилось
+        :raises RuntimeError: Если Broadcaster уже закрыт
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Broadcaster is closed")
+            if signed.tx_hash is not None and signed.tx_hash in self._in_flight:
+                return self._in_flight[signed.tx_hash]
+            future = Future()
+            if signed.tx_hash is not None:
+                self._in_flight[signed.tx_hash] = future
+        try:
+            self._queue.put((signed, future), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._in_flight.pop(signed.tx_hash, None)
+            raise
+        with self._lock:
+            self._counters['queued'] += 1
+        return future
+
+    async def submit_async(self, signed: SignedTransaction) -> dict:
+        """
+        Асинхронная версия submit для AsyncClient: ждет места в очереди в отдельном потоке,
+        чтобы не блокировать event loop, и возвращает результат отправки.
+
+        :param signed: Подписанная транзакция
+        :return: Словарь {'sender', 'nonce', 'tx_hash', 'error'}
+        """
+        try:
+            future = self.submit(signed, timeout=0)
+        except queue.Full:
+            future = await asyncio.to_thread(self.submit, signed)
+        return await asyncio.wrap_future(future)
+
+    def broadcast(self, signed_transactions: Iterable[SignedTransaction]) -> list[dict]:
+        """
+        Отправляет поток подписанных транзакций, например результат SigningPool.sign.
+
+        :param signed_transactions: Подписанные транзакции
+        :return: Результаты в порядке входа: {'sender', 'nonce', 'tx_hash', 'error'}
+        """
+        futures = [self.submit(signed) for signed in signed_transactions]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        """
+        :return: Счетчики {'queued', 'sent', 'retried', 'failed'} с момента создания и 'pending' - размер очереди
+        """
+        with self._lock:
+            return {**self._counters, 'pending': self._queue.qsize()}
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            signed, future = item
+            try:
+                result = self._send(signed)
+            except Exception as e:
+                self._release_nonce(signed, e)
+                result = {'sender': signed.sender, 'nonce': signed.nonce, 'tx_hash': None, 'error': str(e)}
+            self._finish(signed, future, result)
+
+    def _finish(self, signed: SignedTransaction, future: Future, result: dict) -> None:
+        with self._lock:
+            self._counters['sent' if result['error'] is None else 'failed'] += 1
+            self._in_flight.pop(signed.tx_hash, None)
+        future.set_result(result)
+
+    def _endpoint(self) -> str:
+        """
+        Выбирает RPC, у которого есть свободный токен, начиная со следующего по кругу.
+        Если свободных нет, ждет токен у очередного RPC.
+        """
+        with self._lock:
+            start = self._next_endpoint
+            self._next_endpoint = (start + 1) % len(self.endpoints)
+        for i in range(len(self.endpoints)):
+            url = self.endpoints[(start + i) % len(self.endpoints)]
+            if self._limiters[url].try_acquire():
+                return url
+        url = self.endpoints[start]
+        self._limiters[url].acquire()
+        return url
+
+    def _request(self, url: str, method: str, params: list) -> dict:
+        """
+        Выполняет запрос к одному RPC.
+
+        :raises _RetryableError: Если RPC ограничил частоту запросов или временно недоступен
+        """
+        try:
+            response = self._providers[url].make_request(method, params)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status not in RETRY_STATUS_CODES:
+                raise
+            retry_after = e.response.headers.get('Retry-After')
+            raise _RetryableError(f"{url}: {e}", rate_limited=status == 429,
+                                  retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(f"{url}: {e}")
+        if 'error' in response and is_endpoint_error(response['error']):
+            raise _RetryableError(f"{url}: {response['error']}", rate_limited=True)
+        return response
+
+    def _delay(self, attempt: int, retry_after: float | None) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+        return max(delay, retry_after or 0)
+
+    def _send(self, signed: SignedTransaction) -> dict:
+        result = {'sender': signed.sender, 'nonce': signed.nonce, 'tx_hash': None, 'error': signed.error}
+        if signed.error is not None:
+            self._release_nonce(signed, RuntimeError(signed.error))
+            return result
+        attempt = 0
+        while True:
+            url = self._endpoint()
+            try:
+                response = self._request(url, "eth_sendRawTransaction", [signed.raw_transaction])
+                break
+            except requests.HTTPError as e:
+                # RPC отклонил запрос целиком (400, 403, 413): повтор не поможет, а nonce нужно вернуть,
+                # иначе следующие транзакции кошелька зависнут в мемпуле за пропуском
+                self._release_nonce(signed, e)
+                result['error'] = f"{url}: {e}"
+                return result
+            except _RetryableError as e:
+                if attempt >= self.max_retries:
+                    self._release_nonce(signed, e)
+                    result['error'] = str(e)
+                    return result
+                delay = self._delay(attempt, e.retry_after)
+                if e.rate_limited:
+                    self._limiters[url].penalize(delay)
+                with self._lock:
+                    self._counters['retried'] += 1
+                attempt += 1
+                time.sleep(delay)
+        if 'error' in response:
+            error = RpcError(response['error'])
+            # Такая же транзакция уже в мемпуле, например после повторной отправки
+            if any(fragment in str(error).lower() for fragment in KNOWN_TRANSACTION_ERRORS):
+                result['tx_hash'] = signed.tx_hash
+                return result
+            # Предыдущая попытка могла дойти до ноды, хотя ответ потерялся
+            if attempt > 0 and self._is_known(url, signed.tx_hash):
+                result['tx_hash'] = signed.tx_hash
+                return result
+            self._release_nonce(signed, error)
+            result['error'] = str(error)
+            return result
+        result['tx_hash'] = response['result']
+        return result
+
+    def _is_known(self, url: str, tx_hash: str) -> bool:
+        try:
+            response = self._request(url, "eth_getTransactionByHash", [tx_hash])
+        except Exception:
+            return False
+        return response.get('result') is not None
+
+    def _release_nonce(self, signed: SignedTransaction, error: Exception) -> None:
+        if signed.nonce is not None:
+            nonce_manager.handle_error(self.chain.id, signed.sender, signed.nonce, error)
+
+    def close(self) -> None:
+        """
+        Дожидается отправки всех транзакций из очереди и останавливает потоки. После этого submit
+        выбрасывает RuntimeError, а транзакции, попавшие в очередь одновременно с закрытием, завершаются ошибкой.
+        """
+        with self._lock:
+            self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                signed, future = item
+                self._release_nonce(signed, RuntimeError("Broadcaster is closed"))
+                self._finish(signed, future, {'sender': signed.sender, 'nonce': signed.nonce, 'tx_hash': None,
+                                              'error': "Broadcaster is closed"})
+
+    def __enter__(self) -> "Broadcaster":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
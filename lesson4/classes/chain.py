@@ -1,35 +1,199 @@
-from web3 import Web3
+import threading
 
-from lesson4.abis.abis import ERC20_ABI
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import AsyncWeb3, Web3
+
+from lesson4.classes.block_cache import block_cache
+from lesson4.classes.broadcaster import Broadcaster
+from lesson4.classes.fee_oracle import FeeOracle
+from lesson4.classes.head_subscriber import HeadSubscriber
+from lesson4.classes.multicall import Multicall
+from lesson4.classes.receipt_tracker import ReceiptTracker
+from lesson4.classes.rpc_batch import RpcBatch, read_accounts
+from lesson4.classes.rpc_metrics import rpc_metrics
+from lesson4.classes.rpc_router import RoutedHTTPProvider, RpcRouter
+from lesson4.classes.token_cache import token_cache
 
 
 class Chain:
-    def __init__(self, name: str, chain_id: int, rpc: str, native_token: str, alternative_rpc: list[str]):
+    def __init__(self, name: str, chain_id: int, rpc: str, native_token: str, alternative_rpc: list[str],
+                 pool_size: int = 20, request_timeout: float = 30, block_time: float = 12,
+                 eip1559: bool | None = None, use_router: bool = True, hedge: bool = False,
+                 send_rate: float = 10, ws_rpc: str | None = None, read_cache: bool = True):
         self.name = name
         self.id = chain_id
         self.rpc = rpc
         self.native_token = native_token
         self.alternative_rpc = alternative_rpc  # Массив альтернативных RPC-серверов, если первый недоступен
         self.current_rpc_index = 0
+        self.pool_size = pool_size  # Сколько keep-alive соединений держим к RPC, общих для всех клиентов сети
+        self.request_timeout = request_timeout
+        self.block_time = block_time
+        self.fee_oracle = FeeOracle(block_time=block_time, eip1559=eip1559)
+        self.use_router = use_router  # Распределять запросы между rpc и alternative_rpc по задержке
+        self.hedge = hedge  # Дублировать медленные чтения на второй RPC
+        self.send_rate = send_rate  # Максимум eth_sendRawTransaction в секунду на один RPC
+        self.ws_rpc = ws_rpc  # WebSocket RPC для подписки на новые блоки, без него блоки опрашиваются по HTTP
+        self.read_cache = read_cache  # Отвечать на повторные чтения состояния в том же блоке из block_cache
+        self._router = None
+        self.receipt_tracker = ReceiptTracker(lambda: self.connection, block_time=block_time)
+        self._session = None
+        self._connection = None
+        self._async_connection = None
+        self._multicall = None
+        self._broadcaster = None
+        self._heads = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        HTTP-сессия с пулом keep-alive соединений, общая для всех клиентов этой сети.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = rpc_metrics.instrument_session(session)
+        return self._session
+
+    @property
+    def router(self) -> RpcRouter:
+        """
+        Маршрутизатор запросов между rpc и alternative_rpc с учетом задержки и ошибок.
+        """
+        if self._router is None:
+            session = self.session
+            with self._lock:
+                if self._router is None:
+                    self._router = RpcRouter([self.rpc, *self.alternative_rpc], session=session,
+                                             request_timeout=self.request_timeout, hedge=self.hedge)
+        return self._router
+
+    @property
+    def connection(self) -> Web3:
+        """
+        Подключение к RPC поверх общего пула соединений. Создается при первом обращении.
+        Если включен use_router и есть alternative_rpc, запросы идут через RpcRouter.
+        Все вызовы записываются в rpc_metrics. Если включен read_cache, повторные чтения состояния
+        в том же блоке берутся из block_cache и до RPC не доходят.
+        """
+        if self._connection is None:
+            session = self.session
+            router = self.router if self.use_router and self.alternative_rpc else None
+            with self._lock:
+                if self._connection is None:
+                    if router is not None:
+                        provider = rpc_metrics.instrument(RoutedHTTPProvider(router))
+                    else:
+                        provider = rpc_metrics.instrument(Web3.HTTPProvider(
+                            self.rpc, session=session, request_kwargs={'timeout': self.request_timeout}))
+                    if self.read_cache:
+                        provider = block_cache.wrap(provider, self.id, self.block_time)
+                    self._connection = Web3(provider)
+        return self._connection
+
+    @property
+    def async_connection(self) -> AsyncWeb3:
+        """
+        Асинхронное подключение к текущему RPC, общее для всех AsyncClient этой сети.
+        """
+        if self._async_connection is None:
+            with self._lock:
+                if self._async_connection is None:
+                    provider = rpc_metrics.instrument_async(AsyncWeb3.AsyncHTTPProvider(
+                        self.rpc, request_kwargs={'timeout': self.request_timeout}))
+                    if self.read_cache:
+                        provider = block_cache.wrap_async(provider, self.id, self.block_time)
+                    self._async_connection = AsyncWeb3(provider)
+        return self._async_connection
+
+    @property
+    def broadcaster(self) -> Broadcaster:
+        """
+        Очередь отправки транзакций с лимитом частоты на каждый RPC сети, общая для всех клиентов сети.
+        """
+        if self._broadcaster is None:
+            with self._lock:
+                if self._broadcaster is None:
+                    self._broadcaster = Broadcaster(self, rate=self.send_rate)
+        return self._broadcaster
+
+    @property
+    def heads(self) -> HeadSubscriber:
+        """
+        Подписка на новые блоки: eth_subscribe через ws_rpc или опрос по HTTP, если ws_rpc не задан.
+        Не запущена, пока не вызван heads.start(). После запуска оракул комиссий и трекер квитанций
+        узнают о новом блоке сразу, а не при следующем опросе.
+        """
+        if self._heads is None:
+            with self._lock:
+                if self._heads is None:
+                    self._heads = HeadSubscriber(self, ws_rpc=self.ws_rpc)
+        return self._heads
+
+    @property
+    def multicall(self) -> Multicall:
+        """
+        Multicall3 поверх подключения этой сети.
+        """
+        if self._multicall is None:
+            self._multicall = Multicall(self.connection)
+        return self._multicall
+
+    def _reset_connection(self) -> None:
+        with self._lock:
+            router = self._router
+            broadcaster = self._broadcaster
+            self._connection = None
+            self._async_connection = None
+            self._multicall = None
+            self._router = None
+            self._broadcaster = None
+        if router is not None:
+            router.close()
+        if broadcaster is not None:
+            # Старый Broadcaster дорабатывает уже принятые транзакции в фоне, новые идут через новый RPC
+            threading.Thread(target=broadcaster.close, name=f"broadcaster-close-{self.name}", daemon=True).start()
 
     def set_rpc_url(self, url: str) -> bool:
         self.rpc = url
+        self._reset_connection()
         return True
 
     def switch_to_alternative_rpc(self) -> bool:
         if self.current_rpc_index < len(self.alternative_rpc):
             self.rpc = self.alternative_rpc[self.current_rpc_index]
             self.current_rpc_index += 1
+            self._reset_connection()
             return True
         else:
             print("No more alternative RPCs available for this chain")
             return False
 
+    def batch(self, max_batch_size: int = 100) -> RpcBatch:
+        return RpcBatch(self.connection, max_batch_size=max_batch_size)
+
+    def read_accounts(self, addresses: list[str]) -> list[dict]:
+        return read_accounts(self.connection, addresses)
+
+    def cache_stats(self) -> dict:
+        """
+        :return: Статистика block_cache: попадания, промахи и сколько запросов к RPC сэкономлено.
+            Кеш общий для всех сетей
+        """
+        return block_cache.stats()
+
     def get_decimals(self, token_address: str) -> int:
-        connection = Web3(Web3.HTTPProvider(self.rpc))
-        contract = connection.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
-        decimals = contract.functions.decimals().call()
-        return decimals
+        return token_cache.get_decimals(self.id, token_address, self.connection, self.multicall)
+
+    def warm_up_tokens(self, token_addresses: list[str]) -> int:
+        return token_cache.warm_up(self.id, token_addresses, self.connection, self.multicall)
+
 
 chains = {
     "ethereum": Chain(
@@ -37,18 +201,37 @@ chains = {
         1,
         "https://ethereum-rpc.publicnode.com",
         "ETH",
-        ["https://eth.llamarpc.com", "https://rpc.payload.de", "https://1rpc.io/eth"]),
+        ["https://eth.llamarpc.com", "https://rpc.payload.de", "https://1rpc.io/eth"],
+        block_time=12,
+        ws_rpc="wss://ethereum-rpc.publicnode.com"),
     "arbitrum": Chain(
         'arbitrum',
         42161,
         "https://arbitrum.llamarpc.com",
         "ETH",
         ["https://arbitrum.drpc.org", "https://1rpc.io/arb", "https://arb-pokt.nodies.app",
-         "https://arbitrum.meowrpc.com"]),
+         "https://arbitrum.meowrpc.com"],
+        block_time=0.25),
     "optimism": Chain(
         'optimism',
         10,
         "https://optimism-rpc.publicnode.com",
         "ETH",
-        ["https://1rpc.io/op", "https://optimism.llamarpc.com", "https://optimism.drpc.org"]),
+        ["https://1rpc.io/op", "https://optimism.llamarpc.com", "https://optimism.drpc.org"],
+        block_time=2,
+        ws_rpc="wss://optimism-rpc.publicnode.com"),
 }
+
+
+def get_chain_by_rpc(rpc: str) -> Chain | None:
+    """
+    Ищет в реестре сеть, основной RPC-сервер которой совпадает с rpc. Альтернативные RPC не учитываются:
+    клиент, созданный с таким URL, должен ходить именно на него, а не в общее подключение сети.
+
+    :param rpc: URL RPC-сервера
+    :return: Сеть из реестра или None
+    """
+    for chain in chains.values():
+        if rpc == chain.rpc:
+            return chain
+    return None
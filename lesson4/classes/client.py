@@ -1,29 +1,111 @@
 import time
+import requests
+from eth_account import Account
 from web3 import Web3
-from lesson4.abis.abis import ERC20_ABI
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.chain import Chain, get_chain_by_rpc
+from lesson4.classes.erc20_calls import call_uint, encode_allowance, encode_balance_of
+from lesson4.classes.fee_oracle import FeeOracle
+from lesson4.classes.keystore import KeystoreCache, load_keystores
+from lesson4.classes.multicall import Multicall
+from lesson4.classes.nonce_manager import nonce_manager
+from lesson4.classes.rpc_batch import RpcBatch
+from lesson4.classes.rpc_metrics import rpc_metrics
+from lesson4.classes.signing_pool import SignedTransaction
+from lesson4.classes.token_cache import token_cache
 
 
 class Client:
-    def __init__(self, private_key: str, rpc: str):
+    def __init__(self, private_key: str, rpc: str | Chain, address: str | None = None):
         """"
+        Клиент - легковесное представление кошелька поверх общего пула соединений сети.
+        Если передан URL основного RPC сети из реестра, используется подключение этой сети,
+        для любого другого URL создается отдельное подключение именно к нему.
+        Для сети из реестра конструктор не делает запросов к RPC.
+
         :param private_key: Приватный ключ в 16 ричном формате
-        :param rpc: URL RPC-сервера
+        :param rpc: Сеть из реестра или URL RPC-сервера
+        :param address: Адрес кошелька, если уже известен. Тогда аккаунт создается только при подписи
         :raises ConnectionError: Если не удалось подключиться к RPC-серверу
         """
         self.private_key = private_key
-        self.rpc = rpc
-        self.connection = Web3(Web3.HTTPProvider(rpc))
-        if not self.connection.is_connected():
-            raise ConnectionError("Failed to connect to the RPC")
-        self.account = self.connection.eth.account.from_key(self.private_key)
-        self.public_key = self.account.address
-        self.chain_id = self.connection.eth.chain_id
+        self.chain = rpc if isinstance(rpc, Chain) else get_chain_by_rpc(rpc)
+        self._account = None
+        self.public_key = Web3.to_checksum_address(address) if address is not None else self.account.address
+        if self.chain is not None:
+            self._connection = None
+            self._multicall = None
+            self._fee_oracle = None
+            self.chain_id = self.chain.id
+        else:
+            session = rpc_metrics.instrument_session(requests.Session())
+            self._connection = Web3(rpc_metrics.instrument(Web3.HTTPProvider(rpc, session=session)))
+            if not self._connection.is_connected():
+                raise ConnectionError("Failed to connect to the RPC")
+            self._multicall = Multicall(self._connection)
+            self._fee_oracle = FeeOracle()
+            self.chain_id = self._connection.eth.chain_id
+        self._rpc = rpc
 
-    def __del__(self) -> None:
+    @classmethod
+    def from_keystore(cls, path: str, password: str, rpc: str | Chain,
+                      cache: KeystoreCache | None = None) -> "Client":
         """
-        Сообщает, что клиент был удален.
+        Создает клиента из зашифрованного V3 keystore.
+
+        :param path: Путь к файлу keystore
+        :param password: Пароль keystore
+        :param rpc: Сеть из реестра или URL RPC-сервера
+        :param cache: Кеш расшифрованных ключей на время сессии, например keystore_cache
+        :return: Клиент
         """
-        print(f"Client with public key {self.public_key} was deleted")
+        [(address, private_key)] = load_keystores([path], password, cache=cache)
+        return cls(private_key, rpc, address=address)
+
+    @property
+    def rpc(self) -> str:
+        """
+        URL текущего RPC-сервера.
+        """
+        return self.chain.rpc if self.chain is not None else self._rpc
+
+    @property
+    def connection(self) -> Web3:
+        """
+        Подключение к RPC. Для сетей из реестра - общее для всех клиентов сети.
+        """
+        return self.chain.connection if self.chain is not None else self._connection
+
+    @property
+    def multicall(self) -> Multicall:
+        """
+        Multicall3 поверх подключения клиента.
+        """
+        return self.chain.multicall if self.chain is not None else self._multicall
+
+    @property
+    def fee_oracle(self) -> FeeOracle:
+        """
+        Оракул комиссий сети клиента.
+        """
+        return self.chain.fee_oracle if self.chain is not None else self._fee_oracle
+
+    def get_fees(self) -> dict:
+        """
+        Получает поля комиссии для транзакции из оракула сети
+
+        :return: {'maxFeePerGas', 'maxPriorityFeePerGas'} или {'gasPrice'} для legacy сетей
+        """
+        return self.fee_oracle.get_fees(self.connection)
+
+    @property
+    def account(self):
+        """
+        Аккаунт eth_account для подписи. Создается при первом обращении.
+        """
+        if self._account is None:
+            self._account = Account.from_key(self.private_key)
+        return self._account
 
     def __str__(self) -> str:
         """
@@ -38,6 +120,14 @@ class Client:
             f")"
         )
 
+    def batch(self) -> RpcBatch:
+        """
+        Создает JSON-RPC batch поверх подключения клиента для группового чтения
+
+        :return: Пустой batch, запросы добавляются через add и отправляются через execute
+        """
+        return RpcBatch(self.connection)
+
     def get_nonce(self, address: str = None) -> int | None:
         """
         Получает nonce аккаунта
@@ -73,18 +163,62 @@ class Client:
     def send_transaction(self, transaction: dict) -> str | None:
         """
         Подписывает и отправляет транзакцию в сеть, возвращая её хеш.
+        Если nonce не указан, он выдается локальным nonce_manager без запроса к RPC.
+        Для сетей из реестра отправка идет через общий Broadcaster сети с лимитом частоты и повторами.
 
         :param transaction: Словарь с данными транзакции.
         :return: Хеш отправленной транзакции или ничего
         """
+        nonce = None
         try:
+            if 'nonce' not in transaction:
+                nonce = nonce_manager.allocate(self.chain_id, self.public_key, self.connection)
+                transaction = {**transaction, 'nonce': nonce}
             signed_transaction = self.account.sign_transaction(transaction)
+            if self.chain is not None:
+                signed = SignedTransaction(self.public_key, nonce, "0x" + signed_transaction.raw_transaction.hex(),
+                                           "0x" + signed_transaction.hash.hex(), None)
+                # Broadcaster сам возвращает nonce в nonce_manager при ошибке
+                nonce = None
+                result = self.chain.broadcaster.submit(signed).result()
+                if result['error'] is not None:
+                    raise RuntimeError(result['error'])
+                return result['tx_hash']
             tx_hash = self.connection.eth.send_raw_transaction(signed_transaction.raw_transaction)
             return "0x" + tx_hash.hex()
         except Exception as e:
+            if nonce is not None:
+                nonce_manager.handle_error(self.chain_id, self.public_key, nonce, e)
             print(f"Error occurred while sending transaction: {e}")
             return None
 
+    def wait_for_transaction(self, tx_hash: str, timeout: float = 300) -> dict | None:
+        """
+        Ждет подтверждения транзакции через общий для сети трекер квитанций
+
+        :param tx_hash: Хеш транзакции
+        :param timeout: Сколько секунд ждать
+        :return: Словарь {'tx_hash', 'status', 'block_number', 'gas_used', 'effective_gas_price'} или None
+        """
+        if self.chain is None:
+            try:
+                receipt = self.connection.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+                return {
+                    'tx_hash': tx_hash,
+                    'status': receipt['status'],
+                    'block_number': receipt['blockNumber'],
+                    'gas_used': receipt['gasUsed'],
+                    'effective_gas_price': receipt.get('effectiveGasPrice'),
+                }
+            except Exception as e:
+                print(f"Error occurred while waiting for transaction {tx_hash}: {e}")
+                return None
+        try:
+            return self.chain.receipt_tracker.wait(tx_hash, timeout=timeout)
+        except Exception as e:
+            print(f"Error occurred while waiting for transaction {tx_hash}: {e}")
+            return None
+
     def send_native(self, to_address: str, amount: float) -> str | None:
         """
         Отправляет нативные средства на кошелек ""to_address" в количестве "amount"
@@ -95,13 +229,11 @@ class Client:
         """
         try:
             value = self.connection.to_wei(amount, 'ether')
-            nonce = self.get_nonce()
             tx = {
-                'nonce': nonce,
                 'to': Web3.to_checksum_address(to_address),
                 'value': value,
                 'chainId': self.chain_id,
-                'gasPrice': self.connection.eth.gas_price,
+                **self.get_fees(),
             }
             tx['gas'] = self.connection.eth.estimate_gas(tx)
             return self.send_transaction(tx)
@@ -116,14 +248,40 @@ class Client:
         :param account_address: Адрес для проверки баланса. Если не указан, берется аккаунт текущего клиента
         :return: Баланс ERC20-токена для указанного аккаунта
         """
-        if account_address is None:
-            account_address = self.public_key
-        contract = self.connection.eth.contract(address=Web3.to_checksum_address(erc20_address), abi=ERC20_ABI)
-        balance_wei = contract.functions.balanceOf(account_address).call()
-        decimals = contract.functions.decimals().call()
+        balance_wei = self.get_erc20_balance_wei(erc20_address, account_address)
+        decimals = token_cache.get_decimals(self.chain_id, erc20_address, self.connection, self.multicall)
         balance_ether = balance_wei / (10 ** decimals)
         return balance_ether
 
+    def get_erc20_balance_wei(self, erc20_address: str, account_address: str = None) -> int:
+        """
+        Получает баланс ERC20-токена в минимальных единицах одним eth_call, минуя контракт web3.
+        Подходит для горячих циклов по тысячам кошельков.
+
+        :param erc20_address: Адрес ERC20-токена
+        :param account_address: Адрес для проверки баланса. Если не указан, берется аккаунт текущего клиента
+        :return: Баланс в минимальных единицах токена
+        """
+        if account_address is None:
+            account_address = self.public_key
+        return call_uint(self.connection, erc20_address, encode_balance_of(account_address))
+
+    def get_balances(self, tokens: list[str | None], addresses: list[str] = None) -> list[list[float | None]] | None:
+        """
+        Получает балансы множества кошельков по множеству токенов пачками через Multicall3
+
+        :param tokens: Адреса ERC20-токенов, None означает нативную монету
+        :param addresses: Адреса для проверки балансов. Если не указаны, берется аккаунт текущего клиента
+        :return: Матрица балансов [адрес][токен] или None
+        """
+        if addresses is None:
+            addresses = [self.public_key]
+        try:
+            return self.multicall.get_balances(addresses, tokens)
+        except Exception as e:
+            print(f"Error occurred while getting balances: {e}")
+            return None
+
     def send_erc20_tokens(self, erc20_address: str, to_address: str, amount: float) -> str | None:
         """
         Отправляет ERC20-токены на указанный адрес
@@ -134,20 +292,17 @@ class Client:
         :return: Хеш транзакции или ничего
         """
         try:
-            contract = self.connection.eth.contract(address=Web3.to_checksum_address(erc20_address), abi=ERC20_ABI)
-            decimals = contract.functions.decimals().call()
+            contract = abi_registry.contract(self.connection, "erc20", erc20_address)
+            decimals = token_cache.get_decimals(self.chain_id, erc20_address, self.connection, self.multicall)
             scaled_amount = int(amount * (10 ** decimals))
-            nonce = self.get_nonce()
             estimate_gas = contract.functions.transfer(
                 Web3.to_checksum_address(to_address), scaled_amount).estimate_gas({'from': self.public_key})
-            gas_price = self.connection.eth.gas_price
             transaction = contract.functions.transfer(
                 Web3.to_checksum_address(to_address),  scaled_amount).build_transaction(
                 {
                     'from': self.public_key,
                     'gas': estimate_gas,
-                    'gasPrice': gas_price,
-                    'nonce': nonce,
+                    **self.get_fees(),
                     'chainId': self.chain_id,
                 }
             )
@@ -167,20 +322,17 @@ class Client:
         :return: Хеш транзакции или ничего
         """
         try:
-            contract = self.connection.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
-            decimals = contract.functions.decimals().call()
+            contract = abi_registry.contract(self.connection, "erc20", token_address)
+            decimals = token_cache.get_decimals(self.chain_id, token_address, self.connection, self.multicall)
             scaled_amount = int(amount * (10 ** decimals))
-            nonce = self.get_nonce()
             estimate_gas = contract.functions.transfer(
                 Web3.to_checksum_address(spender_address), scaled_amount).estimate_gas({'from': self.public_key})
-            gas_price = self.connection.eth.gas_price
             transaction = contract.functions.approve(
                 Web3.to_checksum_address(spender_address), scaled_amount).build_transaction(
                 {
                     'from': self.public_key,
-                    'nonce': nonce,
                     'gas': estimate_gas,
-                    'gasPrice': gas_price,
+                    **self.get_fees(),
                     'chainId': self.chain_id,
                 })
             tx_hash = self.send_transaction(transaction)
@@ -198,19 +350,16 @@ class Client:
         :return: Хеш транзакции или ничего
         """
         try:
-            contract = self.connection.eth.contract(address=token_address, abi=ERC20_ABI)
+            contract = abi_registry.contract(self.connection, "erc20", token_address)
             scaled_amount = 2 ** 256 - 1
-            nonce = self.get_nonce()
             estimate_gas = contract.functions.transfer(
                 Web3.to_checksum_address(spender_address), scaled_amount).estimate_gas({'from': self.public_key})
-            gas_price = self.connection.eth.gas_price
             transaction = contract.functions.approve(
                 Web3.to_checksum_address(spender_address), scaled_amount).build_transaction(
                 {
                     'from': self.public_key,
-                    'nonce': nonce,
                     'gas': estimate_gas,
-                    'gasPrice': gas_price,
+                    **self.get_fees(),
                     'chainId': self.chain_id,
                 })
             tx_hash = self.send_transaction(transaction)
@@ -228,9 +377,8 @@ class Client:
         :return: Остаток approve или None
         """
         try:
-            contract = self.connection.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
-            allowance = contract.functions.allowance(self.public_key, Web3.to_checksum_address(spender_address)).call()
-            decimals = contract.functions.decimals().call()
+            allowance = call_uint(self.connection, token_address, encode_allowance(self.public_key, spender_address))
+            decimals = token_cache.get_decimals(self.chain_id, token_address, self.connection, self.multicall)
             return allowance / (10 ** decimals)
         except Exception as e:
             print(f"Error occurred while getting allowance: {e}")
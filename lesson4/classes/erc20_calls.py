@@ -0,0 +1,94 @@
+from web3 import AsyncWeb3, Web3
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.rpc_batch import RpcError
+
+# Селекторы без 0x, чтобы calldata собиралась одной конкатенацией строк
+BALANCE_OF = abi_registry.selector("erc20", "balanceOf")[2:]
+ALLOWANCE = abi_registry.selector("erc20", "allowance")[2:]
+DECIMALS_CALLDATA = abi_registry.selector("erc20", "decimals")
+SYMBOL_CALLDATA = abi_registry.selector("erc20", "symbol")
+NAME_CALLDATA = abi_registry.selector("erc20", "name")
+HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+
+def _pad_address(address: str) -> str:
+    # Адрес в ABI - 20 байт, дополненные нулями слева до 32 байт
+    if len(address) != 42 or not address.startswith(("0x", "0X")) or not HEX_DIGITS.issuperset(address[2:]):
+        raise ValueError(f"Invalid address {address}")
+    return "000000000000000000000000" + address[2:].lower()
+
+
+def encode_balance_of(owner: str) -> str:
+    """
+    :param owner: Адрес владельца
+    :return: calldata balanceOf(owner) в hex
+    """
+    return "0x" + BALANCE_OF + _pad_address(owner)
+
+
+def encode_allowance(owner: str, spender: str) -> str:
+    """
+    :param owner: Адрес владельца
+    :param spender: Адрес того, кому разрешено тратить токены
+    :return: calldata allowance(owner, spender) в hex
+    """
+    return "0x" + ALLOWANCE + _pad_address(owner) + _pad_address(spender)
+
+
+def decode_uint(result: str) -> int:
+    """
+    Декодирует uint из ответа eth_call: первые 32 байта ответа.
+
+    :param result: Ответ eth_call в hex
+    :return: Число
+    :raises ValueError: Если ответ пустой (например у адреса нет кода)
+    """
+    if len(result) < 66:
+        raise ValueError(f"Unexpected eth_call result {result}")
+    return int(result[2:66], 16)
+
+
+def _call_params(to: str, data: str, block_identifier: str | int) -> list:
+    if isinstance(block_identifier, int):
+        block_identifier = hex(block_identifier)
+    return [{'to': to, 'data': data}, block_identifier]
+
+
+def _result(response: dict) -> str:
+    if 'error' in response:
+        raise RpcError(response['error'])
+    return response['result']
+
+
+def call_uint(connection: Web3, to: str, data: str, block_identifier: str | int = 'latest') -> int:
+    """
+    eth_call напрямую через провайдер, без контрактов web3, middleware и форматтеров.
+
+    :param connection: Подключение к RPC-серверу
+    :param to: Адрес контракта
+    :param data: calldata в hex
+    :param block_identifier: Блок, на котором выполняется вызов
+    :return: Первое слово ответа как int
+    :raises RpcError: Если нода вернула ошибку
+    """
+    response = connection.provider.make_request("eth_call", _call_params(to, data, block_identifier))
+    return decode_uint(_result(response))
+
+
+async def call_async(connection: AsyncWeb3, to: str, data: str, block_identifier: str | int = 'latest') -> str:
+    """
+    Асинхронный eth_call напрямую через провайдер.
+
+    :return: Ответ eth_call в hex
+    :raises RpcError: Если нода вернула ошибку
+    """
+    response = await connection.provider.make_request("eth_call", _call_params(to, data, block_identifier))
+    return _result(response)
+
+
+async def call_uint_async(connection: AsyncWeb3, to: str, data: str, block_identifier: str | int = 'latest') -> int:
+    """
+    Асинхронный вариант call_uint.
+    """
+    return decode_uint(await call_async(connection, to, data, block_identifier))
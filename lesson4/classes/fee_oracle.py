@@ -0,0 +1,162 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from web3 import AsyncWeb3, Web3
+
+
+class FeeOracle:
+    def __init__(self, block_time: float = 12, eip1559: bool | None = None, priority_percentile: int = 50,
+                 history_blocks: int = 5, base_fee_multiplier: float = 2):
+        """
+        Оракул комиссий сети. eth_feeHistory запрашивается не чаще одного раза за блок,
+        все клиенты сети получают maxFeePerGas/maxPriorityFeePerGas из памяти.
+        В сетях без EIP-1559 отдает legacy gasPrice, тоже не чаще раза за блок.
+
+        :param block_time: Среднее время блока в секундах, определяет срок жизни кеша
+        :param eip1559: Поддерживает ли сеть EIP-1559. None - определить автоматически
+        :param priority_percentile: Перцентиль чаевых из feeHistory, который используется для maxPriorityFeePerGas
+        :param history_blocks: Сколько последних блоков учитывать в feeHistory
+        :param base_fee_multiplier: Запас по base fee на случай роста в следующих блоках
+        """
+        self.block_time = block_time
+        self.eip1559 = eip1559
+        self.priority_percentile = priority_percentile
+        self.history_blocks = history_blocks
+        self.base_fee_multiplier = base_fee_multiplier
+        self.block_number = None
+        self.base_fee = None
+        self.priority_fee = None
+        self.gas_price = None
+        self._use_eip1559 = False  # Каким способом получены закешированные значения
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_task = None  # Идущее асинхронное обновление, его ждут все корутины
+
+    def _is_fresh(self) -> bool:
+        return self._fetched_at > 0 and time.monotonic() - self._fetched_at < self.block_time
+
+    def _fees(self) -> dict:
+        """
+        Формирует поля комиссии для транзакции из закешированных значений.
+        """
+        if self._use_eip1559:
+            return {
+                'maxFeePerGas': int(self.base_fee * self.base_fee_multiplier) + self.priority_fee,
+                'maxPriorityFeePerGas': self.priority_fee,
+            }
+        return {'gasPrice': self.gas_price}
+
+    def _apply_fee_history(self, fee_history: dict) -> None:
+        """
+        Сохраняет base fee следующего блока и перцентиль чаевых из ответа eth_feeHistory.
+        """
+        base_fees = fee_history['baseFeePerGas']
+        rewards = [reward[0] for reward in fee_history.get('reward') or [] if reward]
+        self.block_number = fee_history['oldestBlock'] + len(base_fees) - 2
+        self.base_fee = base_fees[-1]  # Последний элемент - base fee следующего блока
+        self.priority_fee = int(statistics.median(rewards)) if rewards else 0
+        self.eip1559 = True
+        self._use_eip1559 = True
+        self._fetched_at = time.monotonic()
+
+    def _apply_gas_price(self, gas_price: int) -> None:
+        self.gas_price = gas_price
+        self._use_eip1559 = False
+        self._fetched_at = time.monotonic()
+
+    def _supports_eip1559(self, fee_history: dict | None) -> bool:
+        """
+        Проверяет ответ feeHistory. Ответ без base fee означает, что сеть не поддерживает EIP-1559,
+        ошибка запроса (None) ничего не решает и лишь откатывает текущий блок на gasPrice.
+        """
+        if fee_history is None:
+            return False
+        if not any(fee_history.get('baseFeePerGas') or []):
+            self.eip1559 = False
+            return False
+        return True
+
+    def _check_unsupported(self, error: Exception) -> None:
+        """
+        Если нода не знает метод eth_feeHistory, сеть считается legacy и метод больше не вызывается.
+        """
+        message = str(error).lower()
+        if "not found" in message or "not supported" in message or "does not exist" in message:
+            self.eip1559 = False
+
+    def on_new_head(self, block_number: int, base_fee: int | None = None) -> None:
+        """
+        Сообщает оракулу о новом блоке. Если известен base fee блока, он используется сразу,
+        иначе кеш сбрасывается и следующий запрос комиссии обратится к сети.
+
+        :param block_number: Номер нового блока
+        :param base_fee: baseFeePerGas нового блока
+        """
+        with self._lock:
+            if self.block_number is not None and block_number <= self.block_number:
+                return
+            self.block_number = block_number
+            if base_fee is not None and self._use_eip1559 and self.priority_fee is not None:
+                self.base_fee = base_fee
+                self._fetched_at = time.monotonic()
+            else:
+                self._fetched_at = 0.0
+
+    def get_fees(self, connection: Web3) -> dict:
+        """
+        Получает поля комиссии для транзакции, обращаясь к сети не чаще раза за блок.
+
+        :param connection: Подключение к RPC-серверу сети
+        :return: {'maxFeePerGas', 'maxPriorityFeePerGas'} или {'gasPrice'} для legacy сетей
+        """
+        with self._lock:
+            if not self._is_fresh():
+                fee_history = None
+                if self.eip1559 is not False:
+                    try:
+                        fee_history = connection.eth.fee_history(
+                            self.history_blocks, 'latest', [self.priority_percentile])
+                    except Exception as e:
+                        self._check_unsupported(e)
+                        fee_history = None
+                if self._supports_eip1559(fee_history):
+                    self._apply_fee_history(fee_history)
+                else:
+                    self._apply_gas_price(connection.eth.gas_price)
+            return self._fees()
+
+    async def get_fees_async(self, connection: AsyncWeb3) -> dict:
+        """
+        Асинхронная версия get_fees для AsyncClient. Как и в get_fees, устаревшие комиссии
+        обновляет один запрос: остальные корутины ждут его, а не отправляют свои.
+
+        :param connection: Асинхронное подключение к RPC-серверу сети
+        :return: {'maxFeePerGas', 'maxPriorityFeePerGas'} или {'gasPrice'} для legacy сетей
+        """
+        if not self._is_fresh():
+            task = self._refresh_task
+            if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+                task = self._refresh_task = asyncio.ensure_future(self._refresh_async(connection))
+            await asyncio.shield(task)
+        with self._lock:
+            return self._fees()
+
+    async def _refresh_async(self, connection: AsyncWeb3) -> None:
+        fee_history = None
+        if self.eip1559 is not False:
+            try:
+                fee_history = await connection.eth.fee_history(
+                    self.history_blocks, 'latest', [self.priority_percentile])
+            except Exception as e:
+                self._check_unsupported(e)
+                fee_history = None
+        with self._lock:
+            supports_eip1559 = self._supports_eip1559(fee_history)
+            if supports_eip1559:
+                self._apply_fee_history(fee_history)
+        if not supports_eip1559:
+            gas_price = await connection.eth.gas_price
+            with self._lock:
+                self._apply_gas_price(gas_price)
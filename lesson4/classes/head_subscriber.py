@@ -0,0 +1,268 @@
+import json
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from websockets.sync.client import ClientConnection, connect
+
+from lesson4.classes.block_cache import block_cache
+from lesson4.classes.rpc_batch import RpcBatch, RpcError
+
+if TYPE_CHECKING:
+    from lesson4.classes.chain import Chain
+
+
+def _parse_head(header: dict) -> dict:
+    return {
+        'number': int(header['number'], 16),
+        'hash': header['hash'],
+        'parent_hash': header['parentHash'],
+        'timestamp': int(header['timestamp'], 16),
+        'base_fee': int(header['baseFeePerGas'], 16) if header.get('baseFeePerGas') else None,
+    }
+
+
+class _LogSubscription:
+    def __init__(self, log_filter: dict, callback: Callable[[dict], None]):
+        self.log_filter = log_filter
+        self.callback = callback
+        self.subscription_id = None  # id подписки на текущем WebSocket-соединении
+
+
+class HeadSubscriber:
+    def __init__(self, chain: "Chain", ws_rpc: str | None = None, poll_interval: float | None = None,
+                 max_backfill: int = 128, reconnect_delay: float = 1, max_reconnect_delay: float = 30,
+                 receive_timeout: float | None = None):
+        """
+        Следит за новыми блоками сети одним фоновым потоком. Если указан ws_rpc, получает заголовки
+        и логи подпиской eth_subscribe (newHeads и logs), иначе опрашивает eth_blockNumber по HTTP.
+        Каждый новый блок передается оракулу комиссий, трекеру квитанций, block_cache и подписчикам
+        add_listener. После переподключения WebSocket пропущенные блоки и логи догружаются по HTTP,
+        так что подписчики получают блоки без пропусков.
+
+        :param chain: Сеть, для HTTP-запросов используется chain.connection
+        :param ws_rpc: URL WebSocket RPC (ws:// или wss://). None - режим опроса
+        :param poll_interval: Частота опроса в режиме без WebSocket, по умолчанию половина времени блока
+        :param max_backfill: Сколько последних пропущенных блоков догружать, более старые пропускаются
+        :param reconnect_delay: Начальная пауза перед переподключением, удваивается при каждой неудаче
+        :param max_reconnect_delay: Максимальная пауза перед переподключением
+        :param receive_timeout: Сколько секунд без сообщений считать соединение зависшим,
+            по умолчанию пять времен блока, но не меньше 30 секунд
+        """
+        self.chain = chain
+        self.ws_rpc = ws_rpc
+        self.poll_interval = poll_interval if poll_interval is not None else max(chain.block_time / 2, 0.1)
+        self.max_backfill = max_backfill
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.receive_timeout = receive_timeout if receive_timeout is not None else max(chain.block_time * 5, 30)
+        self.block_number = None  # Последний отданный подписчикам блок
+        self.block_hash = None
+        self.connected = False
+        self.reconnects = 0
+        self._listeners = [self._update_chain]
+        self._log_subscriptions = []
+        self._logs_through = None  # До какого блока включительно логи уже отданы
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._websocket = None
+
+    @property
+    def mode(self) -> str:
+        return "websocket" if self.ws_rpc else "polling"
+
+    def add_listener(self, callback: Callable[[dict], None]) -> None:
+        """
+        Подписывает функцию на новые блоки.
+
+        :param callback: Функция, принимающая словарь {'number', 'hash', 'parent_hash', 'timestamp', 'base_fee'}
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def subscribe_logs(self, log_filter: dict, callback: Callable[[dict], None]) -> None:
+        """
+        Подписывает функцию на логи, подходящие под фильтр. Логи приходят сырыми, как в eth_getLogs.
+        При реорганизации нода присылает отмененные логи с 'removed': True. После переподключения
+        логи последнего полученного блока могут прийти повторно, но не теряются.
+
+        :param log_filter: Фильтр {'address', 'topics'} без диапазона блоков
+        :param callback: Функция, принимающая лог
+        """
+        with self._lock:
+            self._log_subscriptions.append(_LogSubscription(log_filter, callback))
+
+    def start(self) -> "HeadSubscriber":
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                target = self._run_websocket if self.ws_rpc else self._run_polling
+                self._thread = threading.Thread(target=target, name=f"heads-{self.chain.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        websocket = self._websocket
+        if websocket is not None:
+            websocket.close()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _update_chain(self, head: dict) -> None:
+        self.chain.fee_oracle.on_new_head(head['number'], head['base_fee'])
+        self.chain.receipt_tracker.on_new_head(head['number'])
+        block_cache.on_new_head(self.chain.id, head['number'], head['hash'])
+
+    def _emit_head(self, head: dict) -> None:
+        if head['hash'] == self.block_hash:
+            return
+        self.block_number = head['number']
+        self.block_hash = head['hash']
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(head)
+            except Exception as e:
+                print(f"Error occurred in new head listener: {e}")
+
+    @staticmethod
+    def _emit_log(subscription: _LogSubscription, log: dict) -> None:
+        try:
+            subscription.callback(log)
+        except Exception as e:
+            print(f"Error occurred in log listener: {e}")
+
+    def _request(self, method: str, params: list):
+        response = self.chain.connection.provider.make_request(method, params)
+        if 'error' in response:
+            raise RpcError(response['error'])
+        return response['result']
+
+    def _backfill(self, to_block: int) -> None:
+        """
+        Догружает по HTTP заголовки и логи блоков после последнего отданного до to_block включительно.
+        """
+        if self.block_number is None or to_block <= self.block_number:
+            return
+        from_block = max(self.block_number + 1, to_block - self.max_backfill + 1)
+        batch = RpcBatch(self.chain.connection)
+        items = [batch.add("eth_getBlockByNumber", [hex(number), False])
+                 for number in range(from_block, to_block + 1)]
+        batch.execute()
+        for number, item in zip(range(from_block, to_block + 1), items):
+            if item.error is not None or item.result is None:
+                raise RuntimeError(f"Failed to get block {number}: {item.error}")
+            self._emit_head(_parse_head(item.result))
+        logs_from = max(to_block - self.max_backfill + 1,
+                        self._logs_through + 1 if self._logs_through is not None else from_block)
+        with self._lock:
+            subscriptions = list(self._log_subscriptions) if logs_from <= to_block else []
+        for subscription in subscriptions:
+            log_filter = {**subscription.log_filter, 'fromBlock': hex(logs_from), 'toBlock': hex(to_block)}
+            for log in self._request("eth_getLogs", [log_filter]):
+                self._emit_log(subscription, log)
+        self._logs_through = to_block
+
+    def _poll(self) -> None:
+        """
+        Один шаг опроса: если появились новые блоки, отдает их заголовки и логи по порядку.
+        """
+        latest = int(self._request("eth_blockNumber", []), 16)
+        if self.block_number is None:
+            self._logs_through = latest
+            self._emit_head(_parse_head(self._request("eth_getBlockByNumber", [hex(latest), False])))
+        else:
+            self._backfill(latest)
+
+    def _run_polling(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Error occurred while polling new heads: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _subscribe(self, websocket: ClientConnection, request_id: int, params: list) -> int:
+        websocket.send(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_subscribe', 'params': params}))
+        return request_id
+
+    def _send_new_subscriptions(self, websocket: ClientConnection, requests: dict, next_id: int) -> int:
+        with self._lock:
+            subscriptions = [subscription for subscription in self._log_subscriptions
+                             if subscription.subscription_id is None and subscription not in requests.values()]
+        for subscription in subscriptions:
+            requests[self._subscribe(websocket, next_id, ["logs", subscription.log_filter])] = subscription
+            next_id += 1
+        return next_id
+
+    def _listen(self, websocket: ClientConnection) -> None:
+        with self._lock:
+            for subscription in self._log_subscriptions:
+                subscription.subscription_id = None
+        requests = {self._subscribe(websocket, 1, ["newHeads"]): None}  # id запроса -> подписка на логи
+        next_id = self._send_new_subscriptions(websocket, requests, 2)
+        heads_id = None
+        logs = {}  # id подписки -> подписка на логи
+        backfilled = False
+        last_message = time.monotonic()
+        while not self._stop.is_set():
+            next_id = self._send_new_subscriptions(websocket, requests, next_id)
+            try:
+                message = json.loads(websocket.recv(timeout=1))
+            except TimeoutError:
+                if time.monotonic() - last_message > self.receive_timeout:
+                    raise TimeoutError(f"No messages for {self.receive_timeout:.0f}s")
+                continue
+            last_message = time.monotonic()
+            if 'id' in message and message['id'] in requests:
+                subscription = requests.pop(message['id'])
+                if 'error' in message:
+                    raise RpcError(message['error'])
+                if subscription is None:
+                    heads_id = message['result']
+                else:
+                    subscription.subscription_id = message['result']
+                    logs[message['result']] = subscription
+                continue
+            if message.get('method') != 'eth_subscription':
+                continue
+            params = message['params']
+            if params['subscription'] == heads_id:
+                head = _parse_head(params['result'])
+                if not backfilled:
+                    # Первый блок после (пере)подключения: все, что было между ним и последним
+                    # отданным блоком, подписка не пришлет, догружаем по HTTP
+                    self._backfill(head['number'] - 1)
+                    backfilled = True
+                # Логи этого блока приходят отдельными уведомлениями и могут еще не дойти, поэтому блок
+                # считается полученным только до предыдущего: при обрыве догрузка начнется с него
+                self._logs_through = max(self._logs_through or 0, head['number'] - 1)
+                self._emit_head(head)
+            elif params['subscription'] in logs:
+                self._emit_log(logs[params['subscription']], params['result'])
+
+    def _run_websocket(self) -> None:
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                with connect(self.ws_rpc, open_timeout=self.chain.request_timeout, max_size=2 ** 24) as websocket:
+                    self._websocket = websocket
+                    self.connected = True
+                    delay = self.reconnect_delay
+                    self._listen(websocket)
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"WebSocket {self.ws_rpc} disconnected: {e}")
+            finally:
+                self._websocket = None
+                self.connected = False
+            if self._stop.is_set():
+                return
+            self.reconnects += 1
+            self._stop.wait(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, self.max_reconnect_delay)
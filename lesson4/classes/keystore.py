@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from multiprocessing import Pool
+from typing import Iterable
+
+from eth_account import Account
+
+
+class KeystoreCache:
+    def __init__(self):
+        """
+        Кеш расшифрованных ключей на время работы процесса. Ничего не пишет на диск.
+        Ключ записи зависит и от keystore, и от пароля, поэтому неверный пароль не найдет запись.
+        """
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(keystore: dict, password: str) -> bytes:
+        return hashlib.sha256(keystore['crypto']['mac'].encode() + b"\0" + password.encode()).digest()
+
+    def get(self, keystore: dict, password: str) -> str | None:
+        with self._lock:
+            return self._keys.get(self._key(keystore, password))
+
+    def put(self, keystore: dict, password: str, private_key: str) -> None:
+        with self._lock:
+            self._keys[self._key(keystore, password)] = private_key
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = {}
+
+
+def _decrypt(args: tuple[dict, str]) -> tuple[str | None, str | None, str | None]:
+    """
+    Расшифровывает keystore и сверяет адрес ключа с полем address, если оно есть.
+
+    :return: (адрес, приватный ключ, None) или (None, None, текст ошибки)
+    """
+    keystore, password = args
+    try:
+        private_key = "0x" + bytes(Account.decrypt(keystore, password)).hex()
+        address = Account.from_key(private_key).address
+    except Exception as e:
+        return None, None, str(e)
+    if 'address' in keystore and keystore['address'].lower().removeprefix("0x") != address[2:].lower():
+        return None, None, f"key belongs to {address}, not to {keystore['address']}"
+    return address, private_key, None
+
+
+def _encrypt(args: tuple[str, str, str | None, int | None]) -> dict:
+    private_key, password, kdf, iterations = args
+    return Account.encrypt(private_key, password, kdf=kdf, iterations=iterations)
+
+
+def _read_keystore(path: str) -> dict:
+    with open(path) as file:
+        keystore = json.load(file)
+    if 'crypto' not in keystore and 'Crypto' in keystore:
+        keystore['crypto'] = keystore.pop('Crypto')
+    return keystore
+
+
+def keystore_paths(path: str) -> list[str]:
+    """
+    :param path: Файл keystore или папка с ними
+    :return: Пути к файлам keystore в алфавитном порядке
+    """
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if not name.startswith(".") and os.path.isfile(os.path.join(path, name)))
+
+
+def load_keystores(paths: Iterable[str], password: str, processes: int | None = None,
+                   cache: KeystoreCache | None = None) -> list[tuple[str, str]]:
+    """
+    Расшифровывает V3 keystore в пуле процессов. scrypt занимает сотни миллисекунд CPU на файл,
+    поэтому время загрузки делится на число ядер. Ключи из cache не расшифровываются повторно.
+
+    :param paths: Пути к файлам keystore
+    :param password: Пароль keystore
+    :param processes: Количество процессов, по умолчанию по числу ядер
+    :param cache: Кеш расшифрованных ключей, например keystore_cache
+    :return: Пары (адрес, приватный ключ) в порядке файлов. Адрес выводится из ключа
+    :raises ValueError: Если хотя бы один keystore не удалось расшифровать или его ключ не совпал с полем address
+    """
+    paths = list(paths)
+    keystores = [_read_keystore(path) for path in paths]
+    cached = [cache.get(keystore, password) if cache is not None else None for keystore in keystores]
+    results = [(Account.from_key(private_key).address, private_key) if private_key is not None else None
+               for private_key in cached]
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        started = time.monotonic()
+        tasks = [(keystores[index], password) for index in missing]
+        if len(tasks) == 1:
+            decrypted = [_decrypt(tasks[0])]
+        else:
+            with Pool(min(processes or os.cpu_count() or 1, len(tasks))) as pool:
+                decrypted = pool.map(_decrypt, tasks, chunksize=1)
+        errors = []
+        for index, (address, private_key, error) in zip(missing, decrypted):
+            if error is not None:
+                errors.append(f"{paths[index]}: {error}")
+                continue
+            results[index] = (address, private_key)
+            if cache is not None:
+                cache.put(keystores[index], password, private_key)
+        if errors:
+            raise ValueError(f"Failed to decrypt {len(errors)} keystores: {'; '.join(errors[:5])}")
+        print(f"Decrypted {len(missing)} keystores in {time.monotonic() - started:.1f}s")
+    return results
+
+
+def write_keystores(accounts: Iterable[list[str] | str], directory: str, password: str,
+                    processes: int | None = None, kdf: str | None = None, iterations: int | None = None) -> list[str]:
+    """
+    Шифрует ключи в V3 keystore в пуле процессов и сохраняет их в папку, по файлу на кошелек.
+
+    :param accounts: Приватные ключи или списки [address, mnemonic, private_key] из lesson2.generate_account
+    :param directory: Папка для файлов
+    :param password: Пароль keystore
+    :param processes: Количество процессов, по умолчанию по числу ядер
+    :param kdf: 'scrypt' или 'pbkdf2', по умолчанию как в eth_account
+    :param iterations: Параметр сложности kdf, по умолчанию как в eth_account
+    :return: Пути к записанным файлам
+    """
+    private_keys = [account if isinstance(account, str) else account[-1] for account in accounts]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with Pool(processes) as pool:
+        tasks = ((private_key, password, kdf, iterations) for private_key in private_keys)
+        for keystore in pool.imap(_encrypt, tasks, chunksize=1):
+            timestamp = time.strftime("%Y-%m-%dT%H-%M-%S", time.gmtime())
+            path = os.path.join(directory, f"UTC--{timestamp}--{keystore['address']}")
+            with open(path, "w") as file:
+                json.dump(keystore, file)
+            paths.append(path)
+    return paths
+
+
+keystore_cache = KeystoreCache()
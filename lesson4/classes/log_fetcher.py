@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from web3 import Web3
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.rpc_batch import RpcError
+
+# Фрагменты ошибок, которыми провайдеры отвечают на слишком большой диапазон или слишком много логов
+RANGE_ERRORS = (
+    "more than", "too many", "limit exceeded", "range is too large", "range too large", "block range",
+    "response size", "exceeds", "timeout", "timed out", "query returned",
+)
+
+
+class LogFetcher:
+    def __init__(self, connection: Web3, tokens: list[str] | None = None,
+                 events: tuple[str, ...] = ("Transfer", "Approval"), chunk_blocks: int = 2000,
+                 min_chunk_blocks: int = 1, max_chunk_blocks: int = 100_000, target_logs: int = 5000,
+                 concurrency: int = 4):
+        """
+        Скачивает ERC20 логи Transfer и Approval за большие диапазоны блоков через eth_getLogs.
+        Размер диапазона подстраивается под провайдера: при ошибке "слишком много результатов"
+        или таймауте диапазон делится пополам, а если логов мало - следующий диапазон удваивается.
+        Несколько диапазонов запрашиваются параллельно, события отдаются по порядку блоков.
+
+        :param connection: Подключение к RPC-серверу
+        :param tokens: Адреса токенов. None - логи всех контрактов
+        :param events: Имена событий из ERC20 ABI
+        :param chunk_blocks: Начальный размер диапазона
+        :param min_chunk_blocks: Минимальный размер диапазона, меньше которого делить нельзя
+        :param max_chunk_blocks: Максимальный размер диапазона
+        :param target_logs: Сколько логов желательно получать одним запросом
+        :param concurrency: Сколько запросов eth_getLogs выполняется одновременно
+        """
+        self.connection = connection
+        self.tokens = [Web3.to_checksum_address(token) for token in tokens] if tokens else None
+        self.chunk_blocks = chunk_blocks
+        self.min_chunk_blocks = min_chunk_blocks
+        self.max_chunk_blocks = max_chunk_blocks
+        self.target_logs = target_logs
+        self.concurrency = concurrency
+        self._events = {}  # topic0 -> (имя события, имена аргументов)
+        for item in abi_registry.abi("erc20"):
+            if item.get('type') == 'event' and item['name'] in events:
+                self._events[abi_registry.topic("erc20", item['name'])] = (
+                    item['name'], [argument['name'] for argument in item['inputs']])
+        self._lock = threading.Lock()
+
+    def _get_logs(self, from_block: int, to_block: int, log_filter: dict | None = None) -> list[dict]:
+        if log_filter is None:
+            log_filter = {'topics': [list(self._events)]}
+            if self.tokens is not None:
+                log_filter['address'] = self.tokens
+        log_filter = {**log_filter, 'fromBlock': hex(from_block), 'toBlock': hex(to_block)}
+        response = self.connection.provider.make_request("eth_getLogs", [log_filter])
+        if 'error' in response:
+            raise RpcError(response['error'])
+        return response['result']
+
+    def fetch_range(self, from_block: int, to_block: int, log_filter: dict | None = None) -> list[dict]:
+        """
+        Загружает сырые логи диапазона, деля его пополам, пока провайдер отказывается отвечать.
+
+        :param from_block: Первый блок
+        :param to_block: Последний блок (включительно)
+        :param log_filter: Фильтр {'address', 'topics'} без диапазона блоков. По умолчанию события и токены
+            этого LogFetcher
+        :return: Логи как в ответе eth_getLogs
+        """
+        try:
+            logs = self._get_logs(from_block, to_block, log_filter)
+        except Exception as e:
+            size = to_block - from_block + 1
+            if size <= self.min_chunk_blocks or not _is_range_error(e):
+                raise
+            with self._lock:
+                self.chunk_blocks = max(self.min_chunk_blocks, min(self.chunk_blocks, size // 2))
+            middle = from_block + size // 2
+            return (self.fetch_range(from_block, middle - 1, log_filter)
+                    + self.fetch_range(middle, to_block, log_filter))
+        with self._lock:
+            if len(logs) < self.target_logs // 2:
+                grown = max(self.chunk_blocks, (to_block - from_block + 1) * 2)
+                self.chunk_blocks = min(self.max_chunk_blocks, grown)
+            elif len(logs) > self.target_logs:
+                self.chunk_blocks = max(self.min_chunk_blocks, self.chunk_blocks // 2)
+        return logs
+
+    def _decode(self, log: dict) -> dict | None:
+        event = self._events.get(log['topics'][0]) if log['topics'] else None
+        # ERC721 Transfer и Approval имеют 4 топика, их пропускаем
+        if event is None or len(log['topics']) != 3:
+            return None
+        name, arguments = event
+        return {
+            'event': name,
+            'token': Web3.to_checksum_address(log['address']),
+            arguments[0]: Web3.to_checksum_address("0x" + log['topics'][1][-40:]),
+            arguments[1]: Web3.to_checksum_address("0x" + log['topics'][2][-40:]),
+            arguments[2]: int(log['data'], 16) if log['data'] != "0x" else 0,
+            'block_number': int(log['blockNumber'], 16),
+            'transaction_hash': log['transactionHash'],
+            'log_index': int(log['logIndex'], 16),
+        }
+
+    def iter_events(self, from_block: int, to_block: int,
+                    checkpoint_path: str | None = None) -> Iterator[dict]:
+        """
+        Отдает декодированные события по порядку блоков. Если указан checkpoint_path, после того как
+        все события диапазона отданы, в файл записывается следующий блок, и повторный вызов
+        продолжит с него. События последнего незавершенного диапазона при этом могут прийти повторно.
+
+        :param from_block: Первый блок
+        :param to_block: Последний блок (включительно)
+        :param checkpoint_path: Файл чекпоинта
+        :return: Генератор словарей {'event', 'token', аргументы события, 'block_number', 'transaction_hash',
+            'log_index'}
+        """
+        start = from_block
+        if checkpoint_path is not None:
+            checkpoint = _read_checkpoint(checkpoint_path)
+            if checkpoint is not None:
+                start = max(start, checkpoint['next_block'])
+                self.chunk_blocks = checkpoint.get('chunk_blocks', self.chunk_blocks)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="log-fetcher") as executor:
+            in_flight = deque()
+            while start <= to_block or in_flight:
+                while start <= to_block and len(in_flight) < self.concurrency:
+                    end = min(start + self.chunk_blocks - 1, to_block)
+                    in_flight.append((end, executor.submit(self.fetch_range, start, end)))
+                    start = end + 1
+                end, future = in_flight.popleft()
+                for log in future.result():
+                    event = self._decode(log)
+                    if event is not None:
+                        yield event
+                if checkpoint_path is not None:
+                    _write_checkpoint(checkpoint_path, {'next_block': end + 1, 'chunk_blocks': self.chunk_blocks})
+
+
+def _is_range_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERRORS) or getattr(error, 'code', None) == -32005
+
+
+def _read_checkpoint(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    from lesson4.classes.chain import chains
+    from lesson4.modules.crosscurve.config import USDT_ARB
+
+    chain = chains["arbitrum"]
+    latest = chain.connection.eth.block_number
+    fetcher = LogFetcher(chain.connection, tokens=[USDT_ARB])
+    for number, event in enumerate(fetcher.iter_events(latest - 10_000, latest, "usdt_logs.checkpoint.json")):
+        if number < 5:
+            print(event)
@@ -0,0 +1,200 @@
+import requests
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.rpc_router import EndpointError
+
+# Multicall3 задеплоен на один и тот же адрес почти во всех EVM сетях
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+# Ответы, которыми нода отклоняет tryAggregate из-за размера пачки: нехватка газа или слишком большой запрос/ответ.
+# Только после них пачку имеет смысл делить пополам
+SPLIT_ERRORS = (
+    "out of gas", "gas required exceeds", "exceeds block gas limit", "gas limit", "response size", "too large",
+    "payload", "413",
+)
+# Ошибки связи с RPC: делить пачку бесполезно, они передаются вызывающему коду сразу
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, EndpointError)
+
+
+class Multicall:
+    def __init__(self, connection: Web3, address: str = MULTICALL3_ADDRESS, max_calldata_bytes: int = 120_000,
+                 max_gas: int = 25_000_000, gas_per_call: int = 30_000):
+        """
+        :param connection: Подключение к RPC-серверу
+        :param address: Адрес контракта Multicall3
+        :param max_calldata_bytes: Максимальный размер calldata одного вызова tryAggregate
+        :param max_gas: Максимальный газ одного вызова tryAggregate
+        :param gas_per_call: Оценка газа на один вложенный вызов
+        """
+        self.connection = connection
+        self.address = Web3.to_checksum_address(address)
+        self.contract = abi_registry.contract(connection, "multicall3", self.address)
+        self.erc20 = abi_registry.contract(connection, "erc20")
+        self.max_calldata_bytes = max_calldata_bytes
+        self.max_gas = max_gas
+        self.gas_per_call = gas_per_call
+        self._available = None
+
+    def is_available(self) -> bool:
+        """
+        Проверяет, задеплоен ли Multicall3 в сети. Результат запоминается.
+
+        :return: True если контракт есть в сети
+        """
+        if self._available is None:
+            try:
+                self._available = len(self.connection.eth.get_code(self.address)) > 0
+            except Exception as e:
+                print(f"Error occurred while checking Multicall3 code: {e}")
+                self._available = False
+        return self._available
+
+    def _chunks(self, calls: list[tuple[str, bytes]]) -> list[list[tuple[str, bytes]]]:
+        """
+        Делит вызовы на пачки так, чтобы каждая укладывалась в лимиты calldata и газа.
+
+        :param calls: Список пар (адрес контракта, calldata)
+        :return: Список пачек вызовов
+        """
+        max_calls_by_gas = max(1, self.max_gas // self.gas_per_call)
+        chunks = []
+        chunk = []
+        chunk_size = 0
+        for target, data in calls:
+            # Кортеж (address, bytes) в ABI: адрес, оффсет, длина и данные, выровненные до 32 байт
+            call_size = 32 * 4 + (len(data) + 31) // 32 * 32
+            if chunk and (chunk_size + call_size > self.max_calldata_bytes or len(chunk) >= max_calls_by_gas):
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append((target, data))
+            chunk_size += call_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _call_single(self, target: str, data: bytes, block_identifier) -> bytes | None:
+        """
+        Выполняет один eth_call без Multicall3.
+
+        :return: Ответ вызова или None, если вызов завершился ошибкой
+        :raises requests.RequestException: Если RPC недоступен
+        """
+        try:
+            return bytes(self.connection.eth.call({'to': target, 'data': data}, block_identifier))
+        except TRANSPORT_ERRORS:
+            raise
+        except Exception:
+            return None
+
+    def _aggregate_chunk(self, chunk: list[tuple[str, bytes]], block_identifier) -> list[bytes | None]:
+        """
+        Выполняет пачку вызовов через tryAggregate. Если нода отклонила пачку целиком
+        (лимит газа или размера ответа), пачка делится пополам.
+
+        :return: Ответы вызовов, None для неуспешных
+        :raises Exception: Ошибки связи с RPC и прочие ошибки, не связанные с размером пачки
+        """
+        try:
+            results = self.contract.functions.tryAggregate(False, chunk).call(block_identifier=block_identifier)
+            return [bytes(data) if success else None for success, data in results]
+        except Exception as e:
+            if not _is_split_error(e):
+                raise
+            if len(chunk) == 1:
+                return [self._call_single(chunk[0][0], chunk[0][1], block_identifier)]
+            print(f"Multicall chunk of {len(chunk)} calls failed, splitting: {e}")
+            middle = len(chunk) // 2
+            return (self._aggregate_chunk(chunk[:middle], block_identifier)
+                    + self._aggregate_chunk(chunk[middle:], block_identifier))
+
+    def try_aggregate(self, calls: list[tuple[str, bytes | str]], block_identifier='latest') -> list[bytes | None]:
+        """
+        Выполняет произвольные вызовы пачками через Multicall3.tryAggregate.
+        В сетях без Multicall3 делает обычные eth_call по одному.
+
+        :param calls: Список пар (адрес контракта, calldata в байтах или hex-строке)
+        :param block_identifier: Блок, на котором выполняются вызовы
+        :return: Ответы в том же порядке, None для неуспешных вызовов
+        """
+        calls = [(Web3.to_checksum_address(target), data if isinstance(data, bytes) else Web3.to_bytes(hexstr=data))
+                 for target, data in calls]
+        if not self.is_available():
+            return [self._call_single(target, data, block_identifier) for target, data in calls]
+        results = []
+        for chunk in self._chunks(calls):
+            results.extend(self._aggregate_chunk(chunk, block_identifier))
+        return results
+
+    def get_balances(self, wallets: list[str], tokens: list[str | None],
+                     block_identifier='latest') -> list[list[float | None]]:
+        """
+        Получает балансы всех кошельков по всем токенам. decimals читаются в той же пачке.
+
+        :param wallets: Адреса кошельков
+        :param tokens: Адреса ERC20-токенов, None означает нативную монету
+        :param block_identifier: Блок, на котором читаются балансы
+        :return: Матрица балансов [кошелек][токен], None если баланс не удалось получить
+        """
+        wallets = [Web3.to_checksum_address(wallet) for wallet in wallets]
+        tokens = [None if token is None else Web3.to_checksum_address(token) for token in tokens]
+        erc20_tokens = [token for token in dict.fromkeys(tokens) if token is not None]
+        native_via_rpc = None in tokens and not self.is_available()
+
+        calls = [(token, self.erc20.encode_abi("decimals")) for token in erc20_tokens]
+        for wallet in wallets:
+            for token in tokens:
+                if token is None:
+                    if not native_via_rpc:
+                        calls.append((self.address, self.contract.encode_abi("getEthBalance", args=[wallet])))
+                else:
+                    calls.append((token, self.erc20.encode_abi("balanceOf", args=[wallet])))
+        results = iter(self.try_aggregate(calls, block_identifier))
+
+        decimals = {None: 18}
+        for token in erc20_tokens:
+            decimals[token] = _decode_uint(next(results))
+
+        matrix = []
+        for wallet in wallets:
+            row = []
+            for token in tokens:
+                if token is None and native_via_rpc:
+                    try:
+                        balance_wei = self.connection.eth.get_balance(wallet, block_identifier)
+                    except Exception:
+                        balance_wei = None
+                else:
+                    balance_wei = _decode_uint(next(results))
+                if balance_wei is None or decimals[token] is None:
+                    row.append(None)
+                else:
+                    row.append(balance_wei / (10 ** decimals[token]))
+            matrix.append(row)
+        return matrix
+
+
+def _is_split_error(error: Exception) -> bool:
+    """
+    Проверяет, что tryAggregate отклонен из-за размера пачки. tryAggregate(False, ...) не откатывается
+    из-за неуспешных вложенных вызовов, поэтому revert всей пачки означает нехватку газа.
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return False
+    if isinstance(error, ContractLogicError):
+        return True
+    message = str(error).lower()
+    return any(fragment in message for fragment in SPLIT_ERRORS)
+
+
+def _decode_uint(data: bytes | None) -> int | None:
+    """
+    Декодирует uint256 из ответа eth_call.
+
+    :param data: Ответ вызова
+    :return: Число или None если ответа нет
+    """
+    if data is None or len(data) < 32:
+        return None
+    return int.from_bytes(data[:32], 'big')
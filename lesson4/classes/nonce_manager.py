@@ -0,0 +1,144 @@
+import heapq
+import threading
+
+from web3 import AsyncWeb3, Web3
+
+# Фрагменты ошибок нод, после которых локальный счетчик nonce больше нельзя считать верным
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "already known",
+    "known transaction",
+    "replacement transaction underpriced",
+    "invalid nonce",
+)
+
+
+class _WalletNonce:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_nonce = None  # None означает, что счетчик нужно синхронизировать с сетью
+        self.released = []  # Куча выданных, но не отправленных nonce, которые нужно переиспользовать
+
+
+class NonceManager:
+    def __init__(self):
+        """
+        Локальный распределитель nonce для пар (сеть, адрес). Синхронизируется с сетью один раз
+        по pending-счетчику, дальше выдает nonce без обращений к RPC, поэтому один кошелек может
+        отправить десятки транзакций подряд, не дожидаясь их включения в блок.
+        """
+        self._wallets = {}
+        self._lock = threading.Lock()
+
+    def _wallet(self, chain_id: int, address: str) -> _WalletNonce:
+        key = (chain_id, address.lower())
+        with self._lock:
+            wallet = self._wallets.get(key)
+            if wallet is None:
+                wallet = self._wallets[key] = _WalletNonce()
+            return wallet
+
+    @staticmethod
+    def _take(wallet: _WalletNonce) -> int:
+        """
+        Выдает nonce: сначала закрывает пропуски из освобожденных, затем берет следующий.
+        """
+        if wallet.released:
+            return heapq.heappop(wallet.released)
+        nonce = wallet.next_nonce
+        wallet.next_nonce += 1
+        return nonce
+
+    def allocate(self, chain_id: int, address: str, connection: Web3) -> int:
+        """
+        Выдает следующий nonce для адреса. При первом вызове или после resync читает pending-счетчик.
+
+        :param chain_id: ID сети
+        :param address: Адрес отправителя
+        :param connection: Подключение к RPC-серверу этой сети
+        :return: nonce для новой транзакции
+        """
+        wallet = self._wallet(chain_id, address)
+        with wallet.lock:
+            if wallet.next_nonce is None:
+                wallet.next_nonce = connection.eth.get_transaction_count(Web3.to_checksum_address(address), 'pending')
+                wallet.released = []
+            return self._take(wallet)
+
+    async def allocate_async(self, chain_id: int, address: str, connection: AsyncWeb3) -> int:
+        """
+        Асинхронная версия allocate для AsyncClient.
+
+        :param chain_id: ID сети
+        :param address: Адрес отправителя
+        :param connection: Асинхронное подключение к RPC-серверу этой сети
+        :return: nonce для новой транзакции
+        """
+        wallet = self._wallet(chain_id, address)
+        if wallet.next_nonce is None:
+            pending = await connection.eth.get_transaction_count(Web3.to_checksum_address(address), 'pending')
+            with wallet.lock:
+                if wallet.next_nonce is None:
+                    wallet.next_nonce = pending
+                    wallet.released = []
+        with wallet.lock:
+            return self._take(wallet)
+
+    def release(self, chain_id: int, address: str, nonce: int) -> None:
+        """
+        Возвращает nonce транзакции, которая не была отправлена, чтобы не оставить пропуск.
+
+        :param chain_id: ID сети
+        :param address: Адрес отправителя
+        :param nonce: Неиспользованный nonce
+        """
+        wallet = self._wallet(chain_id, address)
+        with wallet.lock:
+            if wallet.next_nonce is None or nonce >= wallet.next_nonce or nonce in wallet.released:
+                return
+            if nonce == wallet.next_nonce - 1:
+                wallet.next_nonce -= 1
+            else:
+                heapq.heappush(wallet.released, nonce)
+
+    def resync(self, chain_id: int, address: str) -> None:
+        """
+        Сбрасывает локальный счетчик: следующий allocate заново прочитает pending-счетчик из сети.
+
+        :param chain_id: ID сети
+        :param address: Адрес отправителя
+        """
+        wallet = self._wallet(chain_id, address)
+        with wallet.lock:
+            wallet.next_nonce = None
+            wallet.released = []
+
+    def handle_error(self, chain_id: int, address: str, nonce: int, error: Exception) -> None:
+        """
+        Обрабатывает ошибку отправки транзакции: при ошибке nonce счетчик синхронизируется заново,
+        при любой другой ошибке nonce возвращается для повторного использования.
+
+        :param chain_id: ID сети
+        :param address: Адрес отправителя
+        :param nonce: nonce неотправленной транзакции
+        :param error: Исключение, полученное при отправке
+        """
+        if is_nonce_error(error):
+            self.resync(chain_id, address)
+        else:
+            self.release(chain_id, address, nonce)
+
+
+def is_nonce_error(error: Exception) -> bool:
+    """
+    Проверяет, что нода отклонила транзакцию из-за nonce.
+
+    :param error: Исключение, полученное при отправке
+    :return: True если ошибка связана с nonce
+    """
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+nonce_manager = NonceManager()
@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int | None = None):
+        """
+        Потокобезопасный token bucket: не больше rate запросов в секунду, с запасом burst подряд.
+
+        :param rate: Сколько токенов добавляется в секунду
+        :param burst: Емкость корзины. По умолчанию равна rate (но не меньше 1)
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Берет токены, если они есть, не дожидаясь.
+
+        :param tokens: Сколько токенов нужно
+        :return: True если токены получены
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> None:
+        """
+        Ждет, пока в корзине появятся токены, и берет их.
+
+        :param tokens: Сколько токенов нужно
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Забирает токены на seconds секунд вперед, например после ответа 429 от сервера.
+
+        :param seconds: На сколько секунд приостановить выдачу токенов
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
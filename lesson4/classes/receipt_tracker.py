@@ -0,0 +1,277 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from web3 import Web3
+
+from lesson4.classes.rpc_batch import RpcBatch, RpcError
+
+# Ответы ноды, которые означают, что eth_getBlockReceipts не поддерживается, а не временный сбой
+UNSUPPORTED_METHOD_CODE = -32601
+UNSUPPORTED_METHOD_ERRORS = ("method not found", "not supported", "unsupported", "does not exist")
+
+
+class TransactionReplaced(Exception):
+    pass
+
+
+class TransactionDropped(Exception):
+    pass
+
+
+class _PendingTransaction:
+    def __init__(self, tx_hash: str, future: Future, deadline: float, block_number: int | None,
+                 sender: str | None, nonce: int | None):
+        self.tx_hash = tx_hash
+        self.future = future
+        self.deadline = deadline
+        self.first_block = block_number
+        self.sender = sender
+        self.nonce = nonce
+        self.missing_since = None  # С какого момента нода не знает о транзакции
+        self.checked = False  # Запрашивалась ли квитанция по хешу хотя бы раз
+
+
+class ReceiptTracker:
+    def __init__(self, connection_getter: Callable[[], Web3], block_time: float = 12, default_timeout: float = 300,
+                 check_after_blocks: int = 3, drop_after: float = 60, use_block_receipts: bool = True):
+        """
+        Отслеживает множество отправленных транзакций одним фоновым потоком. Раз в новый блок
+        запрашивает квитанции всех ожидающих транзакций одним JSON-RPC batch (или eth_getBlockReceipts,
+        если нода его поддерживает), а не опрашивает каждый хеш отдельно.
+
+        :param connection_getter: Функция, возвращающая текущее подключение сети
+        :param block_time: Среднее время блока, задает частоту опроса
+        :param default_timeout: Сколько секунд ждать квитанцию по умолчанию
+        :param check_after_blocks: Через сколько блоков без квитанции проверять, не пропала ли транзакция
+        :param drop_after: Через сколько секунд отсутствия у ноды транзакция считается выброшенной
+        :param use_block_receipts: Пробовать ли eth_getBlockReceipts вместо квитанций по хешам
+        """
+        self._connection_getter = connection_getter
+        self.poll_interval = max(block_time / 2, 0.1)
+        self.default_timeout = default_timeout
+        self.check_after_blocks = check_after_blocks
+        self.drop_after = drop_after
+        self.use_block_receipts = use_block_receipts
+        self.block_number = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._new_head = threading.Event()
+        self._thread = None
+
+    def track(self, tx_hash: str, callback: Callable[[Future], None] | None = None, timeout: float | None = None,
+              sender: str | None = None, nonce: int | None = None) -> Future:
+        """
+        Ставит транзакцию на отслеживание.
+
+        :param tx_hash: Хеш транзакции
+        :param callback: Функция, которая будет вызвана с Future после получения результата
+        :param timeout: Сколько секунд ждать квитанцию
+        :param sender: Адрес отправителя, позволяет быстрее распознать замену транзакции
+        :param nonce: nonce транзакции
+        :return: Future со словарем {'tx_hash', 'status', 'block_number', 'gas_used', 'effective_gas_price'}.
+            Исключения: TimeoutError, TransactionReplaced, TransactionDropped
+        """
+        tx_hash = tx_hash.lower()
+        with self._lock:
+            pending = self._pending.get(tx_hash)
+            if pending is None:
+                future = Future()
+                deadline = time.monotonic() + (timeout if timeout is not None else self.default_timeout)
+                pending = _PendingTransaction(tx_hash, future, deadline, self.block_number, sender, nonce)
+                self._pending[tx_hash] = pending
+            self._ensure_thread()
+        if callback is not None:
+            pending.future.add_done_callback(callback)
+        return pending.future
+
+    def wait(self, tx_hash: str, timeout: float | None = None) -> dict:
+        """
+        Блокирующее ожидание квитанции транзакции.
+
+        :param tx_hash: Хеш транзакции
+        :param timeout: Сколько секунд ждать квитанцию
+        :return: Словарь с результатом транзакции
+        :raises TimeoutError: Если квитанция не получена за timeout, в том числе когда RPC недоступен
+        """
+        timeout = timeout if timeout is not None else self.default_timeout
+        return self.track(tx_hash, timeout=timeout).result(timeout)
+
+    def on_new_head(self, block_number: int) -> None:
+        """
+        Сообщает о новом блоке из внешнего источника (например подписки), чтобы не ждать следующего опроса.
+
+        :param block_number: Номер нового блока
+        """
+        if self.block_number is None or block_number > self.block_number:
+            self._new_head.set()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="receipt-tracker", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error occurred while polling receipts: {e}")
+            self._new_head.wait(self.poll_interval)
+            self._new_head.clear()
+
+    def _resolve(self, pending: _PendingTransaction, result: dict | None = None,
+                 error: Exception | None = None) -> None:
+        with self._lock:
+            self._pending.pop(pending.tx_hash, None)
+        if pending.future.done():
+            return
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(result)
+
+    def poll(self) -> None:
+        """
+        Один шаг опроса: если появился новый блок, запрашивает квитанции всех ожидающих транзакций.
+        Просроченные транзакции завершаются TimeoutError до обращения к RPC, так что они не зависают,
+        пока RPC недоступен.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = list(self._pending.values())
+        for tx in pending:
+            if now > tx.deadline:
+                self._resolve(tx, error=TimeoutError(f"Transaction {tx.tx_hash} was not mined in time"))
+        connection = self._connection_getter()
+        block_number = connection.eth.block_number
+        with self._lock:
+            pending = list(self._pending.values())
+        for tx in pending:
+            if tx.first_block is None:
+                tx.first_block = block_number
+        if self.block_number is not None and block_number <= self.block_number:
+            return
+        previous_block = self.block_number
+        self.block_number = block_number
+        with self._lock:
+            pending = list(self._pending.values())
+        if not pending:
+            return
+
+        # Квитанции блоков покрывают все блоки с прошлого опроса, но новые транзакции могли попасть
+        # в блок раньше этого интервала, поэтому для них один раз запрашиваем квитанцию по хешу
+        receipts = None
+        by_hash = pending
+        if self.use_block_receipts and previous_block is not None and block_number - previous_block <= 2:
+            receipts = self._block_receipts(connection, previous_block + 1, block_number)
+            if receipts is not None:
+                by_hash = [tx for tx in pending if not tx.checked]
+        if receipts is None:
+            receipts = {}
+        if by_hash:
+            receipts.update(self._receipts_by_hash(connection, by_hash))
+            for tx in by_hash:
+                tx.checked = True
+        waiting = []
+        for tx in pending:
+            receipt = receipts.get(tx.tx_hash)
+            if receipt is not None:
+                self._resolve(tx, result=_format_receipt(receipt))
+            elif block_number - tx.first_block >= self.check_after_blocks:
+                waiting.append(tx)
+        if waiting:
+            self._check_missing(connection, waiting)
+
+    def _block_receipts(self, connection: Web3, from_block: int, to_block: int) -> dict | None:
+        """
+        Получает квитанции всех транзакций новых блоков через eth_getBlockReceipts.
+
+        :return: Квитанции по хешу или None, если метод не поддерживается или запрос не удался.
+            Метод отключается насовсем, только если нода ответила, что не поддерживает его
+        """
+        batch = RpcBatch(connection)
+        items = [batch.add("eth_getBlockReceipts", [hex(number)]) for number in range(from_block, to_block + 1)]
+        batch.execute()
+        receipts = {}
+        for item in items:
+            if item.error is not None:
+                if _is_unsupported(item.error):
+                    self.use_block_receipts = False
+                return None
+            for receipt in item.result or []:
+                receipts[receipt['transactionHash'].lower()] = receipt
+        return receipts
+
+    @staticmethod
+    def _receipts_by_hash(connection: Web3, pending: list[_PendingTransaction]) -> dict:
+        batch = RpcBatch(connection)
+        items = [(tx.tx_hash, batch.add("eth_getTransactionReceipt", [tx.tx_hash])) for tx in pending]
+        batch.execute()
+        return {tx_hash: item.result for tx_hash, item in items if item.error is None and item.result}
+
+    def _check_missing(self, connection: Web3, waiting: list[_PendingTransaction]) -> None:
+        """
+        Для давно не подтвержденных транзакций проверяет, знает ли о них нода, и не занят ли их nonce
+        другой транзакцией.
+        """
+        batch = RpcBatch(connection)
+        lookups = [(tx, batch.add("eth_getTransactionByHash", [tx.tx_hash])) for tx in waiting]
+        batch.execute()
+        missing = []
+        for tx, item in lookups:
+            if item.error is None and item.result:
+                tx.missing_since = None
+                tx.sender = item.result['from']
+                tx.nonce = int(item.result['nonce'], 16)
+            else:
+                if tx.missing_since is None:
+                    tx.missing_since = time.monotonic()
+                missing.append(tx)
+        if not missing:
+            return
+        batch = RpcBatch(connection)
+        counts = [(tx, batch.add("eth_getTransactionCount", [Web3.to_checksum_address(tx.sender), 'latest']))
+                  for tx in missing if tx.sender is not None and tx.nonce is not None]
+        batch.execute()
+        replaced = set()
+        for tx, item in counts:
+            if item.error is None and item.result > tx.nonce:
+                replaced.add(tx.tx_hash)
+                self._resolve(tx, error=TransactionReplaced(
+                    f"Nonce {tx.nonce} of {tx.sender} was used by another transaction instead of {tx.tx_hash}"))
+        for tx in missing:
+            if tx.tx_hash not in replaced and time.monotonic() - tx.missing_since >= self.drop_after:
+                self._resolve(tx, error=TransactionDropped(f"Transaction {tx.tx_hash} was dropped from mempool"))
+
+
+def _is_unsupported(error: RpcError) -> bool:
+    message = str(error).lower()
+    return error.code == UNSUPPORTED_METHOD_CODE or any(fragment in message for fragment in UNSUPPORTED_METHOD_ERRORS)
+
+
+def _format_receipt(receipt: dict) -> dict:
+    """
+    Приводит сырую квитанцию JSON-RPC к компактному словарю с числами.
+    """
+    def to_int(value) -> int | None:
+        if value is None:
+            return None
+        return int(value, 16) if isinstance(value, str) else int(value)
+
+    return {
+        'tx_hash': receipt['transactionHash'],
+        'status': to_int(receipt.get('status')),
+        'block_number': to_int(receipt.get('blockNumber')),
+        'gas_used': to_int(receipt.get('gasUsed')),
+        'effective_gas_price': to_int(receipt.get('effectiveGasPrice')),
+    }
@@ -0,0 +1,191 @@
+import json
+from typing import Any, Callable
+
+import requests
+from web3 import Web3
+
+# Методы, ответ которых - число в hex. Результат таких запросов приводится к int
+INT_RESULT_METHODS = {
+    "eth_getBalance", "eth_getTransactionCount", "eth_gasPrice", "eth_blockNumber", "eth_chainId",
+    "eth_estimateGas", "eth_maxPriorityFeePerGas",
+}
+# Ответы, которыми нода отклоняет слишком большой batch. Только после них пачку имеет смысл делить
+BATCH_LIMIT_STATUS_CODES = {413}
+BATCH_LIMIT_ERRORS = ("batch", "too large", "payload", "entity", "body size", "413")
+
+
+class RpcError(Exception):
+    def __init__(self, error: dict | str):
+        self.error = error
+        self.code = error.get('code') if isinstance(error, dict) else None
+        message = error.get('message', error) if isinstance(error, dict) else error
+        super().__init__(message)
+
+
+class BatchItem:
+    def __init__(self, method: str, params: list, formatter: Callable[[Any], Any] | None):
+        """
+        Один запрос внутри JSON-RPC batch. После RpcBatch.execute содержит результат или ошибку.
+        """
+        self.method = method
+        self.params = params
+        self.formatter = formatter
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def value(self) -> Any:
+        """
+        :return: Результат запроса
+        :raises RpcError: Если нода вернула ошибку на этот запрос
+        """
+        if not self.done:
+            raise RuntimeError("Batch was not executed yet")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RpcBatch:
+    def __init__(self, connection: Web3, max_batch_size: int = 100, max_batch_bytes: int = 512_000):
+        """
+        Собирает независимые JSON-RPC запросы и отправляет их массивами (JSON-RPC batch),
+        а не отдельным HTTP POST на каждый запрос. Работает для любых методов, не только eth_call.
+
+        :param connection: Подключение к RPC-серверу
+        :param max_batch_size: Максимум запросов в одном POST (у публичных RPC обычно 50-1000)
+        :param max_batch_bytes: Максимальный размер тела одного POST
+        """
+        self.connection = connection
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.items = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, method: str, params: list, formatter: Callable[[Any], Any] | None = None) -> BatchItem:
+        """
+        Добавляет запрос в batch.
+
+        :param method: JSON-RPC метод
+        :param params: Параметры метода
+        :param formatter: Функция обработки результата. Для числовых методов по умолчанию int
+        :return: Элемент, в который после execute попадет результат
+        """
+        if formatter is None and method in INT_RESULT_METHODS:
+            formatter = _to_int
+        item = BatchItem(method, params, formatter)
+        self.items.append(item)
+        return item
+
+    def _chunks(self, items: list[BatchItem]) -> list[list[BatchItem]]:
+        """
+        Делит запросы на пачки по количеству и размеру тела запроса.
+        """
+        chunks = []
+        chunk = []
+        chunk_bytes = 0
+        for item in items:
+            # Оценка размера одного запроса в теле POST: параметры плюс обвязка jsonrpc/id/method
+            item_bytes = len(json.dumps(item.params, default=str)) + len(item.method) + 50
+            if chunk and (len(chunk) >= self.max_batch_size or chunk_bytes + item_bytes > self.max_batch_bytes):
+                chunks.append(chunk)
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(item)
+            chunk_bytes += item_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _send_chunk(self, chunk: list[BatchItem]) -> None:
+        """
+        Отправляет одну пачку. Если нода отклонила пачку целиком из-за лимита размера batch, делит ее пополам.
+        Сетевые и прочие ошибки сразу становятся ошибкой всех запросов пачки: повтор половинами
+        к недоступному RPC только умножил бы ожидание таймаутов.
+        """
+        provider = self.connection.provider
+        try:
+            if not hasattr(provider, "make_batch_request"):
+                responses = [provider.make_request(item.method, item.params) for item in chunk]
+            else:
+                responses = provider.make_batch_request([(item.method, item.params) for item in chunk])
+        except Exception as e:
+            responses = e
+        if not isinstance(responses, list) or len(responses) != len(chunk):
+            # Список не той длины - нода обрезала batch по своему лимиту
+            if len(chunk) > 1 and (isinstance(responses, list) or _is_batch_limit(responses)):
+                middle = len(chunk) // 2
+                self._send_chunk(chunk[:middle])
+                self._send_chunk(chunk[middle:])
+                return
+            error = responses.get('error', responses) if isinstance(responses, dict) else str(responses)
+            responses = [{'error': error}] * len(chunk)
+        for item, response in zip(chunk, responses):
+            item.done = True
+            if 'error' in response:
+                item.error = RpcError(response['error'])
+            else:
+                result = response.get('result')
+                item.result = item.formatter(result) if item.formatter and result is not None else result
+
+    def execute(self) -> list[Any]:
+        """
+        Отправляет все накопленные запросы и раскладывает ответы по элементам.
+
+        :return: Результаты в порядке добавления. На месте запроса с ошибкой - RpcError
+        """
+        pending = [item for item in self.items if not item.done]
+        for chunk in self._chunks(pending):
+            self._send_chunk(chunk)
+        return [item.error if item.error is not None else item.result for item in self.items]
+
+
+def read_accounts(connection: Web3, addresses: list[str], block_identifier: str = 'latest',
+                  max_batch_size: int = 100) -> list[dict]:
+    """
+    Читает nonce и нативный баланс множества адресов и текущий gasPrice несколькими batch-запросами.
+
+    :param connection: Подключение к RPC-серверу
+    :param addresses: Адреса кошельков
+    :param block_identifier: Блок, на котором читаются данные
+    :param max_batch_size: Максимум запросов в одном POST
+    :return: Список словарей {'address', 'nonce', 'balance', 'gas_price'}, None для полей с ошибкой
+    """
+    batch = RpcBatch(connection, max_batch_size=max_batch_size)
+    gas_price = batch.add("eth_gasPrice", [])
+    rows = []
+    for address in addresses:
+        address = Web3.to_checksum_address(address)
+        rows.append((address,
+                     batch.add("eth_getTransactionCount", [address, block_identifier]),
+                     batch.add("eth_getBalance", [address, block_identifier])))
+    batch.execute()
+    return [
+        {
+            'address': address,
+            'nonce': nonce.result,
+            'balance': balance.result,
+            'gas_price': gas_price.result,
+        }
+        for address, nonce, balance in rows
+    ]
+
+
+def _is_batch_limit(error: Exception | dict | Any) -> bool:
+    """
+    Проверяет, что нода отклонила batch из-за его размера, а не из-за сети или самих запросов.
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        if error.response.status_code in BATCH_LIMIT_STATUS_CODES:
+            return True
+    if isinstance(error, dict):
+        error = error.get('error', error)
+        error = error.get('message', error) if isinstance(error, dict) else error
+    message = str(error).lower()
+    return any(fragment in message for fragment in BATCH_LIMIT_ERRORS)
+
+
+def _to_int(value: Any) -> int:
+    return int(value, 16) if isinstance(value, str) else int(value)
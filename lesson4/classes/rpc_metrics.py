@@ -0,0 +1,411 @@
+import bisect
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+import requests
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+
+# Границы корзин гистограммы задержки в секундах, как у стандартных гистограмм Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Классы, чьи методы показываются в логе медленных вызовов как источник запроса
+CALLER_CLASSES = ("Client", "AsyncClient")
+
+# Вызов провайдера, который сейчас выполняется в этом потоке: сюда HTTP-хук дописывает размеры запроса и ответа
+# и сервер, на который ушел запрос
+_current = threading.local()
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.buckets):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Оценивает квантиль по верхней границе корзины.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = {}  # класс ошибки -> количество
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency = _Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': dict(self.errors),
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'latency_sum': self.latency.sum,
+            'latency_p50': self.latency.quantile(0.5),
+            'latency_p95': self.latency.quantile(0.95),
+            'latency_p99': self.latency.quantile(0.99),
+        }
+
+
+class RpcMetrics:
+    def __init__(self, slow_call_threshold: float | None = None):
+        """
+        Счетчики JSON-RPC вызовов: количество, байты, классы ошибок и гистограммы задержки
+        по методам и по RPC-серверам. Методы считаются на уровне провайдера web3 (instrument),
+        серверы - на уровне HTTP-сессии (instrument_session), поэтому учитываются и запросы,
+        которые идут мимо Web3, например через RpcRouter и Broadcaster.
+
+        :param slow_call_threshold: Порог в секундах, после которого вызов печатается в лог медленных вызовов
+        """
+        self.slow_call_threshold = slow_call_threshold
+        self._methods = {}
+        self._endpoints = {}
+        self._calls = {}  # (метод, сервер) -> статистика
+        self._lock = threading.Lock()
+
+    def instrument(self, provider: JSONBaseProvider) -> "InstrumentedProvider":
+        """
+        Оборачивает провайдер, чтобы каждый make_request и make_batch_request попадал в метрики.
+
+        :param provider: Провайдер web3
+        :return: Провайдер для Web3(...)
+        """
+        if isinstance(provider, InstrumentedProvider):
+            return provider
+        return InstrumentedProvider(provider, self)
+
+    def instrument_async(self, provider: AsyncJSONBaseProvider) -> "AsyncInstrumentedProvider":
+        """
+        Асинхронная версия instrument для AsyncWeb3. Размер запросов не учитывается.
+
+        :param provider: Асинхронный провайдер web3
+        :return: Провайдер для AsyncWeb3(...)
+        """
+        if isinstance(provider, AsyncInstrumentedProvider):
+            return provider
+        return AsyncInstrumentedProvider(provider, self)
+
+    def instrument_session(self, session: requests.Session) -> requests.Session:
+        """
+        Добавляет в HTTP-сессию хук, который считает запросы, байты и задержку по каждому RPC-серверу.
+
+        :param session: HTTP-сессия
+        :return: Та же сессия
+        """
+        if self._on_response not in session.hooks['response']:
+            session.hooks['response'].append(self._on_response)
+        return session
+
+    def _on_response(self, response: requests.Response, *args, **kwargs) -> None:
+        body = response.request.body
+        request_bytes = len(body) if body else 0
+        response_bytes = len(response.content)
+        endpoint = redact_endpoint(response.url)
+        call = getattr(_current, 'call', None)
+        if call is not None:
+            call[0] += request_bytes
+            call[1] += response_bytes
+            call[2] = endpoint
+        error = None if response.ok else f"HTTP {response.status_code}"
+        self._observe(self._endpoints, endpoint, response.elapsed.total_seconds(), error, request_bytes,
+                      response_bytes)
+
+    def _observe(self, table: dict, key: str, latency: float, error: str | None, request_bytes: int,
+                 response_bytes: int) -> None:
+        with self._lock:
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = _CallStats()
+            stats.calls += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.latency.observe(latency)
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def observe_call(self, method: str, endpoint: str, latency: float, error: str | None = None,
+                     request_bytes: int = 0, response_bytes: int = 0) -> None:
+        """
+        Записывает один вызов метода.
+
+        :param method: JSON-RPC метод или "batch"
+        :param endpoint: RPC-сервер или провайдер, через который шел вызов
+        :param latency: Время вызова в секундах
+        :param error: Класс ошибки или None
+        :param request_bytes: Размер тела запроса
+        :param response_bytes: Размер тела ответа
+        """
+        self._observe(self._methods, method, latency, error, request_bytes, response_bytes)
+        self._observe(self._calls, (method, endpoint), latency, error, request_bytes, response_bytes)
+        if self.slow_call_threshold is not None and latency >= self.slow_call_threshold:
+            print(f"Slow RPC call {method} via {endpoint}: {latency * 1000:.0f} ms from {_caller()}")
+
+    def snapshot(self) -> dict:
+        """
+        :return: {'methods': {метод: статистика}, 'endpoints': {сервер: статистика},
+            'calls': {метод: {сервер: статистика}}}. Сервер - схема, хост и порт без пути и параметров
+        """
+        with self._lock:
+            calls = {}
+            for (method, endpoint), stats in self._calls.items():
+                calls.setdefault(method, {})[endpoint] = stats.snapshot()
+            return {
+                'methods': {method: stats.snapshot() for method, stats in self._methods.items()},
+                'endpoints': {url: stats.snapshot() for url, stats in self._endpoints.items()},
+                'calls': calls,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._methods = {}
+            self._endpoints = {}
+            self._calls = {}
+
+    def prometheus(self) -> str:
+        """
+        :return: Метрики в текстовом формате Prometheus
+        """
+        lines = []
+        with self._lock:
+            tables = (
+                ('method', self._methods, lambda key: f'method="{_escape(key)}"'),
+                ('endpoint', self._endpoints, lambda key: f'endpoint="{_escape(key)}"'),
+                ('call', self._calls, lambda key: f'method="{_escape(key[0])}",endpoint="{_escape(key[1])}"'),
+            )
+            for label, table, labels in tables:
+                name = f"web3_rpc_{label}"
+                lines.append(f"# TYPE {name}_calls_total counter")
+                lines.extend(f'{name}_calls_total{{{labels(key)}}} {stats.calls}' for key, stats in table.items())
+                lines.append(f"# TYPE {name}_errors_total counter")
+                lines.extend(f'{name}_errors_total{{{labels(key)},error="{_escape(error)}"}} {count}'
+                             for key, stats in table.items() for error, count in stats.errors.items())
+                lines.append(f"# TYPE {name}_request_bytes_total counter")
+                lines.extend(f'{name}_request_bytes_total{{{labels(key)}}} {stats.request_bytes}'
+                             for key, stats in table.items())
+                lines.append(f"# TYPE {name}_response_bytes_total counter")
+                lines.extend(f'{name}_response_bytes_total{{{labels(key)}}} {stats.response_bytes}'
+                             for key, stats in table.items())
+                lines.append(f"# TYPE {name}_latency_seconds histogram")
+                for key, stats in table.items():
+                    lines.extend(f'{name}_latency_seconds_bucket{{{labels(key)},le="{bound}"}} {count}'
+                                 for bound, count in stats.latency.cumulative())
+                    lines.append(f'{name}_latency_seconds_sum{{{labels(key)}}} {stats.latency.sum}')
+                    lines.append(f'{name}_latency_seconds_count{{{labels(key)}}} {stats.latency.count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Запускает в фоне HTTP-сервер, который отдает метрики Prometheus на любой GET.
+
+        :param port: Порт сервера
+        :param host: Адрес сервера
+        :return: Сервер, остановить можно через shutdown()
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                data = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="rpc-metrics", daemon=True).start()
+        return server
+
+
+class InstrumentedProvider(JSONBaseProvider):
+    def __init__(self, provider: JSONBaseProvider, metrics: RpcMetrics, **kwargs: Any):
+        """
+        Провайдер-обертка: передает запросы во вложенный провайдер и записывает их в RpcMetrics.
+
+        :param provider: Вложенный провайдер
+        :param metrics: Куда записывать вызовы
+        """
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.metrics = metrics
+        self.endpoint = redact_endpoint(getattr(provider, 'endpoint_uri', None) or type(provider).__name__)
+
+    def __str__(self) -> str:
+        return f"Instrumented {self.provider}"
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def _call(self, method: str, function, *args):
+        _current.call = call = [0, 0, None]
+        started = time.perf_counter()
+        error = None
+        try:
+            response = function(*args)
+            if isinstance(response, dict) and 'error' in response:
+                error = _rpc_error_class(response['error'])
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current.call = None
+            self.metrics.observe_call(method, call[2] or self.endpoint, time.perf_counter() - started, error,
+                                      call[0], call[1])
+
+    def make_request(self, method, params) -> dict:
+        return self._call(method, self.provider.make_request, method, params)
+
+    def make_batch_request(self, batch_requests) -> list[dict] | dict:
+        return self._call("batch", self.provider.make_batch_request, batch_requests)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return self.provider.is_connected(show_traceback)
+
+
+class AsyncInstrumentedProvider(AsyncJSONBaseProvider):
+    def __init__(self, provider: AsyncJSONBaseProvider, metrics: RpcMetrics, **kwargs: Any):
+        """
+        Асинхронная версия InstrumentedProvider.
+        """
+        super().__init__(**kwargs)
+        self.provider = provider
+        self.metrics = metrics
+        self.endpoint = redact_endpoint(getattr(provider, 'endpoint_uri', None) or type(provider).__name__)
+
+    def __str__(self) -> str:
+        return f"Instrumented {self.provider}"
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    async def _call(self, method: str, function, *args):
+        started = time.perf_counter()
+        error = None
+        try:
+            response = await function(*args)
+            if isinstance(response, dict) and 'error' in response:
+                error = _rpc_error_class(response['error'])
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.metrics.observe_call(method, self.endpoint, time.perf_counter() - started, error)
+
+    async def make_request(self, method, params) -> dict:
+        return await self._call(method, self.provider.make_request, method, params)
+
+    async def make_batch_request(self, batch_requests) -> list[dict] | dict:
+        return await self._call("batch", self.provider.make_batch_request, batch_requests)
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return await self.provider.is_connected(show_traceback)
+
+
+def _rpc_error_class(error: dict | str) -> str:
+    if isinstance(error, dict) and error.get('code') is not None:
+        return f"RpcError {error['code']}"
+    return "RpcError"
+
+
+def run_detached(function: Callable, *args: Any) -> tuple[Any, list]:
+    """
+    Выполняет function в текущем потоке как отдельный вызов: размеры запроса и сервер, которые запишет HTTP-хук,
+    собираются в свой список, а не в вызов этого потока. Нужно для запросов, которые выполняются
+    в пуле потоков за другой поток, например дублирующих запросов RpcRouter.
+
+    :return: (результат function, [байты запроса, байты ответа, сервер]) для attribute_call
+    """
+    previous = getattr(_current, 'call', None)
+    _current.call = call = [0, 0, None]
+    try:
+        return function(*args), call
+    finally:
+        _current.call = previous
+
+
+def attribute_call(call: list) -> None:
+    """
+    Дописывает размеры и сервер, собранные run_detached в другом потоке, к вызову провайдера текущего потока.
+    """
+    current = getattr(_current, 'call', None)
+    if current is None:
+        return
+    current[0] += call[0]
+    current[1] += call[1]
+    current[2] = call[2] or current[2]
+
+
+def redact_endpoint(url: Any) -> str:
+    """
+    Оставляет от URL RPC только схему, хост и порт: провайдеры часто передают API-ключ в пути или параметрах,
+    а метрики уходят в логи и Prometheus.
+
+    :param url: URL сервера или имя провайдера
+    :return: Например, https://eth-mainnet.g.alchemy.com
+    """
+    parts = urlsplit(str(url))
+    if not parts.scheme or not parts.hostname:
+        return str(url)
+    port = f":{parts.port}" if parts.port else ""
+    return f"{parts.scheme}://{parts.hostname}{port}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _caller() -> str:
+    """
+    Ищет в стеке метод Client или AsyncClient, из которого пришел вызов.
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if owner is not None and type(owner).__name__ in CALLER_CLASSES:
+            return f"{type(owner).__name__}.{frame.f_code.co_name}"
+        if fallback is None and "lesson4" in frame.f_code.co_filename and "rpc_metrics" not in frame.f_code.co_filename:
+            fallback = frame.f_code.co_name
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+rpc_metrics = RpcMetrics()
@@ -0,0 +1,331 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any
+
+import requests
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+from lesson4.classes.rpc_metrics import attribute_call, run_detached
+
+# Методы только для чтения: их безопасно дублировать на второй RPC при медленном ответе
+HEDGE_METHODS = {
+    "eth_call", "eth_getBalance", "eth_getTransactionCount", "eth_blockNumber", "eth_chainId", "eth_gasPrice",
+    "eth_feeHistory", "eth_estimateGas", "eth_getCode", "eth_getBlockByNumber", "eth_getBlockByHash",
+    "eth_getTransactionByHash", "eth_getTransactionReceipt", "eth_getLogs", "eth_maxPriorityFeePerGas",
+    "eth_getBlockReceipts", "eth_getStorageAt",
+}
+
+# Коды и фрагменты ошибок JSON-RPC, которые означают проблему RPC-сервера (лимиты, перегрузка), а не запроса.
+# Код -32005 провайдеры отдают и на лимит частоты, и на "query returned more than 10000 results",
+# поэтому он сам по себе ничего не решает
+ENDPOINT_ERROR_CODES = {429}
+ENDPOINT_ERROR_MESSAGES = ("rate limit", "rate-limit", "too many requests", "throttl", "capacity", "exceeded",
+                           "unavailable")
+# Ошибки слишком большого диапазона блоков или ответа: их исправляет вызывающий код (LogFetcher делит диапазон),
+# а другой сервер ответит так же
+REQUEST_SIZE_ERRORS = ("more than", "query returned", "too many results", "block range", "range is too large",
+                       "range too large", "response size", "result size", "timeout", "timed out")
+
+
+class EndpointError(Exception):
+    pass
+
+
+class _EndpointStats:
+    def __init__(self, window: int):
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=window)
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+
+class RpcRouter:
+    def __init__(self, endpoints: list[str], session: requests.Session | None = None, request_timeout: float = 30,
+                 hedge: bool = False, cooldown: float = 30, ewma_alpha: float = 0.2, probe_interval: float = 60,
+                 hedge_min_delay: float = 0.05, window: int = 200):
+        """
+        Маршрутизатор запросов между RPC-серверами сети. Держит для каждого сервера EWMA задержки
+        и доли ошибок, отправляет запросы на лучший сервер, упавшие серверы выводит из ротации
+        на время cooldown. При hedge=True медленное чтение дублируется на второй сервер после
+        задержки, равной p95 задержки первого.
+
+        :param endpoints: URL RPC-серверов, первый считается основным
+        :param session: HTTP-сессия с пулом соединений
+        :param request_timeout: Таймаут одного HTTP-запроса
+        :param hedge: Дублировать ли медленные запросы на чтение
+        :param cooldown: Сколько секунд упавший сервер не получает запросы
+        :param ewma_alpha: Вес нового замера в EWMA
+        :param probe_interval: Как часто в фоне замерять все серверы
+        :param hedge_min_delay: Минимальная задержка перед дублированием запроса
+        :param window: Сколько последних замеров задержки хранить для расчета p95
+        """
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.hedge = hedge
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.probe_interval = probe_interval
+        self.hedge_min_delay = hedge_min_delay
+        self._providers = {
+            url: Web3.HTTPProvider(url, session=session, request_kwargs={'timeout': request_timeout},
+                                   exception_retry_configuration=None)
+            for url in self.endpoints
+        }
+        self._stats = {url: _EndpointStats(window) for url in self.endpoints}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.endpoints) * 4))
+        self._last_probe = 0.0
+        self._closed = False
+
+    def _score(self, url: str) -> float:
+        stats = self._stats[url]
+        latency = stats.latency_ewma if stats.latency_ewma is not None else float("inf")
+        return latency * (1 + 10 * stats.error_ewma)
+
+    def ranked(self) -> list[str]:
+        """
+        Возвращает серверы от лучшего к худшему. Серверы на cooldown идут в конце.
+        Если давно не было замеров, в фоне запускает probe.
+
+        :return: Список URL
+        """
+        now = time.monotonic()
+        if now - self._last_probe > self.probe_interval and not self._closed:
+            self._last_probe = now
+            self._executor.submit(self.probe)
+        with self._lock:
+            available = [url for url in self.endpoints if self._stats[url].cooldown_until <= now]
+            cooling = [url for url in self.endpoints if self._stats[url].cooldown_until > now]
+            available.sort(key=self._score)
+            cooling.sort(key=lambda url: self._stats[url].cooldown_until)
+        return available + cooling
+
+    def best(self) -> str:
+        """
+        :return: URL лучшего доступного сервера
+        """
+        return self.ranked()[0]
+
+    def record(self, url: str, latency: float | None) -> None:
+        """
+        Учитывает результат запроса к серверу.
+
+        :param url: URL сервера
+        :param latency: Время ответа в секундах, None если запрос завершился ошибкой
+        """
+        with self._lock:
+            stats = self._stats[url]
+            stats.requests += 1
+            if latency is None:
+                stats.errors += 1
+                stats.error_ewma = stats.error_ewma * (1 - self.ewma_alpha) + self.ewma_alpha
+                stats.cooldown_until = time.monotonic() + self.cooldown
+                return
+            stats.error_ewma *= 1 - self.ewma_alpha
+            stats.latencies.append(latency)
+            if stats.latency_ewma is None:
+                stats.latency_ewma = latency
+            else:
+                stats.latency_ewma = stats.latency_ewma * (1 - self.ewma_alpha) + latency * self.ewma_alpha
+
+    def p95(self, url: str) -> float | None:
+        """
+        :param url: URL сервера
+        :return: 95-й перцентиль задержки сервера или None, если замеров мало
+        """
+        with self._lock:
+            latencies = sorted(self._stats[url].latencies)
+        if len(latencies) < 5:
+            return None
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def _call(self, url: str, method: str, params: Any) -> dict:
+        """
+        Выполняет запрос к одному серверу и записывает его задержку.
+
+        :raises EndpointError: Если сервер не ответил или ответил ошибкой самого сервера
+        """
+        started = time.monotonic()
+        try:
+            response = self._providers[url].make_request(method, params)
+        except Exception as e:
+            self.record(url, None)
+            raise EndpointError(f"{url}: {e}") from e
+        error = response.get('error') if isinstance(response, dict) else None
+        if error and is_endpoint_error(error):
+            self.record(url, None)
+            raise EndpointError(f"{url}: {error}")
+        self.record(url, time.monotonic() - started)
+        return response
+
+    def _call_batch(self, url: str, requests_batch: list[tuple[str, Any]]) -> list[dict] | dict:
+        started = time.monotonic()
+        try:
+            response = self._providers[url].make_batch_request(requests_batch)
+        except Exception as e:
+            self.record(url, None)
+            raise EndpointError(f"{url}: {e}") from e
+        if isinstance(response, dict) and response.get('error') and is_endpoint_error(response['error']):
+            self.record(url, None)
+            raise EndpointError(f"{url}: {response['error']}")
+        self.record(url, time.monotonic() - started)
+        return response
+
+    def _hedged(self, order: list[str], method: str, params: Any) -> dict:
+        """
+        Отправляет запрос на лучший сервер, а если он не ответил за p95 - еще и на второй.
+        Возвращает первый успешный ответ.
+        """
+        delay = max(self.hedge_min_delay, self.p95(order[0]))
+        futures = {self._executor.submit(run_detached, self._call, order[0], method, params): order[0]}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            futures[self._executor.submit(run_detached, self._call, order[1], method, params)] = order[1]
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response, call = future.result()
+                except EndpointError as e:
+                    last_error = e
+                    continue
+                # Запрос шел в потоке пула: размеры и сервер победившего ответа относим к этому вызову
+                attribute_call(call)
+                return response
+        # Оба сервера упали - пробуем остальные по очереди
+        for url in order[len(futures):]:
+            try:
+                return self._call(url, method, params)
+            except EndpointError as e:
+                last_error = e
+        raise last_error
+
+    def request(self, method: str, params: Any) -> dict:
+        """
+        Выполняет JSON-RPC запрос через лучший сервер, при ошибке переходит к следующему.
+        Дублирование включается, только когда для лучшего сервера накопилось достаточно замеров для p95.
+
+        :param method: JSON-RPC метод
+        :param params: Параметры метода
+        :return: JSON-RPC ответ
+        :raises EndpointError: Если ни один сервер не ответил
+        """
+        order = self.ranked()
+        if (self.hedge and method in HEDGE_METHODS and len(order) > 1 and not self._closed
+                and self.p95(order[0]) is not None):
+            return self._hedged(order, method, params)
+        last_error = None
+        for url in order:
+            try:
+                return self._call(url, method, params)
+            except EndpointError as e:
+                last_error = e
+        raise last_error
+
+    def request_batch(self, requests_batch: list[tuple[str, Any]]) -> list[dict] | dict:
+        """
+        Выполняет JSON-RPC batch через лучший сервер, при ошибке переходит к следующему.
+
+        :param requests_batch: Список пар (метод, параметры)
+        :return: Ответы в порядке запросов
+        :raises EndpointError: Если ни один сервер не ответил
+        """
+        last_error = None
+        for url in self.ranked():
+            try:
+                return self._call_batch(url, requests_batch)
+            except EndpointError as e:
+                last_error = e
+        raise last_error
+
+    def probe(self) -> dict[str, float | None]:
+        """
+        Одновременно замеряет все серверы запросом eth_blockNumber.
+
+        :return: Задержка каждого сервера, None для недоступных
+        """
+        def measure(url: str) -> float | None:
+            started = time.monotonic()
+            try:
+                self._call(url, "eth_blockNumber", [])
+                return time.monotonic() - started
+            except EndpointError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(self.endpoints)) as executor:
+            return dict(zip(self.endpoints, executor.map(measure, self.endpoints)))
+
+    def close(self) -> None:
+        """
+        Останавливает пул потоков для дублирующих запросов и фоновых проверок. Уже начатые запросы
+        завершаются, новые идут без дублирования.
+        """
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        :return: Текущая статистика каждого сервера
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {
+                    'latency_ewma': stats.latency_ewma,
+                    'error_rate': stats.error_ewma,
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'cooling_down': stats.cooldown_until > now,
+                }
+                for url, stats in self._stats.items()
+            }
+
+
+class RoutedHTTPProvider(JSONBaseProvider):
+    def __init__(self, router: RpcRouter, **kwargs: Any):
+        """
+        Провайдер web3, который отправляет каждый запрос через RpcRouter.
+
+        :param router: Маршрутизатор RPC-серверов
+        """
+        super().__init__(**kwargs)
+        self.router = router
+
+    def __str__(self) -> str:
+        return f"Routed RPC connection {self.router.endpoints}"
+
+    def make_request(self, method, params) -> dict:
+        return self.router.request(method, params)
+
+    def make_batch_request(self, batch_requests) -> list[dict] | dict:
+        return self.router.request_batch(batch_requests)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        try:
+            return 'result' in self.router.request("eth_chainId", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+
+def is_endpoint_error(error: dict | str) -> bool:
+    """
+    Отличает ошибку самого RPC-сервера (лимиты, перегрузка) от ошибки запроса (revert, неверные параметры,
+    слишком большой диапазон блоков или ответ).
+    """
+    if isinstance(error, dict):
+        if error.get('code') in ENDPOINT_ERROR_CODES:
+            return True
+        message = str(error.get('message', '')).lower()
+    else:
+        message = str(error).lower()
+    if any(fragment in message for fragment in REQUEST_SIZE_ERRORS):
+        return False
+    return any(fragment in message for fragment in ENDPOINT_ERROR_MESSAGES)
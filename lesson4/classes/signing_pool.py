@@ -0,0 +1,114 @@
+import os
+from collections import deque
+from multiprocessing import Pool
+from typing import Iterable, Iterator
+
+from eth_account import Account
+
+# Ключи живут только в процессах пула: передаются один раз при старте, а не с каждой задачей
+_accounts = {}
+
+
+def _init_worker(private_keys: list[str]) -> None:
+    for private_key in private_keys:
+        account = Account.from_key(private_key)
+        _accounts[account.address.lower()] = account
+
+
+def _sign_chunk(transactions: list[dict]) -> list[tuple]:
+    signed = []
+    for transaction in transactions:
+        sender = transaction['from']
+        try:
+            account = _accounts[sender.lower()]
+            signed_transaction = account.sign_transaction(transaction)
+            signed.append((sender, transaction.get('nonce'), "0x" + signed_transaction.raw_transaction.hex(),
+                           "0x" + signed_transaction.hash.hex(), None))
+        except KeyError:
+            signed.append((sender, transaction.get('nonce'), None, None, f"No private key for {sender}"))
+        except Exception as e:
+            signed.append((sender, transaction.get('nonce'), None, None, str(e)))
+    return signed
+
+
+class SignedTransaction:
+    def __init__(self, sender: str, nonce: int | None, raw_transaction: str | None, tx_hash: str | None,
+                 error: str | None):
+        """
+        Результат подписи одной транзакции.
+
+        :param sender: Адрес отправителя
+        :param nonce: nonce транзакции
+        :param raw_transaction: Подписанная транзакция в hex для eth_sendRawTransaction
+        :param tx_hash: Хеш транзакции, известен до отправки
+        :param error: Текст ошибки, если транзакцию не удалось подписать
+        """
+        self.sender = sender
+        self.nonce = nonce
+        self.raw_transaction = raw_transaction
+        self.tx_hash = tx_hash
+        self.error = error
+
+    def __repr__(self) -> str:
+        return (f"SignedTransaction(sender={self.sender}, nonce={self.nonce}, tx_hash={self.tx_hash}, "
+                f"error={self.error})")
+
+
+class SigningPool:
+    def __init__(self, private_keys: list[str], processes: int | None = None, chunk_size: int = 64,
+                 max_chunks_in_flight: int | None = None):
+        """
+        Пул процессов для подписи заранее собранных транзакций. ECDSA и RLP занимают несколько
+        миллисекунд CPU на транзакцию, поэтому тысячи подписей распределяются по ядрам, а отправка
+        идет отдельным этапом (Broadcaster) и не ждет CPU.
+
+        :param private_keys: Приватные ключи кошельков. Транзакция подписывается ключом адреса из поля 'from'
+        :param processes: Количество процессов, по умолчанию по числу ядер
+        :param chunk_size: Сколько транзакций подписывает процесс за одну задачу
+        :param max_chunks_in_flight: Сколько пачек может ждать подписи одновременно, по умолчанию 2 на процесс
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_chunks_in_flight = max_chunks_in_flight or self.processes * 2
+        self.addresses = [Account.from_key(private_key).address for private_key in private_keys]
+        self._pool = Pool(self.processes, initializer=_init_worker, initargs=(list(private_keys),))
+
+    def _chunks(self, transactions: Iterable[dict]) -> Iterator[list[dict]]:
+        chunk = []
+        for transaction in transactions:
+            if 'from' not in transaction:
+                raise ValueError("Transaction has no 'from' field to choose the signing key")
+            chunk.append(transaction)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def sign(self, transactions: Iterable[dict]) -> Iterator[SignedTransaction]:
+        """
+        Подписывает транзакции и отдает результаты по мере готовности, в порядке входа.
+        Входной поток читается постепенно, поэтому транзакции можно генерировать на лету.
+
+        :param transactions: Транзакции с полями 'from' и 'nonce'
+        :return: Генератор подписанных транзакций
+        """
+        in_flight = deque()
+        for chunk in self._chunks(transactions):
+            in_flight.append(self._pool.apply_async(_sign_chunk, (chunk,)))
+            if len(in_flight) >= self.max_chunks_in_flight:
+                for signed in in_flight.popleft().get():
+                    yield SignedTransaction(*signed)
+        while in_flight:
+            for signed in in_flight.popleft().get():
+                yield SignedTransaction(*signed)
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self) -> "SigningPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
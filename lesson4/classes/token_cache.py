@@ -0,0 +1,230 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from eth_abi import decode
+from web3 import AsyncWeb3, Web3
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.erc20_calls import DECIMALS_CALLDATA, NAME_CALLDATA, SYMBOL_CALLDATA, call_async, decode_uint
+from lesson4.classes.multicall import Multicall
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".cache", "web3_lessons", "token_metadata.sqlite")
+DB_PATH_ENV = "WEB3_LESSONS_TOKEN_CACHE"  # Переменная окружения, которая заменяет DEFAULT_DB_PATH
+
+
+class TokenMetadataCache:
+    def __init__(self, db_path: str | None = DEFAULT_DB_PATH, max_memory_items: int = 10_000):
+        """
+        Двухуровневый кеш метаданных токенов (decimals, symbol, name): LRU в памяти и SQLite на диске.
+        Метаданные токенов не меняются, поэтому записи никогда не устаревают.
+        Файл SQLite открывается при первом обращении к кешу, а не при импорте модуля.
+
+        :param db_path: Путь к файлу SQLite. None отключает дисковый уровень. Путь по умолчанию
+            можно заменить переменной окружения WEB3_LESSONS_TOKEN_CACHE
+        :param max_memory_items: Максимальное количество токенов в памяти
+        """
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._loading = {}  # (ID сети, адрес) -> задача асинхронной загрузки, ее ждут все одновременные промахи
+
+    def _database(self) -> sqlite3.Connection | None:
+        """
+        Открывает SQLite при первом вызове. Вызывается под self._lock.
+        """
+        if self._db is None and self.db_path is not None:
+            db_path = os.environ.get(DB_PATH_ENV, self.db_path) if self.db_path == DEFAULT_DB_PATH else self.db_path
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " chain_id INTEGER NOT NULL,"
+                " address TEXT NOT NULL,"
+                " decimals INTEGER NOT NULL,"
+                " symbol TEXT,"
+                " name TEXT,"
+                " PRIMARY KEY (chain_id, address))")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: tuple[int, str], metadata: dict) -> None:
+        """
+        Кладет метаданные в LRU, вытесняя самые старые записи.
+        """
+        self._memory[key] = metadata
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def lookup(self, chain_id: int, token_address: str) -> dict | None:
+        """
+        Ищет метаданные токена в кеше, не обращаясь к RPC.
+
+        :param chain_id: ID сети
+        :param token_address: Адрес токена
+        :return: Словарь с ключами decimals, symbol, name или None
+        """
+        key = (chain_id, token_address.lower())
+        with self._lock:
+            metadata = self._memory.get(key)
+            if metadata is not None:
+                self._memory.move_to_end(key)
+                return metadata
+            db = self._database()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT decimals, symbol, name FROM tokens WHERE chain_id = ? AND address = ?", key).fetchone()
+            if row is None:
+                return None
+            metadata = {'decimals': row[0], 'symbol': row[1], 'name': row[2]}
+            self._remember(key, metadata)
+            return metadata
+
+    def store(self, chain_id: int, token_address: str, metadata: dict) -> None:
+        """
+        Сохраняет метаданные токена в оба уровня кеша.
+
+        :param chain_id: ID сети
+        :param token_address: Адрес токена
+        :param metadata: Словарь с ключами decimals, symbol, name
+        """
+        key = (chain_id, token_address.lower())
+        with self._lock:
+            self._remember(key, metadata)
+            db = self._database()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO tokens (chain_id, address, decimals, symbol, name) VALUES (?, ?, ?, ?, ?)",
+                    (*key, metadata['decimals'], metadata.get('symbol'), metadata.get('name')))
+                db.commit()
+
+    def warm_up(self, chain_id: int, token_addresses: list[str], connection: Web3,
+                multicall: Multicall | None = None) -> int:
+        """
+        Загружает метаданные всех отсутствующих в кеше токенов одной пачкой через Multicall3.
+
+        :param chain_id: ID сети
+        :param token_addresses: Адреса токенов
+        :param connection: Подключение к RPC-серверу этой сети
+        :param multicall: Multicall этой сети, например chain.multicall. Если не передан, создается новый,
+            и он заново проверяет наличие контракта через eth_getCode
+        :return: Количество загруженных токенов
+        """
+        missing = [token for token in dict.fromkeys(token_addresses) if self.lookup(chain_id, token) is None]
+        if not missing:
+            return 0
+        erc20 = abi_registry.contract(connection, "erc20")
+        calls = []
+        for token in missing:
+            calls.append((token, erc20.encode_abi("decimals")))
+            calls.append((token, erc20.encode_abi("symbol")))
+            calls.append((token, erc20.encode_abi("name")))
+        results = (multicall or Multicall(connection)).try_aggregate(calls)
+        loaded = 0
+        for i, token in enumerate(missing):
+            decimals_data, symbol_data, name_data = results[i * 3:i * 3 + 3]
+            if decimals_data is None or len(decimals_data) < 32:
+                print(f"Failed to load decimals for token {token}")
+                continue
+            self.store(chain_id, token, {
+                'decimals': int.from_bytes(decimals_data[:32], 'big'),
+                'symbol': _decode_string(symbol_data),
+                'name': _decode_string(name_data),
+            })
+            loaded += 1
+        return loaded
+
+    def get(self, chain_id: int, token_address: str, connection: Web3, multicall: Multicall | None = None) -> dict:
+        """
+        Получает метаданные токена из кеша, при промахе загружает их из сети.
+
+        :param chain_id: ID сети
+        :param token_address: Адрес токена
+        :param connection: Подключение к RPC-серверу этой сети
+        :param multicall: Multicall этой сети для загрузки при промахе
+        :return: Словарь с ключами decimals, symbol, name
+        :raises ValueError: Если метаданные токена не удалось получить
+        """
+        metadata = self.lookup(chain_id, token_address)
+        if metadata is None:
+            self.warm_up(chain_id, [token_address], connection, multicall)
+            metadata = self.lookup(chain_id, token_address)
+            if metadata is None:
+                raise ValueError(f"Failed to get metadata for token {token_address}")
+        return metadata
+
+    def get_decimals(self, chain_id: int, token_address: str, connection: Web3,
+                     multicall: Multicall | None = None) -> int:
+        """
+        Получает decimals токена из кеша, при промахе загружает их из сети.
+
+        :param chain_id: ID сети
+        :param token_address: Адрес токена
+        :param connection: Подключение к RPC-серверу этой сети
+        :param multicall: Multicall этой сети для загрузки при промахе
+        :return: decimals токена
+        """
+        return self.get(chain_id, token_address, connection, multicall)['decimals']
+
+    async def get_decimals_async(self, chain_id: int, token_address: str, connection: AsyncWeb3) -> int:
+        """
+        Асинхронный вариант get_decimals. При промахе decimals, symbol и name читаются прямыми eth_call
+        без слоя контрактов web3, а одновременные промахи по одному токену ждут одну загрузку.
+
+        :param chain_id: ID сети
+        :param token_address: Адрес токена
+        :param connection: Асинхронное подключение к RPC-серверу этой сети
+        :return: decimals токена
+        """
+        metadata = self.lookup(chain_id, token_address)
+        if metadata is not None:
+            return metadata['decimals']
+        key = (chain_id, token_address.lower())
+        task = self._loading.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._loading[key] = asyncio.ensure_future(self._load_async(chain_id, token_address, connection))
+
+            def forget(done: asyncio.Future) -> None:
+                if self._loading.get(key) is done:
+                    del self._loading[key]
+
+            task.add_done_callback(forget)
+        return (await asyncio.shield(task))['decimals']
+
+    async def _load_async(self, chain_id: int, token_address: str, connection: AsyncWeb3) -> dict:
+        calldata = (DECIMALS_CALLDATA, SYMBOL_CALLDATA, NAME_CALLDATA)
+        decimals, symbol, name = await asyncio.gather(
+            *(call_async(connection, token_address, data) for data in calldata), return_exceptions=True)
+        if isinstance(decimals, Exception):
+            raise decimals
+        metadata = {
+            'decimals': decode_uint(decimals),
+            'symbol': None if isinstance(symbol, Exception) else _decode_string(Web3.to_bytes(hexstr=symbol)),
+            'name': None if isinstance(name, Exception) else _decode_string(Web3.to_bytes(hexstr=name)),
+        }
+        self.store(chain_id, token_address, metadata)
+        return metadata
+
+
+def _decode_string(data: bytes | None) -> str | None:
+    """
+    Декодирует string из ответа symbol()/name(). Старые токены (например MKR) возвращают bytes32.
+
+    :param data: Ответ вызова
+    :return: Строка или None
+    """
+    if not data:
+        return None
+    try:
+        return decode(['string'], data)[0]
+    except Exception:
+        return data[:32].rstrip(b"\x00").decode("utf-8", errors="ignore") or None
+
+
+token_cache = TokenMetadataCache()
@@ -0,0 +1,359 @@
+import os
+import sqlite3
+import threading
+
+from web3 import Web3
+
+from lesson4.abis.registry import abi_registry
+from lesson4.classes.block_scanner import BlockScanner
+from lesson4.classes.log_fetcher import LogFetcher
+from lesson4.classes.multicall import Multicall
+from lesson4.classes.rpc_batch import RpcBatch
+
+DEFAULT_DB_DIR = os.path.join(os.path.expanduser("~"), ".cache", "web3_lessons")
+DB_DIR_ENV = "WEB3_LESSONS_TX_INDEX_DIR"  # Переменная окружения, которая заменяет DEFAULT_DB_DIR
+
+TRANSFER_TOPIC = abi_registry.topic("erc20", "Transfer")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS addresses (
+    address TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    hash TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    transaction_index INTEGER NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT,
+    value TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    input_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_from ON transactions (from_address, block_number);
+CREATE INDEX IF NOT EXISTS transactions_to ON transactions (to_address, block_number);
+CREATE TABLE IF NOT EXISTS transfers (
+    transaction_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    token TEXT NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (transaction_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS transfers_from ON transfers (from_address, block_number);
+CREATE INDEX IF NOT EXISTS transfers_to ON transfers (to_address, block_number);
+CREATE INDEX IF NOT EXISTS transfers_block ON transfers (block_number);
+CREATE TABLE IF NOT EXISTS balances (
+    address TEXT NOT NULL,
+    token TEXT NOT NULL,
+    balance TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (address, token)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Нативная монета хранится в balances под этим "адресом токена"
+NATIVE = "native"
+
+
+class TransactionIndex:
+    def __init__(self, connection: Web3, addresses: list[str] | None = None, db_path: str | None = None,
+                 start_block: int | None = None, reorg_window: int = 12, chunk_blocks: int = 500,
+                 index_transactions: bool = True, addresses_per_query: int = 500):
+        """
+        Локальный индекс транзакций и ERC20 Transfer для отслеживаемых адресов в SQLite.
+        sync() догоняет сеть с последнего проиндексированного блока, а запросы к индексу
+        (транзакции адреса за диапазон блоков, последний известный баланс) не обращаются к RPC.
+
+        :param connection: Подключение к RPC-серверу
+        :param addresses: Отслеживаемые адреса. Добавляются к уже сохраненным в базе
+        :param db_path: Путь к файлу SQLite, по умолчанию отдельный файл на каждый chain_id в DEFAULT_DB_DIR
+            или в папке из переменной окружения WEB3_LESSONS_TX_INDEX_DIR
+        :param start_block: С какого блока начинать индексацию в пустой базе, по умолчанию с текущего
+        :param reorg_window: Сколько последних блоков сверяется с сетью перед каждой синхронизацией
+        :param chunk_blocks: Сколько блоков загружается и записывается за один шаг
+        :param index_transactions: Индексировать ли нативные транзакции. Требует загрузки блоков целиком,
+            без этого индексируются только Transfer логи
+        :param addresses_per_query: Сколько адресов передавать в одном фильтре eth_getLogs
+        """
+        self.connection = connection
+        self.reorg_window = reorg_window
+        self.chunk_blocks = chunk_blocks
+        self.index_transactions = index_transactions
+        self.addresses_per_query = addresses_per_query
+        self.scanner = BlockScanner(connection, full_transactions=index_transactions)
+        self.log_fetcher = LogFetcher(connection, chunk_blocks=chunk_blocks, max_chunk_blocks=chunk_blocks)
+        if db_path is None:
+            db_dir = os.environ.get(DB_DIR_ENV, DEFAULT_DB_DIR)
+            db_path = os.path.join(db_dir, f"tx_index_{connection.eth.chain_id}.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        if start_block is not None and self.last_block is None:
+            self._set_last_block(start_block - 1)
+        self.add_addresses(addresses or [])
+
+    @property
+    def addresses(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT address FROM addresses")]
+
+    @property
+    def last_block(self) -> int | None:
+        """
+        :return: Последний проиндексированный блок или None для пустой базы
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'last_block'").fetchone()
+        return row[0] if row is not None else None
+
+    def _set_last_block(self, number: int) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)", (number,))
+            self._db.commit()
+
+    def add_addresses(self, addresses: list[str]) -> None:
+        """
+        Добавляет адреса в отслеживаемые. История новых адресов индексируется с текущего блока индекса.
+
+        :param addresses: Адреса кошельков
+        """
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO addresses (address) VALUES (?)",
+                                 [(address.lower(),) for address in addresses])
+            self._db.commit()
+
+    def _find_reorg(self) -> int | None:
+        """
+        Сверяет хеши последних reorg_window блоков с сетью.
+
+        :return: Первый блок, хеш которого не совпал, или None
+        """
+        with self._lock:
+            stored = self._db.execute("SELECT number, hash FROM blocks ORDER BY number DESC LIMIT ?",
+                                      (self.reorg_window,)).fetchall()
+        if not stored:
+            return None
+        batch = RpcBatch(self.connection)
+        items = [(number, block_hash, batch.add("eth_getBlockByNumber", [hex(number), False]))
+                 for number, block_hash in stored]
+        batch.execute()
+        forked = None
+        for number, block_hash, item in items:
+            if item.error is not None:
+                raise item.error
+            if item.result is None or item.result['hash'] != block_hash:
+                forked = number
+        return forked
+
+    def rewind(self, block_number: int) -> None:
+        """
+        Удаляет из индекса все данные начиная с block_number.
+
+        :param block_number: Первый удаляемый блок
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM blocks WHERE number >= ?", (block_number,))
+            self._db.execute("DELETE FROM transactions WHERE block_number >= ?", (block_number,))
+            self._db.execute("DELETE FROM transfers WHERE block_number >= ?", (block_number,))
+            self._db.execute("DELETE FROM balances WHERE block_number >= ?", (block_number,))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)",
+                             (block_number - 1,))
+            self._db.commit()
+
+    def _get_transfer_logs(self, from_block: int, to_block: int, tracked: list[str]) -> list[dict]:
+        """
+        Загружает Transfer логи, где отслеживаемый адрес отправитель или получатель. Адреса передаются
+        в фильтр пачками по addresses_per_query, а диапазон блоков делится LogFetcher, если провайдер
+        отвечает, что логов слишком много.
+        """
+        logs = {}
+        for start in range(0, len(tracked), self.addresses_per_query):
+            topics = ["0x" + address[2:].rjust(64, "0") for address in tracked[start:start + self.addresses_per_query]]
+            for log_filter in ({'topics': [TRANSFER_TOPIC, topics]}, {'topics': [TRANSFER_TOPIC, None, topics]}):
+                for log in self.log_fetcher.fetch_range(from_block, to_block, log_filter):
+                    # ERC721 Transfer имеет 4 топика, его пропускаем
+                    if len(log['topics']) == 3:
+                        logs[(log['transactionHash'], int(log['logIndex'], 16))] = log
+        return list(logs.values())
+
+    def _ingest(self, from_block: int, to_block: int, tracked: set[str]) -> None:
+        """
+        Загружает блоки from_block..to_block и записывает относящиеся к отслеживаемым адресам данные
+        одной транзакцией SQLite.
+        """
+        blocks = []
+        transactions = []
+        for block in self.scanner.iter_blocks(from_block, to_block):
+            number = int(block['number'], 16)
+            blocks.append((number, block['hash'], int(block['timestamp'], 16)))
+            if not self.index_transactions:
+                continue
+            for tx in block['transactions']:
+                sender = tx['from'].lower()
+                receiver = tx['to'].lower() if tx.get('to') else None
+                if sender in tracked or receiver in tracked:
+                    transactions.append((tx['hash'], number, int(tx['transactionIndex'], 16), sender, receiver,
+                                         str(int(tx['value'], 16)), int(tx['nonce'], 16),
+                                         (len(tx.get('input', '0x')) - 2) // 2))
+        transfers = []
+        for log in self._get_transfer_logs(from_block, to_block, sorted(tracked)):
+            value = int(log['data'], 16) if log['data'] != "0x" else 0
+            transfers.append((log['transactionHash'], int(log['logIndex'], 16), int(log['blockNumber'], 16),
+                              log['address'].lower(), "0x" + log['topics'][1][-40:].lower(),
+                              "0x" + log['topics'][2][-40:].lower(), str(value)))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO blocks (number, hash, timestamp) VALUES (?, ?, ?)", blocks)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO transactions (hash, block_number, transaction_index, from_address,"
+                " to_address, value, nonce, input_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", transactions)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO transfers (transaction_hash, log_index, block_number, token, from_address,"
+                " to_address, value) VALUES (?, ?, ?, ?, ?, ?, ?)", transfers)
+            # Хеши старых блоков нужны только для проверки реорганизаций
+            self._db.execute("DELETE FROM blocks WHERE number < ?", (to_block - self.reorg_window * 2,))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)", (to_block,))
+            self._db.commit()
+
+    def sync(self, to_block: int | None = None) -> int:
+        """
+        Догоняет сеть: откатывает блоки, измененные реорганизацией, и индексирует новые.
+
+        :param to_block: До какого блока индексировать, по умолчанию до последнего
+        :return: Количество проиндексированных блоков
+        """
+        forked = self._find_reorg()
+        if forked is not None:
+            print(f"Reorg detected at block {forked}, rewinding")
+            self.rewind(forked)
+        if to_block is None:
+            to_block = self.connection.eth.block_number
+        last_block = self.last_block
+        start = last_block + 1 if last_block is not None else to_block
+        tracked = set(self.addresses)
+        if not tracked or start > to_block:
+            return 0
+        for chunk_start in range(start, to_block + 1, self.chunk_blocks):
+            chunk_end = min(chunk_start + self.chunk_blocks - 1, to_block)
+            self._ingest(chunk_start, chunk_end, tracked)
+        print(f"Indexed blocks {start}-{to_block}")
+        return to_block - start + 1
+
+    def refresh_balances(self, tokens: list[str] | None = None) -> None:
+        """
+        Читает текущие балансы отслеживаемых адресов на последнем проиндексированном блоке и сохраняет их.
+
+        :param tokens: ERC20-токены. По умолчанию все токены из проиндексированных Transfer
+        """
+        block_number = self.last_block
+        if block_number is None:
+            return
+        addresses = self.addresses
+        if tokens is None:
+            with self._lock:
+                tokens = [row[0] for row in self._db.execute("SELECT DISTINCT token FROM transfers")]
+
+        batch = RpcBatch(self.connection)
+        native = [(address, batch.add("eth_getBalance", [Web3.to_checksum_address(address), hex(block_number)]))
+                  for address in addresses]
+        batch.execute()
+        rows = [(address, NATIVE, str(item.result), block_number) for address, item in native if item.error is None]
+
+        if tokens:
+            multicall = Multicall(self.connection)
+            calls = [(Web3.to_checksum_address(token), multicall.erc20.encode_abi(
+                "balanceOf", args=[Web3.to_checksum_address(address)])) for address in addresses for token in tokens]
+            results = iter(multicall.try_aggregate(calls, block_number))
+            for address in addresses:
+                for token in tokens:
+                    data = next(results)
+                    if data is not None and len(data) >= 32:
+                        rows.append((address, token.lower(), str(int.from_bytes(data[:32], 'big')), block_number))
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO balances (address, token, balance, block_number) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def get_transactions(self, address: str, from_block: int = 0, to_block: int | None = None) -> list[dict]:
+        """
+        Нативные транзакции адреса из индекса.
+
+        :param address: Адрес кошелька
+        :param from_block: Первый блок диапазона
+        :param to_block: Последний блок диапазона (включительно), по умолчанию без ограничения
+        :return: Список словарей {'hash', 'block_number', 'transaction_index', 'from', 'to', 'value', 'nonce'}
+        """
+        address = address.lower()
+        to_block = to_block if to_block is not None else 2 ** 63 - 1
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT hash, block_number, transaction_index, from_address, to_address, value, nonce FROM transactions"
+                " WHERE from_address = ? AND block_number BETWEEN ? AND ?"
+                " UNION SELECT hash, block_number, transaction_index, from_address, to_address, value, nonce"
+                " FROM transactions WHERE to_address = ? AND block_number BETWEEN ? AND ?"
+                " ORDER BY block_number, transaction_index",
+                (address, from_block, to_block, address, from_block, to_block)).fetchall()
+        return [
+            {'hash': row[0], 'block_number': row[1], 'transaction_index': row[2], 'from': row[3], 'to': row[4],
+             'value': int(row[5]), 'nonce': row[6]}
+            for row in rows
+        ]
+
+    def get_transfers(self, address: str, from_block: int = 0, to_block: int | None = None,
+                      token: str | None = None) -> list[dict]:
+        """
+        ERC20 Transfer адреса из индекса.
+
+        :param address: Адрес кошелька
+        :param from_block: Первый блок диапазона
+        :param to_block: Последний блок диапазона (включительно), по умолчанию без ограничения
+        :param token: Адрес токена, по умолчанию все токены
+        :return: Список словарей {'transaction_hash', 'log_index', 'block_number', 'token', 'from', 'to', 'value'}
+        """
+        address = address.lower()
+        to_block = to_block if to_block is not None else 2 ** 63 - 1
+        query = ("SELECT transaction_hash, log_index, block_number, token, from_address, to_address, value"
+                 " FROM transfers WHERE {column} = ? AND block_number BETWEEN ? AND ?")
+        params = [address, from_block, to_block]
+        if token is not None:
+            query += " AND token = ?"
+            params.append(token.lower())
+        with self._lock:
+            rows = self._db.execute(
+                f"{query.format(column='from_address')} UNION {query.format(column='to_address')}"
+                " ORDER BY block_number, log_index", params * 2).fetchall()
+        return [
+            {'transaction_hash': row[0], 'log_index': row[1], 'block_number': row[2], 'token': row[3],
+             'from': row[4], 'to': row[5], 'value': int(row[6])}
+            for row in rows
+        ]
+
+    def get_balance(self, address: str, token: str | None = None) -> dict | None:
+        """
+        Последний сохраненный refresh_balances баланс адреса.
+
+        :param address: Адрес кошелька
+        :param token: Адрес токена, None означает нативную монету
+        :return: Словарь {'balance' (в wei), 'block_number'} или None если баланс еще не читался
+        """
+        token = token.lower() if token is not None else NATIVE
+        with self._lock:
+            row = self._db.execute("SELECT balance, block_number FROM balances WHERE address = ? AND token = ?",
+                                   (address.lower(), token)).fetchone()
+        if row is None:
+            return None
+        return {'balance': int(row[0]), 'block_number': row[1]}
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,223 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from typing import Any, Callable, Iterable, Iterator
+
+from eth_keys import keys
+from web3 import Web3
+
+from lesson4.classes.async_client import AsyncClient
+from lesson4.classes.chain import Chain
+from lesson4.classes.client import Client
+from lesson4.classes.keystore import KeystoreCache, keystore_paths, load_keystores
+
+KEY_SIZE = 32
+ADDRESS_SIZE = 20
+
+
+def _derive_addresses(private_keys: bytes) -> bytes:
+    return b"".join(keys.PrivateKey(private_keys[i:i + KEY_SIZE]).public_key.to_canonical_address()
+                    for i in range(0, len(private_keys), KEY_SIZE))
+
+
+def _parse_key(private_key: str | bytes) -> bytes:
+    if isinstance(private_key, bytes):
+        key = private_key
+    else:
+        key = bytes.fromhex(private_key.strip().removeprefix("0x"))
+    if len(key) != KEY_SIZE:
+        raise ValueError("Private key must be 32 bytes")
+    return key
+
+
+class WalletFleet:
+    __slots__ = ('chain', '_keys', '_addresses', '_index')
+
+    def __init__(self, chain: Chain, private_keys: bytes, addresses: bytes):
+        """
+        Компактное хранилище большого количества кошельков: ключи и адреса лежат в двух bytearray
+        (52 байта на кошелек), а Client создается только на время работы с кошельком и сразу
+        отпускается. Для 100k кошельков это единицы мегабайт и ни одного запроса к RPC при загрузке.
+        Обычно создается через from_keys, from_keys_file, from_wallets_file или from_keystores.
+
+        :param chain: Сеть, к которой подключаются клиенты
+        :param private_keys: Ключи подряд, по 32 байта
+        :param addresses: Адреса в том же порядке, по 20 байт
+        """
+        if len(private_keys) % KEY_SIZE or len(private_keys) // KEY_SIZE != len(addresses) // ADDRESS_SIZE:
+            raise ValueError("Keys and addresses do not match")
+        self.chain = chain
+        self._keys = bytearray(private_keys)
+        self._addresses = bytearray(addresses)
+        self._index = None  # адрес -> номер кошелька, строится при первом поиске по адресу
+
+    @classmethod
+    def from_keys(cls, chain: Chain, private_keys: Iterable[str | bytes], processes: int | None = None,
+                  chunk_size: int = 1000) -> "WalletFleet":
+        """
+        Загружает кошельки из приватных ключей. Адреса вычисляются в пуле процессов.
+
+        :param chain: Сеть кошельков
+        :param private_keys: Ключи в hex или байтах
+        :param processes: Количество процессов, по умолчанию по числу ядер
+        :param chunk_size: Сколько адресов вычисляет процесс за одну задачу
+        :return: Флот кошельков
+        """
+        private_keys = bytearray().join(_parse_key(private_key) for private_key in private_keys)
+        step = chunk_size * KEY_SIZE
+        chunks = [bytes(private_keys[i:i + step]) for i in range(0, len(private_keys), step)]
+        if len(chunks) <= 1:
+            addresses = b"".join(map(_derive_addresses, chunks))
+        else:
+            with Pool(min(processes or os.cpu_count() or 1, len(chunks))) as pool:
+                addresses = b"".join(pool.imap(_derive_addresses, chunks))
+        return cls(chain, private_keys, addresses)
+
+    @classmethod
+    def from_keys_file(cls, chain: Chain, path: str, processes: int | None = None) -> "WalletFleet":
+        """
+        Загружает кошельки из текстового файла: один приватный ключ в hex на строку.
+
+        :param chain: Сеть кошельков
+        :param path: Путь к файлу
+        :param processes: Количество процессов для вычисления адресов
+        :return: Флот кошельков
+        """
+        with open(path) as file:
+            return cls.from_keys(chain, (line for line in file if line.strip()), processes)
+
+    @classmethod
+    def from_wallets_file(cls, chain: Chain, path: str, password: str) -> "WalletFleet":
+        """
+        Загружает кошельки из зашифрованного файла lesson2.wallet_generator. Адреса уже есть в файле,
+        поэтому ничего не вычисляется.
+
+        :param chain: Сеть кошельков
+        :param path: Путь к файлу
+        :param password: Пароль файла
+        :return: Флот кошельков
+        """
+        from lesson2.wallet_generator import read_accounts_file
+
+        private_keys = bytearray()
+        addresses = bytearray()
+        for address, _, private_key in read_accounts_file(path, password):
+            private_keys += _parse_key(private_key)
+            addresses += bytes.fromhex(address.removeprefix("0x"))
+        return cls(chain, private_keys, addresses)
+
+    @classmethod
+    def from_keystores(cls, chain: Chain, path: str, password: str, processes: int | None = None,
+                       cache: KeystoreCache | None = None) -> "WalletFleet":
+        """
+        Загружает кошельки из папки V3 keystore, расшифровывая их в пуле процессов.
+
+        :param chain: Сеть кошельков
+        :param path: Папка с keystore или один файл
+        :param password: Пароль keystore
+        :param processes: Количество процессов, по умолчанию по числу ядер
+        :param cache: Кеш расшифрованных ключей на время сессии, например keystore_cache
+        :return: Флот кошельков
+        """
+        private_keys = bytearray()
+        addresses = bytearray()
+        for address, private_key in load_keystores(keystore_paths(path), password, processes, cache):
+            private_keys += _parse_key(private_key)
+            addresses += bytes.fromhex(address.removeprefix("0x"))
+        return cls(chain, private_keys, addresses)
+
+    def __len__(self) -> int:
+        return len(self._keys) // KEY_SIZE
+
+    def __getitem__(self, index: int) -> Client:
+        return self.client(index)
+
+    def __iter__(self) -> Iterator[Client]:
+        return self.clients()
+
+    def address(self, index: int) -> str:
+        """
+        :return: Адрес кошелька index в checksum-формате
+        """
+        return Web3.to_checksum_address(self._addresses[index * ADDRESS_SIZE:(index + 1) * ADDRESS_SIZE])
+
+    def addresses(self) -> Iterator[str]:
+        return (self.address(index) for index in range(len(self)))
+
+    def private_key(self, index: int) -> str:
+        return "0x" + self._keys[index * KEY_SIZE:(index + 1) * KEY_SIZE].hex()
+
+    def index_of(self, address: str) -> int:
+        """
+        Ищет номер кошелька по адресу. Индекс строится при первом вызове.
+
+        :raises KeyError: Если адреса нет во флоте
+        """
+        if self._index is None:
+            self._index = {bytes(self._addresses[i:i + ADDRESS_SIZE]): i // ADDRESS_SIZE
+                           for i in range(0, len(self._addresses), ADDRESS_SIZE)}
+        return self._index[bytes.fromhex(address.removeprefix("0x").lower())]
+
+    def client(self, index: int) -> Client:
+        """
+        Создает Client для кошелька без запросов к RPC и без вычисления адреса.
+        Клиент не хранится во флоте и освобождается, как только перестает использоваться.
+        """
+        if not 0 <= index < len(self):
+            raise IndexError("Wallet index out of range")
+        return Client(self.private_key(index), self.chain, address=self.address(index))
+
+    def async_client(self, index: int) -> AsyncClient:
+        if not 0 <= index < len(self):
+            raise IndexError("Wallet index out of range")
+        return AsyncClient(self.private_key(index), self.chain, address=self.address(index))
+
+    def clients(self) -> Iterator[Client]:
+        """
+        Отдает клиентов по одному. В памяти одновременно живут только те клиенты, что еще используются.
+        """
+        return (self.client(index) for index in range(len(self)))
+
+    def async_clients(self) -> Iterator[AsyncClient]:
+        """
+        Отдает AsyncClient по одному, например для run_bounded.
+        """
+        return (self.async_client(index) for index in range(len(self)))
+
+    def map(self, function: Callable[[Client], Any], concurrency: int = 32) -> list[Any]:
+        """
+        Вызывает function для каждого кошелька в пуле потоков. Клиент создается внутри потока
+        и отпускается после вызова.
+
+        :param function: Функция, принимающая Client
+        :param concurrency: Сколько кошельков обрабатывается одновременно
+        :return: Результаты в порядке кошельков. Исключение функции попадает в результат вместо значения
+        """
+        results = [None] * len(self)
+        indexes = iter(range(len(self)))
+        lock = threading.Lock()
+
+        def consume() -> None:
+            # Потоки сами забирают следующий кошелек, поэтому не создается Future на каждый кошелек
+            while True:
+                with lock:
+                    index = next(indexes, None)
+                if index is None:
+                    return
+                try:
+                    results[index] = function(self.client(index))
+                except Exception as e:
+                    results[index] = e
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wallet-fleet") as executor:
+            workers = [executor.submit(consume) for _ in range(concurrency)]
+            for worker in workers:
+                worker.result()
+        return results
+
+    def memory_usage(self) -> int:
+        """
+        :return: Примерный объем памяти флота в байтах
+        """
+        return len(self._keys) + len(self._addresses) + (len(self._index) * 120 if self._index else 0)
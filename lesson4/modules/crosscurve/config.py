@@ -1,3 +1,4 @@
+API_URL = "https://api.crosscurve.fi"
 ROUTER = "0xa2a786ff9148f7c88ee93372db8cbe9e94585c74"
 USDT_ARB = "0xfd086bc7cd5c481dcc9c85ebe478a1c0b69fcbb9"
 USDT_OP = "0x94b008aa00579c1307b0ef2c499ad98a8ce58e58"
\ No newline at end of file
@@ -3,12 +3,12 @@ import requests
 from web3 import Web3
 from lesson4.classes.chain import Chain, chains
 from lesson4.classes.client import Client
-from lesson4.modules.crosscurve.config import ROUTER, USDT_ARB, USDT_OP
-from lesson4.abis.abis import CROSSCURVE_ABI
+from lesson4.modules.crosscurve.config import API_URL, ROUTER, USDT_ARB, USDT_OP
+from lesson4.abis.registry import abi_registry
 
 
 def get_route(chain_in: Chain, token_address_in: str, chain_out: Chain, token_address_out: str, amount_in: float,
-              slippage: float) -> dict | None:
+              slippage: float, session: requests.Session | None = None) -> dict | None:
     """
     Получение пути свапа по api
 
@@ -18,13 +18,14 @@ def get_route(chain_in: Chain, token_address_in: str, chain_out: Chain, token_ad
     :param token_address_out: Токен в который будем свапать
     :param amount_in: Количество токенов для свапа
     :param slippage: Проскальзывание в процентах
+    :param session: HTTP-сессия для переиспользования соединений. Если не указана, запрос идет без сессии
     :return: Словарь с путем свапа или None если путь не найден
     """
     try:
         decimals_in = chain_in.get_decimals(token_address_in)
         amount_in_scaled = str(int(amount_in * (10 ** decimals_in)))
 
-        url = "https://api.crosscurve.fi/routing/scan"
+        url = f"{API_URL}/routing/scan"
         params = {
             "params": {
                 "chainIdOut": chain_out.id,
@@ -36,7 +37,7 @@ def get_route(chain_in: Chain, token_address_in: str, chain_out: Chain, token_ad
             "slippage": slippage
         }
 
-        response = requests.post(url, json=params)
+        response = (session or requests).post(url, json=params)
         if response.status_code == 200:
             data = response.json()
             return data[0]
@@ -48,19 +49,20 @@ def get_route(chain_in: Chain, token_address_in: str, chain_out: Chain, token_ad
         return None
 
 
-def get_estimate(route: dict) -> dict | None:
+def get_estimate(route: dict, session: requests.Session | None = None) -> dict | None:
     """
     Получение оценки свапа по полученному пути
 
     :param route: Полученный путь свапа
+    :param session: HTTP-сессия для переиспользования соединений
     :return: Словарь с оценкой свапа или None если оценка не найдена
     """
     try:
-        url = 'https://api.crosscurve.fi/estimate'
+        url = f'{API_URL}/estimate'
         headers = {
             "Content-Type": "application/json",
         }
-        response = requests.post(url, headers=headers, json=route)
+        response = (session or requests).post(url, headers=headers, json=route)
         if response.status_code == 200:
             data = response.json()
             return data
@@ -72,17 +74,19 @@ def get_estimate(route: dict) -> dict | None:
         return None
 
 
-def create_swap_transaction(address: str, route: dict, estimate: dict) -> dict | None:
+def create_swap_transaction(address: str, route: dict, estimate: dict,
+                            session: requests.Session | None = None) -> dict | None:
     """
     Создание транзакции свапа
 
     :param address: Адрес отправителя, получателя
     :param route: Полученный путь свапа
     :param estimate: Оценка свапа
+    :param session: HTTP-сессия для переиспользования соединений
     :return: Словарь с транзакцией свапа или None если транзакция не создана
     """
     try:
-        url = 'https://api.crosscurve.fi/tx/create'
+        url = f'{API_URL}/tx/create'
         headers = {
             "Content-Type": "application/json",
         }
@@ -92,7 +96,7 @@ def create_swap_transaction(address: str, route: dict, estimate: dict) -> dict |
             'routing': route,
             'estimate': estimate,
         }
-        response = requests.post(url, headers=headers, json=tx_create_params)
+        response = (session or requests).post(url, headers=headers, json=tx_create_params)
         if response.status_code == 200:
             data = response.json()
             return data
@@ -113,7 +117,7 @@ def send_swap_transaction(client: Client, raw_tx: dict, estimate: dict) -> str |
     :param estimate: Оценка свапа
     :return: Хеш транзакции или None если транзакция не отправлена
     """
-    router = client.connection.eth.contract(address=Web3.to_checksum_address(raw_tx["to"]), abi=CROSSCURVE_ABI)
+    router = abi_registry.contract(client.connection, "crosscurve", raw_tx["to"])
     args = [
         list(raw_tx['args'][0]),
         list(raw_tx['args'][1]),
@@ -135,24 +139,24 @@ def send_swap_transaction(client: Client, raw_tx: dict, estimate: dict) -> str |
             'data': router.encode_abi("start", args=args),
             'value': value
         }),
-        'gasPrice': client.connection.eth.gas_price,
-        'nonce': client.get_nonce()
+        **client.get_fees(),
     })
     hash = client.send_transaction(transaction)
     return hash
 
 
-client = Client("0xb0e4ad648105cae70ee29ff21c2ffc7e457a12afd8949ad8e188f8e404687905", chains["arbitrum"].rpc)
-route = get_route(chains["arbitrum"], USDT_ARB, chains["optimism"], USDT_OP, 5, 0.1)
-print(route)
-print("--------------")
-estimate = get_estimate(route)
-print(estimate)
-print("--------------")
-transaction = create_swap_transaction(client.public_key, route, estimate)
-print(transaction)
-print("--------------")
-print(client.get_allowance(USDT_ARB, ROUTER))
-time.sleep(10)
-send_hash = send_swap_transaction(client, transaction, estimate)
-print(send_hash)
+if __name__ == "__main__":
+    client = Client("0xb0e4ad648105cae70ee29ff21c2ffc7e457a12afd8949ad8e188f8e404687905", chains["arbitrum"])
+    route = get_route(chains["arbitrum"], USDT_ARB, chains["optimism"], USDT_OP, 5, 0.1)
+    print(route)
+    print("--------------")
+    estimate = get_estimate(route)
+    print(estimate)
+    print("--------------")
+    transaction = create_swap_transaction(client.public_key, route, estimate)
+    print(transaction)
+    print("--------------")
+    print(client.get_allowance(USDT_ARB, ROUTER))
+    time.sleep(10)
+    send_hash = send_swap_transaction(client, transaction, estimate)
+    print(send_hash)
@@ -0,0 +1,167 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lesson4.classes.chain import Chain
+from lesson4.classes.client import Client
+from lesson4.classes.rate_limiter import RateLimiter
+from lesson4.modules.crosscurve.logic import create_swap_transaction, get_estimate, get_route, send_swap_transaction
+from lesson4.modules.crosscurve.quote_cache import QuoteCache
+
+
+class SwapJob:
+    def __init__(self, client: Client, chain_in: Chain, token_in: str, chain_out: Chain, token_out: str,
+                 amount: float, slippage: float = 0.1):
+        """
+        Один свап для конвейера.
+
+        :param client: Кошелек, который делает свап
+        :param chain_in: Чейн из которого будем свапать
+        :param token_in: Токен который будем свапать
+        :param chain_out: Чейн в который будем свапать
+        :param token_out: Токен в который будем свапать
+        :param amount: Количество токенов для свапа
+        :param slippage: Проскальзывание в процентах
+        """
+        self.client = client
+        self.chain_in = chain_in
+        self.token_in = token_in
+        self.chain_out = chain_out
+        self.token_out = token_out
+        self.amount = amount
+        self.slippage = slippage
+
+
+class SwapPipeline:
+    def __init__(self, route_concurrency: int = 16, estimate_concurrency: int = 16, create_concurrency: int = 16,
+                 send_concurrency: int = 8, api_rate: float = 10, api_burst: int | None = None,
+                 quote_cache: QuoteCache | None = None):
+        """
+        Конвейер свапов CrossCurve для множества кошельков. Этапы API (route, estimate, create)
+        выполняются параллельно для разных кошельков через общую keep-alive сессию, с отдельным
+        лимитом параллельности на каждый этап и общим ограничением частоты запросов к api.crosscurve.fi.
+        Готовые транзакции передаются на отдельный этап отправки, который не занимает слоты API.
+
+        :param route_concurrency: Сколько запросов routing/scan выполняется одновременно
+        :param estimate_concurrency: Сколько запросов estimate выполняется одновременно
+        :param create_concurrency: Сколько запросов tx/create выполняется одновременно
+        :param send_concurrency: Сколько транзакций подписываются и отправляются одновременно
+        :param api_rate: Максимум запросов к API в секунду
+        :param api_burst: Сколько запросов к API можно сделать подряд без ожидания
+        :param quote_cache: Кеш путей и оценок. Если указан, одинаковые свапы переиспользуют route и estimate
+        """
+        api_workers = route_concurrency + estimate_concurrency + create_concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=api_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = RateLimiter(api_rate, api_burst)
+        self.quote_cache = quote_cache
+        if quote_cache is not None and quote_cache.limiter is None:
+            quote_cache.limiter = self.limiter
+        self._stages = {
+            'route': threading.BoundedSemaphore(route_concurrency),
+            'estimate': threading.BoundedSemaphore(estimate_concurrency),
+            'create': threading.BoundedSemaphore(create_concurrency),
+        }
+        self._api_executor = ThreadPoolExecutor(max_workers=api_workers, thread_name_prefix="crosscurve-api")
+        self._send_executor = ThreadPoolExecutor(max_workers=send_concurrency, thread_name_prefix="crosscurve-send")
+
+    def _api_call(self, stage: str, function, *args):
+        with self._stages[stage]:
+            self.limiter.acquire()
+            return function(*args, session=self.session)
+
+    def _get_route(self, job: SwapJob) -> dict | None:
+        if self.quote_cache is not None:
+            with self._stages['route']:
+                return self.quote_cache.get_route(job.chain_in, job.token_in, job.chain_out, job.token_out,
+                                                  job.amount, job.slippage, session=self.session)
+        return self._api_call('route', get_route, job.chain_in, job.token_in, job.chain_out, job.token_out,
+                              job.amount, job.slippage)
+
+    def _get_estimate(self, route: dict) -> dict | None:
+        if self.quote_cache is not None:
+            with self._stages['estimate']:
+                return self.quote_cache.get_estimate(route, session=self.session)
+        return self._api_call('estimate', get_estimate, route)
+
+    def _send(self, job: SwapJob, result: dict, transaction: dict, estimate: dict) -> dict:
+        result['stage'] = 'send'
+        try:
+            tx_hash = send_swap_transaction(job.client, transaction, estimate)
+        except Exception as e:
+            result['error'] = str(e)
+            return result
+        if tx_hash is None:
+            result['error'] = "Failed to send swap transaction"
+        else:
+            result['tx_hash'] = tx_hash
+        return result
+
+    def _process(self, job: SwapJob, future: Future) -> None:
+        result = {'wallet': job.client.public_key, 'stage': 'route', 'tx_hash': None, 'error': None}
+        try:
+            route = self._get_route(job)
+            if route is None:
+                result['error'] = "Failed to get route"
+                future.set_result(result)
+                return
+            result['stage'] = 'estimate'
+            estimate = self._get_estimate(route)
+            if estimate is None:
+                result['error'] = "Failed to get estimate"
+                future.set_result(result)
+                return
+            result['stage'] = 'create'
+            transaction = self._api_call('create', create_swap_transaction, job.client.public_key, route, estimate)
+            if transaction is None:
+                result['error'] = "Failed to create swap transaction"
+                future.set_result(result)
+                return
+            send_future = self._send_executor.submit(self._send, job, result, transaction, estimate)
+            send_future.add_done_callback(lambda done: _copy_future(done, future))
+        except Exception as e:
+            result['error'] = str(e)
+            future.set_result(result)
+
+    def submit(self, job: SwapJob) -> Future:
+        """
+        Ставит свап в конвейер.
+
+        :param job: Свап
+        :return: Future со словарем {'wallet', 'stage', 'tx_hash', 'error'}
+        """
+        future = Future()
+        self._api_executor.submit(self._process, job, future)
+        return future
+
+    def run(self, jobs: list[SwapJob]) -> list[dict]:
+        """
+        Прогоняет все свапы через конвейер и ждет их завершения.
+
+        :param jobs: Список свапов
+        :return: Результаты в порядке свапов: {'wallet', 'stage', 'tx_hash', 'error'}
+        """
+        started = time.monotonic()
+        futures = [self.submit(job) for job in jobs]
+        results = [future.result() for future in futures]
+        elapsed = time.monotonic() - started
+        sent = sum(1 for result in results if result['tx_hash'] is not None)
+        print(f"Swaps sent: {sent}/{len(jobs)} in {elapsed:.1f}s")
+        return results
+
+    def close(self) -> None:
+        self._api_executor.shutdown(wait=True)
+        self._send_executor.shutdown(wait=True)
+        self.session.close()
+
+
+def _copy_future(source: Future, target: Future) -> None:
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,132 @@
+import json
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import requests
+
+from lesson4.classes.chain import Chain
+from lesson4.classes.rate_limiter import RateLimiter
+from lesson4.modules.crosscurve.logic import get_estimate, get_route
+
+
+class QuoteCache:
+    def __init__(self, ttl: float = 10, amount_bucket: float = 0, deadline_margin: float = 30,
+                 max_items: int = 1000, limiter: RateLimiter | None = None):
+        """
+        Кеш путей и оценок свапа CrossCurve с коротким временем жизни. Одинаковые одновременные
+        запросы объединяются в один вызов API, остальные ждут его результат.
+
+        :param ttl: Сколько секунд путь и оценка считаются актуальными
+        :param amount_bucket: Шаг округления суммы вниз. 0 - кешировать только одинаковые суммы.
+            Например при 0.5 свапы на 5.1 и 5.4 токена получат один путь на 5.0 токенов
+        :param deadline_margin: За сколько секунд до deadline оценки она перестает выдаваться из кеша
+        :param max_items: Максимальное количество записей в кеше
+        :param limiter: Ограничитель частоты запросов к API. Попадания в кеш его не расходуют
+        """
+        self.ttl = ttl
+        self.amount_bucket = amount_bucket
+        self.deadline_margin = deadline_margin
+        self.max_items = max_items
+        self.limiter = limiter
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> (value, expires_at)
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def bucket_amount(self, amount: float) -> float:
+        """
+        Округляет сумму вниз до шага amount_bucket, чтобы свап никогда не превышал запрошенную сумму.
+
+        :param amount: Сумма свапа
+        :return: Сумма, для которой будет запрошен путь
+        """
+        if self.amount_bucket <= 0:
+            return amount
+        return math.floor(amount / self.amount_bucket) * self.amount_bucket
+
+    def _get_or_load(self, key: Any, loader: Callable[[], Any], expires_at: Callable[[Any], float]) -> Any:
+        """
+        Возвращает значение из кеша или загружает его. Если такое же значение уже загружается
+        в другом потоке, ждет его результат вместо повторного запроса.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                return entry[0]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            if self.limiter is not None:
+                self.limiter.acquire()
+            value = loader()
+        except Exception as e:
+            value = None
+            print(f"Error occurred while loading quote: {e}")
+        with self._lock:
+            if value is not None:
+                self._entries[key] = (value, expires_at(value))
+                if len(self._entries) > self.max_items:
+                    self._evict()
+            del self._in_flight[key]
+        future.set_result(value)
+        return value
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_items:
+            del self._entries[next(iter(self._entries))]
+
+    def get_route(self, chain_in: Chain, token_address_in: str, chain_out: Chain, token_address_out: str,
+                  amount_in: float, slippage: float, session: requests.Session | None = None) -> dict | None:
+        """
+        Кешированный аналог logic.get_route.
+
+        :return: Словарь с путем свапа или None если путь не найден
+        """
+        amount_in = self.bucket_amount(amount_in)
+        key = ('route', chain_in.id, token_address_in.lower(), chain_out.id, token_address_out.lower(),
+               amount_in, slippage)
+        return self._get_or_load(
+            key,
+            lambda: get_route(chain_in, token_address_in, chain_out, token_address_out, amount_in, slippage,
+                              session=session),
+            lambda route: time.time() + self.ttl)
+
+    def get_estimate(self, route: dict, session: requests.Session | None = None) -> dict | None:
+        """
+        Кешированный аналог logic.get_estimate. Оценка выдается из кеша не дольше ttl
+        и не позже чем за deadline_margin секунд до ее deadline.
+
+        :return: Словарь с оценкой свапа или None если оценка не найдена
+        """
+        key = ('estimate', json.dumps(route, sort_keys=True, default=str))
+        return self._get_or_load(key, lambda: get_estimate(route, session=session), self._estimate_expiry)
+
+    def _estimate_expiry(self, estimate: dict) -> float:
+        expires_at = time.time() + self.ttl
+        deadline = estimate.get('deadline')
+        if deadline is not None:
+            deadline = int(deadline)
+            if deadline > 10 ** 12:  # deadline в миллисекундах
+                deadline //= 1000
+            expires_at = min(expires_at, deadline - self.deadline_margin)
+        return expires_at
+
+    def stats(self) -> dict:
+        """
+        :return: Количество попаданий, промахов и записей в кеше
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}